@@ -2,9 +2,7 @@ import gamelib
 import random
 import math
 import warnings
-from copy import deepcopy
 from sys import maxsize
-import json
 import numpy as np
 from collections import OrderedDict
 
@@ -13,10 +11,16 @@ from collections import OrderedDict
 class AlgoStrategy(gamelib.AlgoCore):
     def __init__(self):
         super().__init__()
+        # attack candidates are scored in process, set a number of worker processes here to score them on more cores
+        self.worker_processes = 0
         seed = random.randrange(maxsize)
         random.seed(seed)
         gamelib.debug_write('Random seed: {}'.format(seed))
         self.start_att_locs = [[13, 0], [14, 0]]
+        self.holes = [[7, 7], [20, 7]]
+        self.speculation = None
+        self.last_setups = None
+        self.last_scores = {}
         self.side_walls = [[0, 13], [1, 12], [2, 11], [3, 10], [4, 9], [5, 8], [6, 7], [27, 13], [26, 12], [25, 11], [24, 10], [23, 9], [22, 8], [21, 7]]
 
         self.buff_walls = [[4, 12], [23, 12], [5, 12], [22, 12], [6, 11], [21, 11]]
@@ -72,12 +76,24 @@ class AlgoStrategy(gamelib.AlgoCore):
         MP = 1
         SP = 0
         # This is a good place to do initial setup
+        self.tracker = gamelib.BoardTracker(config)
+        self.subscribe("move", self.on_enemy_move, player_index=1)
+        self.subscribe("breach", self.on_enemy_breach, player_index=1)
+        self.subscribe("death", self.on_death, player_index=0)
+        self.subscribe("spawn", self.on_enemy_spawn, player_index=1)
     
     def on_turn(self, turn_state):
 
-        game_state = gamelib.GameState(self.config, turn_state)
+        game_state = self.tracker.next_state(turn_state)
         gamelib.debug_write('Performing turn {} of your custom algo strategy'.format(game_state.turn_number))
         game_state.suppress_warnings(True)  #Comment or remove this line to enable warnings.
+        # attack scores computed during the last action phase, only valid if we have the MP they assumed.
+        # attack_monte_carlo still checks each one's board, this turn's builds come after the prediction
+        speculation = self.take_speculation(game_state)
+        if speculation and speculation['mp'] == game_state.get_resource(MP):
+            self.speculation = speculation
+        else:
+            self.speculation = None
         
         if game_state.turn_number == 30:
             if self.extra_left[0] in self.upgrade_walls or self.extra_right[0] in self.upgrade_walls:
@@ -123,7 +139,8 @@ class AlgoStrategy(gamelib.AlgoCore):
             game_state.attempt_spawn(WALL, self.side_walls)
             #game_state.attempt_spawn(WALL, self.back_walls)
             for loc in self.turrets:
-                if game_state.contains_stationary_unit(loc) and game_state.contains_stationary_unit(loc).unit_type == TURRET:
+                unit = game_state.contains_stationary_unit(loc)
+                if unit and unit.unit_type == TURRET:
                     game_state.attempt_upgrade(loc)
           #  game_state.attempt_upgrade(self.upgrade_buff)
         else: 
@@ -143,14 +160,9 @@ class AlgoStrategy(gamelib.AlgoCore):
             #self.all_locs.sort(key = lambda p : self.usefulness_quotient(game_state, p), reverse = True)
             self.left_locs.sort(key = lambda p : self.usefulness_quotient(game_state, p), reverse = True)
             self.right_locs.sort(key = lambda p : self.usefulness_quotient(game_state, p), reverse = True)
-            have_left = 0
-            have_right = 0
-            for loc in self.left_locs:
-                if game_state.contains_stationary_unit(loc) and game_state.contains_stationary_unit(loc).unit_type == TURRET:
-                    have_left += 1
-            for loc in self.right_locs:
-                if game_state.contains_stationary_unit(loc) and game_state.contains_stationary_unit(loc).unit_type == TURRET:
-                    have_right += 1
+            turrets = set((unit.x, unit.y) for unit in game_state.structures(0, TURRET))
+            have_left = sum(1 for loc in self.left_locs if tuple(loc) in turrets)
+            have_right = sum(1 for loc in self.right_locs if tuple(loc) in turrets)
             gamelib.debug_write(have_left, have_right, self.allowance)
             top_right = self.gen_av(game_state, self.right_locs, self.allowance//2  - have_right)
             top_left = self.gen_av(game_state, self.left_locs, self.allowance//2  - have_left)
@@ -184,7 +196,8 @@ class AlgoStrategy(gamelib.AlgoCore):
                     num1 = game_state.attempt_spawn(WALL, [loc[0], loc[1]+1])
                     if num1 > 0:
                         game_state.attempt_upgrade([loc[0], loc[1]+1])
-                if not unit and game_state.contains_stationary_unit([loc[0], loc[1]+1]) and game_state.contains_stationary_unit([loc[0], loc[1]+1]).unit_type == WALL:
+                above = game_state.contains_stationary_unit([loc[0], loc[1]+1])
+                if not unit and above and above.unit_type == WALL:
                     game_state.attempt_remove([loc[0], loc[1]+1])
             
             if len(top_right) >= len(top_left):
@@ -193,7 +206,8 @@ class AlgoStrategy(gamelib.AlgoCore):
                 lst = self.intertwine(top_left, top_right)
             for loc in lst:
                 num = game_state.attempt_spawn(TURRET, loc)
-                if game_state.contains_stationary_unit(loc) and game_state.contains_stationary_unit(loc).unit_type == TURRET:
+                unit = game_state.contains_stationary_unit(loc)
+                if unit and unit.unit_type == TURRET:
                     game_state.attempt_upgrade(loc)
                     if [loc[0], loc[1]+1] not in self.off_limits:
                         num1 = game_state.attempt_spawn(WALL, [loc[0], loc[1]+1])
@@ -204,11 +218,11 @@ class AlgoStrategy(gamelib.AlgoCore):
 
 
     def starter_strategy(self, game_state):
-        for x in range(28):
-            for y in range(14):
-                unit = game_state.contains_stationary_unit([x,y])
-                if unit and unit.health < unit.max_health * .70:
-                    game_state.attempt_remove([x,y])
+        arrays = game_state.game_map.arrays
+        damaged = arrays.mask() & (arrays.health < arrays.max_health * .70)
+        damaged[:, 14:] = False
+        for loc in arrays.locations(damaged):
+            game_state.attempt_remove(loc)
         need_walls = 0
         att_walls = 0
         if game_state.turn_number <= 10:
@@ -295,16 +309,20 @@ class AlgoStrategy(gamelib.AlgoCore):
 
         gamelib.debug_write('-------------------------------')
 
-    def setup_state(self, game_state, hole, cover):
-        tmp_game_state = deepcopy(game_state)
+    def setup_state(self, game_state, hole, cover, delta=None, removals=()):
+        tmp_game_state = game_state.fork()
         tmp_game_state.game_map.add_unit(WALL, hole)
-        if game_state.turn_number >= 1:
-            for loc in self.removals[game_state.turn_number - 1]:
-                if not tmp_game_state.contains_stationary_unit(loc):
-                    tmp_game_state.game_map.add_unit(self.last_game_state.contains_stationary_unit(loc).unit_type, loc, player_index = 1)
-                    if self.last_game_state.contains_stationary_unit(loc).upgraded:
-                        tmp_game_state.game_map[loc][0].upgrade()
-                        tmp_game_state.game_map[loc][0].health = tmp_game_state.game_map[loc][0].max_health
+        if delta is not None:
+            # put back the structures the enemy removed last turn, they are likely to be rebuilt
+            for removed in delta['removed'][1]:
+                loc = [removed.x, removed.y]
+                if loc in removals and not tmp_game_state.contains_stationary_unit(loc):
+                    tmp_game_state.game_map.add_unit(removed.unit_type, loc, player_index = 1)
+                    if removed.upgraded:
+                        tmp_game_state.game_map.upgrade_unit(loc)
+                        # heal up to the upgraded max health through the map so its indexes stay in sync
+                        unit = tmp_game_state.game_map[loc][0]
+                        tmp_game_state.game_map.hurt_unit(loc, unit.health - unit.max_health)
 
         if cover:
             if hole == [7, 7]:
@@ -314,11 +332,73 @@ class AlgoStrategy(gamelib.AlgoCore):
 
         return tmp_game_state
 
+    def attack_setups(self, game_state, last_game_state, removals):
+        # every candidate starts from one of these boards, attack_score's changes are rolled back after each one.
+        # removals are the locations the enemy removed structures from last turn
+        delta = game_state.diff(last_game_state) if game_state.turn_number >= 1 else None
+        setups = {}
+        for hole in self.holes:
+            for cover in [True, False]:
+                setups[tuple(hole), cover] = self.setup_state(game_state, hole, cover, delta, removals)
+        return setups
+
+    def score_attacks(self, setups, scores, candidates, cancelled=None):
+        # candidates are (deploy_location, hole, cover, unit_type, number), each board scores its own in one batch
+        batches = {}
+        for deploy_location, hole, cover, unit_type, number in candidates:
+            key = (tuple(deploy_location), tuple(hole), cover, unit_type, number)
+            if key not in scores:
+                batches.setdefault((tuple(hole), cover), {})[key] = (deploy_location, number, unit_type)
+        batches = list(batches.items())
+        scored = self.workers.evaluate_attacks([(setups[setup], list(batch.values())) for setup, batch in batches], cancelled)
+        if scored is None:
+            return False
+        for (_, batch), results in zip(batches, scored):
+            for key, result in zip(batch, results):
+                scores[key] = result
+        return True
+
+    def scored_attack(self, setups, scores, deploy_location, hole, cover, unit_type, number):
+        self.score_attacks(setups, scores, [(deploy_location, hole, cover, unit_type, number)])
+        return scores[tuple(deploy_location), tuple(hole), cover, unit_type, number]
+
+    def demolisher_candidates(self, number):
+        return [(deploy_location, hole, cover, DEMOLISHER, number)
+            for deploy_location in self.start_att_locs for hole in self.holes for cover in [True, False]]
+
+    def scout_candidates(self, number):
+        return [(deploy_location, hole, False, SCOUT, number) for deploy_location in self.start_att_locs for hole in self.holes]
+
+    def retry_candidates(self, scores, candidates):
+        # attacks that reach the edge are also tried with one unit fewer, see attack_monte_carlo
+        return [(deploy_location, hole, cover, unit_type, number - 1) for deploy_location, hole, cover, unit_type, number in candidates
+            if scores[tuple(deploy_location), tuple(hole), cover, unit_type, number]['edge_score'] > 1001]
+
+    def prepare_speculation(self, predicted_state):
+        # runs on the main thread, speculate only reads these copies while the next frames keep changing the originals
+        return {'last_game_state': self.last_game_state, 'removals': [list(loc) for loc in self.removals[predicted_state.turn_number - 1]]}
+
+    def speculate(self, predicted_state, cancelled, inputs):
+        # score next turn's attacks while the action phase plays out, same candidates as attack_monte_carlo
+        turn = predicted_state.turn_number
+        if not (turn <= 10 or turn % 4 == 0):
+            return None
+        setups = self.attack_setups(predicted_state, inputs['last_game_state'], inputs['removals'])
+        scores = {}
+        candidates = self.demolisher_candidates(predicted_state.number_affordable(DEMOLISHER))
+        if not self.score_attacks(setups, scores, candidates, cancelled):
+            return None
+        candidates = self.retry_candidates(scores, candidates) + self.scout_candidates(predicted_state.number_affordable(SCOUT))
+        if not self.score_attacks(setups, scores, candidates, cancelled):
+            return None
+        boards = {key: setup.game_map.get_structure_signature() for key, setup in setups.items()}
+        return {'mp': predicted_state.get_resource(MP), 'scores': scores, 'boards': boards}
+
     def attack_monte_carlo(self, game_state, score_th = None):
         # randomly generate attacks and select the best ones
         # friendly_edges = game_state.game_map.get_edge_locations(game_state.game_map.BOTTOM_LEFT) + game_state.game_map.get_edge_locations(game_state.game_map.BOTTOM_RIGHT)
         deploy_locations = self.start_att_locs
-        holes  = [[7, 7], [20, 7]]
+        holes = self.holes
         scout_good = True
         # first for demolisher:
         d_best_score = -100
@@ -329,24 +409,37 @@ class AlgoStrategy(gamelib.AlgoCore):
         d_best_extra = None
         d_best_cover = False
 
+        setups = self.attack_setups(game_state, self.last_game_state, self.removals[game_state.turn_number - 1])
+        scores = {}
+        if self.speculation is not None:
+            # the speculated boards did not have this turn's builds, only the scores of boards that came out the same are kept
+            boards = self.speculation['boards']
+            same = {key for key in setups if boards.get(key) == setups[key].game_map.get_structure_signature()}
+            scores = {key: result for key, result in self.speculation['scores'].items() if (key[1], key[2]) in same}
+        # scores only depend on the boards they were computed on, keep them while no setup board changed
+        if self.last_setups is not None and not any(setups[key].diff(self.last_setups[key])['changed'] for key in setups):
+            scores = self.last_scores
+        self.last_setups = setups
+        self.last_scores = scores
+        candidates = self.demolisher_candidates(game_state.number_affordable(DEMOLISHER))
+        self.score_attacks(setups, scores, candidates)
+        self.score_attacks(setups, scores, self.retry_candidates(scores, candidates))
 
         for deploy_location in deploy_locations:
             for hole in holes:
                 for cover in [True, False]:
                     max_under_budget = game_state.number_affordable(DEMOLISHER)
                     # gamelib.debug_write("DEMOLISHER cost is: " + str(game_state.type_cost(DEMOLISHER)[MP])+ "max_number is " + str(max_under_budget) + " with a budget of "+ str(budget))
-                    tmp_game_state = self.setup_state(game_state, hole, cover)
-
-                    attack_all = tmp_game_state.attack_score(deploy_location, max_under_budget, DEMOLISHER)
+                    attack_all = self.scored_attack(setups, scores, deploy_location, hole, cover, DEMOLISHER, max_under_budget)
                     attack_score = attack_all["score"]
                     ints_num = 0
                     try_max = max_under_budget - 1
                     if attack_all['edge_score'] > 1001:
                         try_max = max_under_budget - 1
-                        tmp_game_state = self.setup_state(game_state, hole, cover)
                     #    if game_state.turn_number == 40 and deploy_location == [13, 0] and hole == [20, 7] and not cover:
                     #        tmp_game_state.attack_score(deploy_location, try_max, DEMOLISHER, debug=True)
-                        if tmp_game_state.attack_score(deploy_location, try_max, DEMOLISHER)['edge_score'] > 1:
+                        try_all = self.scored_attack(setups, scores, deploy_location, hole, cover, DEMOLISHER, try_max)
+                        if try_all['edge_score'] > 1:
                             ints_num = int(game_state.get_resource(MP) - 3 * try_max)
                                            
                     if ints_num > 0:
@@ -373,14 +466,14 @@ class AlgoStrategy(gamelib.AlgoCore):
         s_best_all = None
         s_best_hole = None
         if scout_good:
+            self.score_attacks(setups, scores, self.scout_candidates(game_state.number_affordable(SCOUT)))
             for deploy_location in deploy_locations:
                 for hole in holes:
                     max_under_budget = game_state.number_affordable(SCOUT)
                     # gamelib.debug_write("DEMOLISHER cost is: " + str(game_state.type_cost(DEMOLISHER)[MP])+ "max_number is " + str(max_under_budget) + " with a budget of "+ str(budget))
-                    tmp_game_state = self.setup_state(game_state, hole, False)
              #       if game_state.turn_number == 40 and deploy_location == [13, 0] and hole == [7, 7]:
-             #           tmp_game_state.attack_score(deploy_location, max_under_budget, SCOUT, debug=True)
-                    attack_all = tmp_game_state.attack_score(deploy_location, max_under_budget, SCOUT)
+             #           setups[tuple(hole), False].attack_score(deploy_location, max_under_budget, SCOUT, debug=True)
+                    attack_all = self.scored_attack(setups, scores, deploy_location, hole, False, SCOUT, max_under_budget)
                     attack_score = attack_all["edge_score"]
                     if attack_score > s_best_score:
                         s_best_score = attack_score
@@ -439,41 +532,44 @@ class AlgoStrategy(gamelib.AlgoCore):
 
     def on_action_frame(self, turn_string):
 
-        # Let's record at what position we get scored on
-        state = json.loads(turn_string)
-        events = state["events"]
-        moves = events["move"]
-
-        if state['turnInfo'][1] > 5:
-            for move in moves:
-                loc = move[1]
-                if move[5] == 2 and move[3] != 5:
-                    if state['turnInfo'][1] not in self.attack_paths:
-                        self.attack_paths[state['turnInfo'][1]] = []
-                    else:
-                        self.attack_paths[state['turnInfo'][1]].append(loc)
+        # Events are handled by the callbacks subscribed in on_game_start, only the removals are read here.
+        # They are marked before the action phase, so every frame of a turn lists the same ones as its first
+        frame = turn_string if isinstance(turn_string, gamelib.ActionFrame) else gamelib.ActionFrame(turn_string)
+        self.tracker.update(frame)
+        if frame.frame_number != 0:
+            return
+
+        turn = frame.turn_number
+        for unit in frame.units(1)[6]:
+            if unit[2] == 1 and not [unit[0], unit[1]] in self.removals[turn]:
+                self.removals[turn].append([unit[0], unit[1]])
+
+    # When parsing the frame data directly, 
+    # 1 is integer for yourself, 2 is opponent (StarterKit code uses 0, 1 as player_index instead)
+    def on_enemy_move(self, move, frame):
+        turn = frame.turn_number
+        if turn > 5 and move.unit_type != 5:
+            if turn not in self.attack_paths:
+                self.attack_paths[turn] = []
+            else:
+                self.attack_paths[turn].append(move.end)
 
-        for unit in state['p2Units'][6]:
-            if unit[2] == 1 and not [unit[0], unit[1]] in self.removals[state['turnInfo'][1]]:
-                self.removals[state['turnInfo'][1]].append([unit[0], unit[1]])
-        
-        for breach in events['breach']:
-            if breach[4] == 2:
-                self.just_scored = True
-                if breach[0] in self.extra_left + self.extra_right:
-                    if self.extra_left[0] not in self.upgrade_walls:
-                        self.upgrade_walls += self.extra_left
-                    if self.extra_right[0] not in self.upgrade_walls:
-                       self.upgrade_walls += self.extra_right
-        for death in events['death']:
-            if death[3] == 1 and death[1] == 2:
-                self.just_beat = True
-        for spawn in events['spawn']:
-            if spawn[3] == 2 and spawn[1] in [3, 4]:
-                self.last_attack = state['turnInfo'][1]
-
-            # When parsing the frame data directly, 
-            # 1 is integer for yourself, 2 is opponent (StarterKit code uses 0, 1 as player_index instead)
+    def on_enemy_breach(self, breach, frame):
+        # Let's record at what position we get scored on
+        self.just_scored = True
+        if breach.location in self.extra_left + self.extra_right:
+            if self.extra_left[0] not in self.upgrade_walls:
+                self.upgrade_walls += self.extra_left
+            if self.extra_right[0] not in self.upgrade_walls:
+               self.upgrade_walls += self.extra_right
+
+    def on_death(self, death, frame):
+        if death.unit_type == 2:
+            self.just_beat = True
+
+    def on_enemy_spawn(self, spawn, frame):
+        if spawn.unit_type in [3, 4]:
+            self.last_attack = frame.turn_number
 
 if __name__ == "__main__":
     algo = AlgoStrategy()
@@ -8,22 +8,46 @@ The GameMap class in game_map.py represents the current game map. It can be used
 Investigating it is useful for any player that wants to access more information about the current state of the game. \n
 
 The GameUnit class in unit.py represetns a single unit. 
-Investigating it is useful for any player that wants to access information about units. \n
+Investigating it is useful for any player that wants to access information about units. 
+Its stats come from a UnitSpec shared by every unit of the same type and upgrade level. \n
 
 The AlgoCore class in algocore.py handles communication with the game engine, and forms the bones of an algo. AlgoStrategy inherits from it. 
 Investigating it is useful for advanced players interested in getting data from the action phase or communicating directly with the game engine. \n
 
 The Navigation class in navigation.py contains functions related to pathfinding, which are used by GameState in pathing related functions. 
-Investigating it is useful for advanced player who want to optimize the slow default pathing algorithm we provide. \n 
+Investigating it is useful for advanced player who want to optimize the slow default pathing algorithm we provide. 
+GameState uses its ArrayPathFinder, which finds the same paths as ShortestPathFinder using flat arrays over the board. \n 
 
-util.py contains a small handful of functions that help with communication, including the debug-printing function, debug_write().
+action_frame.py contains the ActionFrame class AlgoCore passes to on_action_frame, with typed and lazily decoded frame events. \n
+
+tracker.py contains the BoardTracker class, which follows the board through the action phase from frame events 
+so the next turn's GameState is built as a small delta instead of a full parse. \n
+
+simulator.py contains simulate, which plays out an action phase frame by frame with the engine's rules 
+to predict the breaches, damage and destroyed structures of both players' attacks. \n
+
+workers.py contains the WorkerPool class, worker processes forked at the start of the game that score
+attack candidates in parallel, along with the compact board snapshots they receive. \n
+
+rules.py contains the Rules class, the unit types, costs and ranges compiled once from the config and shared by every GameState. \n
+
+geometry.py holds the static bounds, edge and range tables of the board, built once and shared by every GameMap. \n
+
+board_arrays.py contains the BoardArrays class, an optional numpy view of the structures on a GameMap for whole board queries. \n
+
+util.py contains a small handful of functions that help with communication, including the debug-printing function, debug_write(), 
+and GameMessage, an engine message string that keeps its decoded json so it is only parsed once.
 """
 
 from .algocore import AlgoCore
-from .util import debug_write
+from .util import debug_write, parse_message
+from .action_frame import ActionFrame
 from .game_state import GameState
 from .unit import GameUnit
 from .game_map import GameMap
+from .tracker import BoardTracker
+from .simulator import simulate
+from .workers import WorkerPool
 
-__all__ = ["algocore", "game_state", "game_map", "navigation", "unit", "util"]
+__all__ = ["algocore", "game_state", "game_map", "navigation", "unit", "util", "action_frame", "tracker", "simulator", "workers", "rules", "geometry", "board_arrays"]
  
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""
+Typed, lazily decoded access to the action frames the engine sends during the action phase.
+"""
+
+from collections import namedtuple
+
+from .util import GameMessage
+
+# Locations are [x, y] lists, unit_type is the index of the unit in config["unitInformation"],
+# player is 1 for you and 2 for your opponent, as sent by the engine.
+SpawnEvent = namedtuple("SpawnEvent", ["location", "unit_type", "unit_id", "player"])
+MoveEvent = namedtuple("MoveEvent", ["start", "end", "unit_type", "unit_id", "player"])
+BreachEvent = namedtuple("BreachEvent", ["location", "damage", "unit_type", "unit_id", "player"])
+DeathEvent = namedtuple("DeathEvent", ["location", "unit_type", "unit_id", "player", "removed_by_owner"])
+DamageEvent = namedtuple("DamageEvent", ["location", "damage", "unit_type", "unit_id", "player"])
+AttackEvent = namedtuple("AttackEvent", ["start", "target", "damage", "unit_type", "attacker_id", "target_id", "player"])
+ShieldEvent = namedtuple("ShieldEvent", ["start", "target", "amount", "unit_type", "giver_id", "receiver_id", "player"])
+SelfDestructEvent = namedtuple("SelfDestructEvent", ["location", "targets", "damage", "unit_type", "unit_id", "player"])
+
+# The engine's name for each kind of event, mapped to the ActionFrame property holding it
+EVENT_TYPES = {
+    "spawn": "spawns",
+    "move": "moves",
+    "breach": "breaches",
+    "death": "deaths",
+    "damage": "damages",
+    "attack": "attacks",
+    "shield": "shields",
+    "selfDestruct": "self_destructs",
+}
+
+
+class ActionFrame(GameMessage):
+    """A single frame of the action phase.
+
+    Only the parts of the frame that are actually read get decoded, each of them once.
+    It is still the raw frame string, so it can be used anywhere a frame string or GameMessage was.
+
+    Attributes :
+        * turn_info (list): [phase, turn number, frame number] as sent by the engine
+        * turn_number (int): The turn this frame belongs to
+        * frame_number (int): The index of this frame in the action phase
+        * spawns, moves, breaches, deaths, damages, attacks, shields, self_destructs (list): The events of this frame, as namedtuples
+
+    """
+    __slots__ = ()
+
+    @property
+    def turn_info(self):
+        return self.section("turnInfo")
+
+    @property
+    def turn_number(self):
+        return int(self.section("turnInfo")[1])
+
+    @property
+    def frame_number(self):
+        return int(self.section("turnInfo")[2])
+
+    def units(self, player_index):
+        """Gets the raw unit lists of a player
+
+        Args:
+            player_index: The index corresponding to the player, 0 for you 1 for the enemy
+
+        Returns:
+            A list with one list of [x, y, health, id] entries per unit type, indexed like config["unitInformation"]
+
+        """
+        return self.section("p1Units" if player_index == 0 else "p2Units")
+
+    def stats(self, player_index):
+        """Gets the raw [health, SP, MP, time] stats of a player
+
+        Args:
+            player_index: The index corresponding to the player, 0 for you 1 for the enemy
+
+        """
+        return self.section("p1Stats" if player_index == 0 else "p2Stats")
+
+    def event(self, name):
+        """Gets the raw list of one kind of event, such as "move" or "breach", decoding only that list
+        """
+        start = self.find('"events":')
+        if start < 0:
+            return self.data["events"][name]
+        return self.section(name, start)
+
+    def has_events(self, name):
+        """Checks whether the frame holds any event of one kind, without decoding anything
+
+        The engine always writes an empty event list as "name":[], so its absence means there is at least one event.
+
+        Args:
+            name: The engine's name for the event, see EVENT_TYPES
+
+        """
+        return '"' + name + '":[]' not in self
+
+    def __typed(self, name, make):
+        key = "typed " + name
+        try:
+            return self._sections[key]
+        except (AttributeError, KeyError):
+            events = [make(event) for event in self.event(name)]
+            self._sections[key] = events
+            return events
+
+    @property
+    def spawns(self):
+        return self.__typed("spawn", lambda e: SpawnEvent(e[0], e[1], e[2], e[3]))
+
+    @property
+    def moves(self):
+        return self.__typed("move", lambda e: MoveEvent(e[0], e[1], e[3], e[4], e[5]))
+
+    @property
+    def breaches(self):
+        return self.__typed("breach", lambda e: BreachEvent(e[0], e[1], e[2], e[3], e[4]))
+
+    @property
+    def deaths(self):
+        return self.__typed("death", lambda e: DeathEvent(e[0], e[1], e[2], e[3], e[4]))
+
+    @property
+    def damages(self):
+        return self.__typed("damage", lambda e: DamageEvent(e[0], e[1], e[2], e[3], e[4]))
+
+    @property
+    def attacks(self):
+        return self.__typed("attack", lambda e: AttackEvent(e[0], e[1], e[2], e[3], e[4], e[5], e[6]))
+
+    @property
+    def shields(self):
+        return self.__typed("shield", lambda e: ShieldEvent(e[0], e[1], e[2], e[3], e[4], e[5], e[6]))
+
+    @property
+    def self_destructs(self):
+        return self.__typed("selfDestruct", lambda e: SelfDestructEvent(e[0], e[1], e[2], e[3], e[4], e[5]))
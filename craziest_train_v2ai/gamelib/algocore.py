@@ -1,7 +1,10 @@
-import json
+import threading
 
 from .game_state import GameState
-from .util import get_command, debug_write, BANNER_TEXT, send_command
+from .rules import get_rules
+from .action_frame import ActionFrame, EVENT_TYPES
+from .util import get_command, debug_write, BANNER_TEXT, send_command, GameMessage
+from .workers import WorkerPool
 
 class AlgoCore(object):
     """
@@ -10,10 +13,146 @@ class AlgoCore(object):
 
     Attributes :
         * config (JSON): json object containing information about the game
+        * worker_processes (int): The number of worker processes forked right after on_game_start, 0 by default.
+          Set it to None in your __init__ to use every core but one, see WorkerPool.
+        * workers (WorkerPool): Scores attack candidates in the worker processes, or in process while there are none
 
     """
     def __init__(self):
         self.config = None
+        self.worker_processes = 0
+        self.workers = WorkerPool(None, 0)
+        self._subscriptions = {}
+        self._speculation = None
+        self._speculated_turn = None
+        self._finished_speculation = None
+
+    def subscribe(self, event_type, callback, player_index=None):
+        """Calls a function for every action frame event of a given type.
+
+        Frames whose text shows that they hold no event of a subscribed type are skipped without being decoded,
+        so handling events here is much cheaper than decoding every frame in on_action_frame.
+
+        Args:
+            event_type: The engine's name for the event, one of "spawn", "move", "breach", "death", "damage", "attack", "shield" or "selfDestruct"
+            callback: Called as callback(event, frame) with the typed event namedtuple and its ActionFrame
+            player_index: Only pass events of units controlled by this player, 0 for you 1 for the enemy. All players if None.
+
+        """
+        if event_type not in EVENT_TYPES:
+            debug_write("Cannot subscribe to unknown event type {}".format(event_type))
+            return
+        if player_index is not None and not player_index == 0 and not player_index == 1:
+            debug_write("Invalid player index {} passed, player index should always be 0 (yourself) or 1 (your opponent)".format(player_index))
+            return
+        engine_player = None if player_index is None else player_index + 1
+        self._subscriptions.setdefault(event_type, []).append((callback, engine_player))
+
+    def _dispatch_events(self, frame):
+        """Passes the events of a frame to their subscribers
+        """
+        for event_type, subscribers in self._subscriptions.items():
+            # only the event lists that hold something are decoded, each on its own
+            if not frame.has_events(event_type):
+                continue
+            for event in getattr(frame, EVENT_TYPES[event_type]):
+                for callback, player in subscribers:
+                    if player is None or event.player == player:
+                        callback(event, frame)
+
+    def prepare_speculation(self, predicted_state):
+        """
+        Override this to copy what speculate needs from your algo's attributes. 
+        It is called on the main thread right before speculate starts, and whatever it returns is passed to speculate. \n
+        The main thread keeps handling frames while speculate runs, so speculate should only read predicted_state
+        and these copies, never attributes the frame handlers change.
+        """
+        return None
+
+    def speculate(self, predicted_state, cancelled, inputs):
+        """
+        Override this to use the time spent waiting during the action phase. 
+        Once a frame shows no mobile units left, the board cannot change until the next turn, so AlgoCore predicts
+        the next turn's GameState and calls this function with it in a background thread. 
+        Whatever it returns is given back by take_speculation during the next turn if the prediction was right. \n
+        cancelled is a threading.Event set when the real turn arrives before this finishes. 
+        Check it between expensive steps and return early once it is set, the result is thrown away anyway. \n
+        inputs is what prepare_speculation returned.
+        """
+        return None
+
+    def take_speculation(self, game_state):
+        """
+        Gets what speculate returned for this turn, or None if it did not finish in time or predicted a different board. \n
+        Only the structures and the turn number are checked, if your speculative work depends on anything else
+        such as resources, store it in the result and compare it yourself. \n
+        The check is made against the board at the start of the turn. Anything computed on the predicted board is no longer
+        valid for a board you have built on or removed from since, store the signatures of the boards your results depend on,
+        see GameMap.get_structure_signature, and compare them with the current ones before using a result.
+        """
+        finished = self._finished_speculation
+        self._finished_speculation = None
+        if finished is None:
+            return None
+        predicted_state, result = finished
+        if predicted_state.turn_number != game_state.turn_number:
+            return None
+        if predicted_state.game_map.get_structure_signature() != game_state.game_map.get_structure_signature():
+            return None
+        return result
+
+    def _predict_next_state(self, frame):
+        """Builds the GameState expected at the start of the next turn from a frame with no mobile units left
+        """
+        state = GameState(self.config, frame)
+        remove_index = state.rules.UNIT_TYPE_TO_INDEX[state.rules.REMOVE]
+        for player_index in (0, 1):
+            # the third field of a removal is the number of turns until the structure is removed
+            for x, y, turns_left, _ in frame.units(player_index)[remove_index]:
+                if turns_left <= 1:
+                    state.game_map.remove_unit([x, y])
+            state._player_resources[player_index]['MP'] = state.project_future_MP(1, player_index)
+            state._player_resources[player_index]['SP'] += state.rules.cores_per_round
+        state.turn_number += 1
+        return state
+
+    def _start_speculation(self, frame):
+        """Starts speculating on the next turn once the action phase has no mobile units left
+        """
+        turn_number = frame.turn_number
+        if type(self).speculate is AlgoCore.speculate or self._speculated_turn == turn_number:
+            return
+        rules = get_rules(self.config)
+        mobile_indices = [rules.UNIT_TYPE_TO_INDEX[unit_type] for unit_type in (rules.SCOUT, rules.DEMOLISHER, rules.INTERCEPTOR)]
+        for player_index in (0, 1):
+            units = frame.units(player_index)
+            if any(units[index] for index in mobile_indices):
+                return
+        self._speculated_turn = turn_number
+        predicted_state = self._predict_next_state(frame)
+        inputs = self.prepare_speculation(predicted_state)
+        cancelled = threading.Event()
+        speculation = [predicted_state, None]
+
+        def run():
+            speculation[1] = self.speculate(predicted_state, cancelled, inputs)
+
+        thread = threading.Thread(target=run, daemon=True)
+        self._speculation = (thread, cancelled, speculation)
+        thread.start()
+
+    def _finish_speculation(self):
+        """Keeps the speculation result for take_speculation if it is done, cancels it otherwise
+        """
+        self._finished_speculation = None
+        if self._speculation is None:
+            return
+        thread, cancelled, speculation = self._speculation
+        self._speculation = None
+        if thread.is_alive():
+            cancelled.set()
+            return
+        self._finished_speculation = tuple(speculation)
 
     def on_game_start(self, config):
         """
@@ -30,6 +169,7 @@ class AlgoCore(object):
         By default, it sends empty commands to the game engine. \n
         algo_strategy.py inherits from AlgoCore and overrides this on turn function. 
         Adjusting the on_turn function in algo_strategy is the main way to adjust your algo's logic. 
+        game_state is a GameMessage, the decoded json is available as game_state.data without parsing it again.
         """
         send_command("[]")
         send_command("[]")
@@ -40,6 +180,8 @@ class AlgoCore(object):
         The action phase is made up of a sequence of distinct frames. 
         Each of these frames is sent to the algo in order. 
         They can be handled in this function. 
+        The frame is an ActionFrame, use its typed accessors such as action_frame_game_state.moves
+        so only the parts you read get decoded.
         """
         pass
 
@@ -56,32 +198,42 @@ class AlgoCore(object):
         while True:
             # Note: Python blocks and hangs on stdin. Can cause issues if connections aren't setup properly and may need to
             # manually kill this Python program.
-            game_state_string = get_command()
+            game_state_string = GameMessage(get_command())
             if "replaySave" in game_state_string:
                 """
                 This means this must be the config file. So, load in the config file as a json and add it to your AlgoStrategy class.
                 """
-                parsed_config = json.loads(game_state_string)
+                parsed_config = game_state_string.data
+                get_rules(parsed_config)
                 self.on_game_start(parsed_config)
+                # forked after the game's setup, so the workers inherit the compiled rules and board tables
+                if self.worker_processes != 0:
+                    self.workers.close()
+                    self.workers = WorkerPool(parsed_config, self.worker_processes)
             elif "turnInfo" in game_state_string:
-                state = json.loads(game_state_string)
-                stateType = int(state.get("turnInfo")[0])
+                # only turnInfo is decoded here, the hooks decode what they need from the same message
+                stateType = int(game_state_string.section("turnInfo")[0])
                 if stateType == 0:
                     """
                     This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
                     deploy phase. Printing is handled by the provided functions.
                     """
+                    self._finish_speculation()
                     self.on_turn(game_state_string)
                 elif stateType == 1:
                     """
                     If stateType == 1, this game_state_string string represents a single frame of an action phase
                     """
-                    self.on_action_frame(game_state_string)
+                    frame = ActionFrame(game_state_string)
+                    self.on_action_frame(frame)
+                    self._dispatch_events(frame)
+                    self._start_speculation(frame)
                 elif stateType == 2:
                     """
                     This is the end game message. This means the game is over so break and finish the program.
                     """
                     debug_write("Got end state, game over. Stopping algo.")
+                    self.workers.close()
                     break
                 else:
                     """
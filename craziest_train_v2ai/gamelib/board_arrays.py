@@ -0,0 +1,200 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .rules import get_rules
+from .geometry import get_geometry
+
+
+class BoardArrays:
+    """Array view of the structures on a GameMap, for whole board queries without Python loops.
+
+    Every attribute is a numpy array of shape (ARENA_SIZE, ARENA_SIZE) indexed with [x, y], like game_map[x, y].
+    Cells without a structure hold -1 in unit_type and player_index and 0 or False everywhere else.
+    Get it through game_map.arrays, which builds it on first use and keeps it in sync with the map's
+    add_unit, remove_unit, hurt_unit and upgrade_unit functions. Requires numpy.
+
+    Attributes :
+        * unit_type (int8 array): Index of the structure's type in config["unitInformation"]
+        * player_index (int8 array): The player that controls the structure, 0 for you 1 for the enemy
+        * health (float array): The current health of the structure
+        * max_health (float array): The starting health of the structure
+        * upgraded (bool array): If the structure is upgraded
+        * pending_removal (bool array): If the structure is marked for removal by its owner
+        * threat (float array): threat[player_index, x, y] is the damage per frame the turrets of a player deal to an enemy
+          mobile unit at x, y. Its shape is (2, ARENA_SIZE, ARENA_SIZE), and cells off the board hold 0.
+
+    """
+    def __init__(self, config, arena_size=28):
+        """Creates arrays for an empty board
+
+        Args:
+            config (JSON): Contains information about the game
+            arena_size (int): The size of the arena
+
+        """
+        if np is None:
+            raise ImportError("BoardArrays requires numpy")
+        rules = get_rules(config)
+        self.type_index = rules.UNIT_TYPE_TO_INDEX
+        self.geometry = get_geometry(arena_size)
+        self.hit_radius = rules.hit_radius
+        # (damage per frame to mobile units, attack range) of every unit type index, not upgraded and upgraded
+        self.attacks = {}
+        for unit_type, spec in rules.specs.items():
+            for upgraded, stats in ((False, spec), (True, spec.upgrade_spec)):
+                if stats.stationary and stats.damage_i > 0:
+                    self.attacks[self.type_index[unit_type], upgraded] = (stats.damage_i, stats.attackRange)
+        shape = (arena_size, arena_size)
+        self.unit_type = np.full(shape, -1, dtype=np.int8)
+        self.player_index = np.full(shape, -1, dtype=np.int8)
+        self.health = np.zeros(shape)
+        self.max_health = np.zeros(shape)
+        self.upgraded = np.zeros(shape, dtype=bool)
+        self.pending_removal = np.zeros(shape, dtype=bool)
+        self.threat = np.zeros((2,) + shape)
+
+    @classmethod
+    def from_map(cls, game_map):
+        """Builds the arrays for every structure currently on a GameMap
+
+        Args:
+            game_map: The GameMap to read
+
+        Returns:
+            A new BoardArrays
+
+        """
+        arrays = cls(game_map.config, game_map.ARENA_SIZE)
+        threat = arrays.threat
+        # the cells are synced without their threat, which is then measured for the whole board at once
+        arrays.threat = None
+        for x, y in game_map.geometry.cells:
+            arrays.sync_cell(x, y, game_map[x, y])
+        threat[...] = arrays.measure_threat()
+        arrays.threat = threat
+        return arrays
+
+    def copy(self):
+        """Returns an independent copy of these arrays
+        """
+        copied = BoardArrays.__new__(BoardArrays)
+        copied.type_index = self.type_index
+        copied.geometry = self.geometry
+        copied.hit_radius = self.hit_radius
+        copied.attacks = self.attacks
+        for name in ("unit_type", "player_index", "health", "max_health", "upgraded", "pending_removal", "threat"):
+            setattr(copied, name, getattr(self, name).copy())
+        return copied
+
+    def sync_cell(self, x, y, units):
+        """Updates the arrays at x, y to match the given list of units
+        """
+        if self.threat is not None:
+            old_attack = self.attacks.get((int(self.unit_type[x, y]), bool(self.upgraded[x, y])))
+            old_player = int(self.player_index[x, y])
+        for unit in units:
+            if unit.stationary:
+                self.unit_type[x, y] = self.type_index[unit.unit_type]
+                self.player_index[x, y] = unit.player_index
+                self.health[x, y] = unit.health
+                self.max_health[x, y] = unit.max_health
+                self.upgraded[x, y] = unit.upgraded
+                self.pending_removal[x, y] = unit.pending_removal
+                break
+        else:
+            self.unit_type[x, y] = -1
+            self.player_index[x, y] = -1
+            self.health[x, y] = 0
+            self.max_health[x, y] = 0
+            self.upgraded[x, y] = False
+            self.pending_removal[x, y] = False
+        if self.threat is None:
+            return
+        new_attack = self.attacks.get((int(self.unit_type[x, y]), bool(self.upgraded[x, y])))
+        new_player = int(self.player_index[x, y])
+        if old_attack == new_attack and old_player == new_player:
+            return
+        if old_attack is not None and old_player >= 0:
+            self.threat[(old_player,) + self.__footprint(x, y, old_attack[1])] -= old_attack[0]
+        if new_attack is not None and new_player >= 0:
+            self.threat[(new_player,) + self.__footprint(x, y, new_attack[1])] += new_attack[0]
+
+    _footprints = {}
+
+    def __footprint(self, x, y, radius):
+        """Gets the index arrays of the cells within a turret's range, shared by every BoardArrays
+        """
+        key = (self.geometry.ARENA_SIZE, x, y, radius, self.hit_radius)
+        footprint = self._footprints.get(key)
+        if footprint is None:
+            locations = self.geometry.locations_in_range(x, y, radius, self.hit_radius)
+            footprint = self._footprints[key] = (np.array([location[0] for location in locations], dtype=np.intp),
+                np.array([location[1] for location in locations], dtype=np.intp))
+        return footprint
+
+    def measure_threat(self):
+        """Computes the threat of every turret on the board from scratch, in one vectorized pass per kind of turret.
+        threat is kept up to date as the map changes, this is the reference it must match.
+
+        Returns:
+            A new float array laid out like threat
+
+        """
+        size = self.geometry.ARENA_SIZE
+        threat = np.zeros((2, size, size))
+        for (type_index, upgraded), (damage, radius) in self.attacks.items():
+            for player_index in (0, 1):
+                turrets = (self.unit_type == type_index) & (self.upgraded == upgraded) & (self.player_index == player_index)
+                if not turrets.any():
+                    continue
+                damage_grid = turrets * damage
+                # every offset of the stencil shifts the whole grid of turrets onto the cells they reach
+                for dx, dy in self.geometry.stencil(radius, self.hit_radius):
+                    threat[player_index, max(dx, 0):size + min(dx, 0), max(dy, 0):size + min(dy, 0)] += \
+                        damage_grid[max(-dx, 0):size - max(dx, 0), max(-dy, 0):size - max(dy, 0)]
+        threat *= self.__on_board()
+        return threat
+
+    _boards = {}
+
+    def __on_board(self):
+        board = self._boards.get(self.geometry.ARENA_SIZE)
+        if board is None:
+            board = np.zeros((self.geometry.ARENA_SIZE, self.geometry.ARENA_SIZE), dtype=bool)
+            for x, y in self.geometry.cells:
+                board[x, y] = True
+            self._boards[self.geometry.ARENA_SIZE] = board
+        return board
+
+    def mask(self, player_index=None, unit_type=None):
+        """Gets a mask of the cells holding a structure
+
+        Args:
+            player_index: Only include structures controlled by this player if given
+            unit_type: Only include structures of this type (string shorthand) if given
+
+        Returns:
+            A bool array, True where a matching structure is
+
+        """
+        mask = self.unit_type >= 0
+        if player_index is not None:
+            mask &= self.player_index == player_index
+        if unit_type is not None:
+            mask &= self.unit_type == self.type_index[unit_type]
+        return mask
+
+    def locations(self, mask):
+        """Gets the locations selected by a mask
+
+        Args:
+            mask: A bool array of shape (ARENA_SIZE, ARENA_SIZE)
+
+        Returns:
+            A list of [x, y] locations, ordered by x and then by y
+
+        """
+        xs, ys = np.nonzero(mask)
+        return [[x, y] for x, y in zip(xs.tolist(), ys.tolist())]
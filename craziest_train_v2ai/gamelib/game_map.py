@@ -1,7 +1,14 @@
 import math
+import copy
 from .unit import GameUnit
+from .geometry import get_geometry, zobrist_key
+from .rules import get_rules
+from .board_arrays import BoardArrays
 from .util import debug_write
 
+# The number of health levels a structure can be in for get_board_hash, full health is a level of its own
+HEALTH_BUCKETS = 8
+
 class GameMap:
     """Holds data about the current game map and provides functions
     useful for getting information related to the map.
@@ -11,6 +18,7 @@ class GameMap:
 
     Attributes :
         * config (JSON): Contains information about the current game rules
+        * rules (:obj: Rules): The rules compiled from the config, shared by every map using the same config
         * enable_warnings (bool): If true, debug messages for game_map functions will print out
         * ARENA_SIZE (int): The size of the arena.
         * HALF_ARENA (int): Half of the size of the arena.
@@ -18,6 +26,8 @@ class GameMap:
         * TOP_LEFT (int): A constant that represents the top left edge
         * BOTTOM_LEFT (int): Hidden challenge! Can you guess what this constant represents???
         * BOTTOM_RIGHT (int): A constant that represents the bottom right edge
+        * geometry (:obj: BoardGeometry): Precomputed bounds and edge tables, shared by every map of the same size
+        * arrays (:obj: BoardArrays): Numpy arrays describing every structure on the map, built on first use. Requires numpy.
 
     """
     def __init__(self, config):
@@ -35,8 +45,34 @@ class GameMap:
         self.TOP_LEFT = 1
         self.BOTTOM_LEFT = 2
         self.BOTTOM_RIGHT = 3
+        self.geometry = get_geometry(self.ARENA_SIZE)
+        self.__cell_set = self.geometry.cell_set
+        self.rules = get_rules(config)
+        self.__hit_radius = self.rules.hit_radius
         self.__map = self.__empty_grid()
+        self.__owned = None
+        self.__journal = None
+        self.__transactions = []
+        self.__touched = set()
+        self.__arrays = None
+        self.__structures = {}
+        self.__player_structures = ({}, {})
+        self.__typed_structures = ({}, {})
+        self.__damaged_structures = ({}, {})
+        self.__layout_hash = 0
+        self.__board_hash = 0
+        self.__cell_hashes = {}
+        self.__blocked_bits = 0
+        self.__player_bits = [0, 0]
+        self.__typed_bits = ({}, {})
+        self.__mobile_cells = (set(), set())
         self.__start = [13,0]
+
+    @property
+    def arrays(self):
+        if self.__arrays is None:
+            self.__arrays = BoardArrays.from_map(self)
+        return self.__arrays
     
     def __getitem__(self, location):
         if len(location) == 2 and self.in_arena_bounds(location):
@@ -46,7 +82,8 @@ class GameMap:
 
     def __setitem__(self, location, val):
         if type(location) == tuple and len(location) == 2 and self.in_arena_bounds(location):
-            self.__map[location[0]][location[1]] = val
+            self.__set_cell(location[0], location[1], val)
+            self.__cell_changed(location[0], location[1])
             return
         self._invalid_coordinates(location)
 
@@ -75,6 +112,167 @@ class GameMap:
                 grid[x].append([])
         return grid
 
+    def fork(self):
+        """Creates a copy of this map that can be modified independently of the original.
+
+        The copy shares the config and every cell with this map. A cell is only copied
+        when one of the two maps modifies it through add_unit, remove_unit, hurt_unit or upgrade_unit,
+        so forking costs the same no matter how many units are on the board.
+        Units returned by game_map[x, y] may be shared, modify them through the functions above.
+        An open transaction is not carried over to the copy.
+
+        Returns:
+            A new GameMap with the same units as this one
+
+        """
+        forked = GameMap.__new__(GameMap)
+        forked.__dict__.update(self.__dict__)
+        forked.__map = [column[:] for column in self.__map]
+        forked.__journal = None
+        forked.__transactions = []
+        forked.__touched = set()
+        if self.__arrays is not None:
+            forked.__arrays = self.__arrays.copy()
+        forked.__structures = dict(self.__structures)
+        forked.__player_structures = tuple(dict(structures) for structures in self.__player_structures)
+        forked.__typed_structures = tuple({unit_type: dict(structures) for unit_type, structures in typed.items()} for typed in self.__typed_structures)
+        forked.__damaged_structures = tuple(dict(structures) for structures in self.__damaged_structures)
+        forked.__cell_hashes = dict(self.__cell_hashes)
+        forked.__player_bits = list(self.__player_bits)
+        forked.__typed_bits = tuple(dict(bits) for bits in self.__typed_bits)
+        forked.__mobile_cells = tuple(set(cells) for cells in self.__mobile_cells)
+        # Every cell is now shared by both maps, so neither of them may modify a cell in place
+        forked.__owned = set()
+        self.__owned = set()
+        return forked
+
+    def start_transaction(self):
+        """Starts recording changes made to the map so they can be undone with rollback.
+
+        Every change made through add_unit, remove_unit, hurt_unit or upgrade_unit after this call
+        is journaled. Transactions can be nested, each rollback or commit closes the innermost one.
+        This lets a single GameState be reused for many hypothetical simulations without copying it.
+        """
+        if self.__journal is None:
+            self.__journal = []
+        self.__transactions.append((len(self.__journal), self.__touched))
+        self.__touched = set()
+
+    def rollback(self):
+        """Undoes every change made since the matching start_transaction and closes the transaction.
+
+        Runs in time proportional to the number of cells changed during the transaction.
+        """
+        if not self.__transactions:
+            self.warn("Attempted to rollback without starting a transaction.")
+            return
+        start, self.__touched = self.__transactions.pop()
+        journal = self.__journal
+        while len(journal) > start:
+            x, y, units, owned = journal.pop()
+            self.__map[x][y] = units
+            if self.__owned is not None:
+                if owned:
+                    self.__owned.add((x, y))
+                else:
+                    self.__owned.discard((x, y))
+            self.__cell_changed(x, y)
+        if not self.__transactions:
+            self.__journal = None
+
+    def commit(self):
+        """Keeps every change made since the matching start_transaction and closes the transaction.
+
+        If the transaction is nested, the changes can still be undone by rolling back the outer one.
+        """
+        if not self.__transactions:
+            self.warn("Attempted to commit without starting a transaction.")
+            return
+        _, touched = self.__transactions.pop()
+        if self.__transactions:
+            self.__touched |= touched
+        else:
+            self.__journal = None
+            self.__touched = set()
+
+    def __record(self, x, y):
+        """Journals the current contents of x, y the first time it changes during a transaction.
+
+        Returns:
+            True if the cell was journaled by this call
+        """
+        if self.__journal is None or (x, y) in self.__touched:
+            return False
+        owned = self.__owned is None or (x, y) in self.__owned
+        self.__journal.append((x, y, self.__map[x][y], owned))
+        self.__touched.add((x, y))
+        return True
+
+    def __set_cell(self, x, y, units):
+        self.__record(x, y)
+        self.__map[x][y] = units
+        if self.__owned is not None:
+            self.__owned.add((x, y))
+
+    def __own_cell(self, x, y):
+        """Returns the list of units at x, y, copying it first if it is shared with a forked map or the journal.
+        """
+        owned = self.__owned
+        if self.__record(x, y) or (owned is not None and (x, y) not in owned):
+            self.__map[x][y] = [copy.copy(unit) for unit in self.__map[x][y]]
+            if owned is not None:
+                owned.add((x, y))
+        return self.__map[x][y]
+
+    def __cell_changed(self, x, y):
+        """Keeps the structures derived from the map up to date after x, y was modified.
+        """
+        key = (x, y)
+        index = self.geometry.cell_index[x][y]
+        bit = 1 << index if index >= 0 else 0
+        old = self.__structures.pop(key, None)
+        if old is not None:
+            self.__blocked_bits &= ~bit
+            if old.player_index in (0, 1):
+                del self.__player_structures[old.player_index][key]
+                del self.__typed_structures[old.player_index][old.unit_type][key]
+                self.__damaged_structures[old.player_index].pop(key, None)
+                self.__player_bits[old.player_index] &= ~bit
+                self.__typed_bits[old.player_index][old.unit_type] &= ~bit
+        self.__mobile_cells[0].discard(key)
+        self.__mobile_cells[1].discard(key)
+        new = None
+        for unit in self.__map[x][y]:
+            if not unit.stationary:
+                if unit.player_index in (0, 1):
+                    self.__mobile_cells[unit.player_index].add(key)
+                continue
+            if new is None:
+                new = unit
+                self.__structures[key] = unit
+                self.__blocked_bits |= bit
+                if unit.player_index in (0, 1):
+                    self.__player_structures[unit.player_index][key] = unit
+                    self.__typed_structures[unit.player_index].setdefault(unit.unit_type, {})[key] = unit
+                    if unit.health < unit.max_health:
+                        self.__damaged_structures[unit.player_index][key] = unit
+                    self.__player_bits[unit.player_index] |= bit
+                    typed_bits = self.__typed_bits[unit.player_index]
+                    typed_bits[unit.unit_type] = typed_bits.get(unit.unit_type, 0) | bit
+
+        if (old is None) != (new is None):
+            self.__layout_hash ^= zobrist_key(x, y)
+        cell_hash = 0
+        if new is not None:
+            bucket = min(HEALTH_BUCKETS, max(0, int(HEALTH_BUCKETS * new.health / new.max_health))) if new.max_health else 0
+            cell_hash = zobrist_key(x, y, new.unit_type, new.player_index, new.upgraded, bucket, new.pending_removal)
+        old_hash = self.__cell_hashes.pop(key, 0)
+        if cell_hash:
+            self.__cell_hashes[key] = cell_hash
+        self.__board_hash ^= old_hash ^ cell_hash
+        if self.__arrays is not None:
+            self.__arrays.sync_cell(x, y, self.__map[x][y])
+
     def _invalid_coordinates(self, location):
         self.warn("{} is out of bounds.".format(str(location)))
 
@@ -89,19 +287,7 @@ class GameMap:
         
         """
         x, y = location
-        half_board = self.HALF_ARENA
-
-        row_size = y + 1
-        startx = half_board - row_size
-        endx = startx + (2 * row_size) - 1
-        top_half_check = (y < self.HALF_ARENA and x >= startx and x <= endx)
-
-        row_size = (self.ARENA_SIZE - 1 - y) + 1
-        startx = half_board - row_size
-        endx = startx + (2 * row_size) - 1
-        bottom_half_check = (y >= self.HALF_ARENA and x >= startx and x <= endx)
-
-        return bottom_half_check or top_half_check
+        return (x, y) in self.__cell_set
 
     def get_edge_locations(self, quadrant_description):
         """Takes in an edge description and returns a list of locations.
@@ -117,8 +303,7 @@ class GameMap:
             self.warn("Passed invalid quadrant_description '{}'. See the documentation for valid inputs for get_edge_locations.".format(quadrant_description))
             return
 
-        edges = self.get_edges()
-        return edges[quadrant_description]
+        return [list(location) for location in self.geometry.edges[quadrant_description]]
 
     def get_edges(self):
         """Gets all of the edges and their edge locations
@@ -127,27 +312,20 @@ class GameMap:
             A list with four lists inside of it of locations corresponding to the four edges.
             [0] = top_right, [1] = top_left, [2] = bottom_left, [3] = bottom_right.
         """
-        top_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = self.ARENA_SIZE - 1 - num
-            top_right.append([int(x), int(y)])
-        top_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = self.ARENA_SIZE - 1 - num
-            top_left.append([int(x), int(y)])
-        bottom_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = num
-            bottom_left.append([int(x), int(y)])
-        bottom_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = num
-            bottom_right.append([int(x), int(y)])
-        return [top_right, top_left, bottom_left, bottom_right]
+        return [[list(location) for location in edge] for edge in self.geometry.edges]
+
+    def get_edge_of(self, location):
+        """Finds the edge a location lies on
+
+        Args:
+            location: A map location
+
+        Returns:
+            The edge constant (game_map.TOP_LEFT, game_map.BOTTOM_RIGHT, etc.) of the edge containing the location, or None if it is not on an edge
+
+        """
+        x, y = location
+        return self.geometry.edge_of.get((x, y))
     
     def add_unit(self, unit_type, location, player_index=0):
         """Add a single GameUnit to the map at the given location.
@@ -169,9 +347,10 @@ class GameMap:
         x, y = location
         new_unit = GameUnit(unit_type, self.config, player_index, None, location[0], location[1])
         if not new_unit.stationary:
-            self.__map[x][y].append(new_unit)
+            self.__own_cell(x, y).append(new_unit)
         else:
-            self.__map[x][y] = [new_unit]
+            self.__set_cell(x, y, [new_unit])
+        self.__cell_changed(x, y)
 
     def hurt_unit(self, location, damage):
         """Remove all units on the map in the given location.
@@ -187,7 +366,26 @@ class GameMap:
         
         
         x, y = location
-        self.__map[x][y][0].health -= damage
+        self.__own_cell(x, y)[0].health -= damage
+        self.__cell_changed(x, y)
+
+    def upgrade_unit(self, location):
+        """Upgrades the structure on the map at the given location.
+
+        Args:
+            location: The location of the structure to upgrade
+
+        This function does not affect your turn and only changes the data stored in GameMap. 
+        Use game_state.attempt_upgrade to upgrade your own structures.
+        """
+        if not self.in_arena_bounds(location):
+            self._invalid_coordinates(location)
+
+        x, y = location
+        for unit in self.__own_cell(x, y):
+            if unit.stationary:
+                unit.upgrade()
+        self.__cell_changed(x, y)
 
     def remove_unit(self, location):
         """Remove all units on the map in the given location.
@@ -202,7 +400,232 @@ class GameMap:
             self._invalid_coordinates(location)
         
         x, y = location
-        self.__map[x][y] = []
+        self.__set_cell(x, y, [])
+        self.__cell_changed(x, y)
+
+    def place_unit(self, unit):
+        """Puts an existing GameUnit on the map at its own x, y location.
+
+        Used when parsing the game state, the unit is added to the units already at its location.
+
+        Args:
+            unit: The GameUnit to place
+
+        """
+        location = [unit.x, unit.y]
+        if not self.in_arena_bounds(location):
+            self._invalid_coordinates(location)
+            return
+
+        x, y = location
+        self.__own_cell(x, y).append(unit)
+        self.__cell_changed(x, y)
+
+    def take_unit(self, location, unit_id):
+        """Removes a single unit, found by the id the engine gave it, from a location.
+
+        Args:
+            location: The location of the unit
+            unit_id: The engine id of the unit
+
+        Returns:
+            The removed GameUnit, or None if no unit with that id is at the location
+
+        """
+        if not self.in_arena_bounds(location):
+            self._invalid_coordinates(location)
+            return None
+
+        x, y = location
+        for unit in self.__map[x][y]:
+            if unit.unit_id == unit_id:
+                break
+        else:
+            return None
+        units = self.__own_cell(x, y)
+        for index, unit in enumerate(units):
+            if unit.unit_id == unit_id:
+                del units[index]
+                self.__cell_changed(x, y)
+                return unit
+
+    def mark_removal(self, location):
+        """Marks the structure at a location as pending removal by its owner.
+
+        Args:
+            location: The location of the structure
+
+        """
+        if not self.in_arena_bounds(location):
+            self._invalid_coordinates(location)
+            return
+
+        x, y = location
+        for unit in self.__own_cell(x, y):
+            if unit.stationary:
+                unit.pending_removal = True
+        self.__cell_changed(x, y)
+
+    def get_structure(self, location):
+        """Gets the structure at a location in constant time
+
+        Args:
+            location: The location to check
+
+        Returns:
+            The structure GameUnit at the location, or None if there is none
+
+        """
+        x, y = location
+        return self.__structures.get((x, y))
+
+    def get_structure_locations(self):
+        """Gets the locations of every structure, which are the cells mobile units cannot path through
+
+        Returns:
+            A live view of (x, y) tuples, copy it before modifying the map
+
+        """
+        return self.__structures.keys()
+
+    def get_layout_key(self):
+        """Gets a Zobrist hash of which cells are blocked, kept up to date as structures are added and removed
+
+        Returns:
+            A 64 bit int, equal for two maps holding structures on the same cells. Different layouts
+            share a value with negligible probability.
+
+        """
+        return self.__layout_hash
+
+    def get_board_hash(self):
+        """Gets a Zobrist hash of every structure's location, type, owner, upgrade, health level and removal mark, kept up to date as the map changes
+
+        Health is split into HEALTH_BUCKETS levels, so small amounts of damage only change the hash when a structure drops a level.
+
+        Returns:
+            A 64 bit int, equal for two maps with the same structures in the same health levels
+
+        """
+        return self.__board_hash
+
+    def get_bitboard(self, player_index=None, unit_type=None):
+        """Gets the cells holding structures as the bits of an int, bit n standing for geometry.cells[n]
+
+        Args:
+            player_index: Only include structures controlled by this player if given
+            unit_type: Only include structures of this type if given, requires player_index
+
+        Returns:
+            An int with a bit set for every matching structure
+
+        """
+        if player_index is None:
+            return self.__blocked_bits
+        if unit_type is None:
+            return self.__player_bits[player_index]
+        return self.__typed_bits[player_index].get(unit_type, 0)
+
+    def has_mobile_units(self, player_index):
+        """Checks in constant time whether any mobile unit of a player is on the map
+
+        Args:
+            player_index: The index corresponding to the player, 0 for you 1 for the enemy
+
+        Returns:
+            True if at least one location holds a mobile unit controlled by the player
+
+        """
+        return bool(self.__mobile_cells[player_index])
+
+    def get_structures(self, player_index, unit_type=None):
+        """Gets the structures controlled by a player, in time proportional to the number returned
+
+        Args:
+            player_index: The index corresponding to the player, 0 for you 1 for the enemy
+            unit_type: Only return structures of this type if given
+
+        Returns:
+            A list of structure GameUnits
+
+        """
+        if unit_type is None:
+            return list(self.__player_structures[player_index].values())
+        return list(self.__typed_structures[player_index].get(unit_type, {}).values())
+
+    def get_damaged_structures(self, player_index, threshold=1.0):
+        """Gets the damaged structures controlled by a player, without scanning the undamaged ones
+
+        Args:
+            player_index: The index corresponding to the player, 0 for you 1 for the enemy
+            threshold: Only return structures whose health is below this fraction of their max health
+
+        Returns:
+            A list of structure GameUnits
+
+        """
+        return [unit for unit in self.__damaged_structures[player_index].values() if unit.health < unit.max_health * threshold]
+
+    def get_structure_changes(self, previous, player_index):
+        """Compares the structures a player controls on this map with those on an earlier map
+
+        Structures shared with the earlier map, such as the unchanged cells of a fork, are skipped without being compared.
+
+        Args:
+            previous: The earlier GameMap
+            player_index: The index corresponding to the player, 0 for you 1 for the enemy
+
+        Returns:
+            A tuple of (added, removed, upgraded, damaged, marked) lists of structure GameUnits. removed holds the units of the
+            earlier map, the others the units of this map. A structure that was destroyed and rebuilt is both removed and added.
+            marked holds the structures that were marked for removal, or no longer are.
+
+        """
+        current = self.__player_structures[player_index]
+        before = previous.__player_structures[player_index]
+        added, upgraded, damaged, marked = [], [], [], []
+        removed = [unit for key, unit in before.items() if key not in current]
+        for key, unit in current.items():
+            old = before.get(key)
+            if old is unit:
+                continue
+            # structures never heal, so one with more health and the same upgrade state was rebuilt
+            if old is None or old.unit_type != unit.unit_type or (unit.health > old.health and unit.upgraded == old.upgraded):
+                added.append(unit)
+                if old is not None:
+                    removed.append(old)
+                continue
+            if unit.upgraded and not old.upgraded:
+                upgraded.append(unit)
+            if unit.health < old.health:
+                damaged.append(unit)
+            if unit.pending_removal != old.pending_removal:
+                marked.append(unit)
+        return added, removed, upgraded, damaged, marked
+
+    def same_layout(self, previous):
+        """Checks if the same cells hold structures on this map and an earlier one, which means every path is unchanged
+
+        Args:
+            previous: The earlier GameMap
+
+        Returns:
+            True if exactly the same cells are blocked on both maps
+
+        """
+        return self.__structures.keys() == previous.__structures.keys()
+
+    def get_structure_signature(self):
+        """Gets a value describing every structure on the map
+
+        Two maps have equal signatures exactly when they hold the same structures with the same owner, health, upgrade and removal state.
+
+        Returns:
+            A frozenset of (x, y, unit_type, player_index, upgraded, health, pending_removal) tuples
+
+        """
+        return frozenset((x, y, unit.unit_type, unit.player_index, unit.upgraded, unit.health, unit.pending_removal)
+            for (x, y), unit in self.__structures.items())
 
     def get_locations_in_range(self, location, radius):
         """Gets locations in a circular area around a location
@@ -212,25 +635,22 @@ class GameMap:
             radius: The radius of our search area
 
         Returns:
-            The locations that are within our search area
+            A new list of [x, y] locations that are within our search area
+
+        """
+        return [list(location) for location in self._locations_in_range(location, radius)]
 
+    def _locations_in_range(self, location, radius):
+        """Same as get_locations_in_range, but returns the cached tuple of (x, y) tuples shared by every caller.
+        For gamelib's own lookups, which never modify it.
         """
         if radius < 0 or radius > self.ARENA_SIZE:
             self.warn("Radius {} was passed to get_locations_in_range. Expected integer between 0 and {}".format(radius, self.ARENA_SIZE))
         if not self.in_arena_bounds(location):
             self._invalid_coordinates(location)
 
-        x, y = location
-        locations = []
-        search_radius = math.ceil(radius)
-        getHitRadius = self.config["unitInformation"][0]['getHitRadius']
-        for i in range(int(x - search_radius), int(x + search_radius + 1)):
-            for j in range(int(y - search_radius), int(y + search_radius + 1)):
-                new_location = [i, j]
-                # A unit with a given range affects all locations who's centers are within that range + get hit radius
-                if self.in_arena_bounds(new_location) and self.distance_between_locations(location, new_location) < radius + getHitRadius:
-                    locations.append(new_location)
-        return locations
+        x, y = map(int, location)
+        return self.geometry.locations_in_range(x, y, radius, self.__hit_radius)
 
     def distance_between_locations(self, location_1, location_2):
         """Euclidean distance
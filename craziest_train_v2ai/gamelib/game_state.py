@@ -1,11 +1,14 @@
 import math
 import json
-import sys
 
-from .navigation import ShortestPathFinder
-from .util import send_command, debug_write
-from .unit import GameUnit
+from .navigation import ArrayPathFinder, PathCache
+from .util import send_command, debug_write, parse_message
+from .unit import GameUnit, UnitStack
 from .game_map import GameMap
+from .board_arrays import np
+from .rules import get_rules
+
+_bound_rules = None
 
 def is_stationary(unit_type):
     """
@@ -17,6 +20,21 @@ def is_stationary(unit_type):
     """
     return unit_type in STRUCTURE_TYPES
 
+MP = 1
+SP = 0
+
+def _bind_globals(rules):
+    """Points the module level unit type constants at a config's Rules. Only needed when the config changes.
+    """
+    global WALL, SUPPORT, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE, STRUCTURE_TYPES, ALL_UNITS, UNIT_TYPE_TO_INDEX, _bound_rules
+    WALL, SUPPORT, TURRET = rules.WALL, rules.SUPPORT, rules.TURRET
+    SCOUT, DEMOLISHER, INTERCEPTOR = rules.SCOUT, rules.DEMOLISHER, rules.INTERCEPTOR
+    REMOVE, UPGRADE = rules.REMOVE, rules.UPGRADE
+    UNIT_TYPE_TO_INDEX = rules.UNIT_TYPE_TO_INDEX
+    STRUCTURE_TYPES = rules.STRUCTURE_TYPES
+    ALL_UNITS = rules.ALL_UNITS
+    _bound_rules = rules
+
 class GameState:
     """Represents the entire gamestate for a given turn
     Provides methods related to resources and unit deployment
@@ -32,6 +50,8 @@ class GameState:
         * REMOVE (str): A constant representing removing your own unit
         * UPGRADE (str): A constant representing upgrading a unit
         * STRUCTURE_TYPES (list): A list of the structure units
+        * rules (:obj: Rules): The rules compiled from the config, shared by every GameState using the same config
+        * path_cache (:obj: PathCache): The cache find_path_to_edge and my_find_path_to_edge look paths up in, shared by every GameState. Set it to None to disable caching
 
         * ARENA_SIZE (int): The size of the arena
         * HALF_ARENA (int): Half the size of the arena
@@ -46,51 +66,31 @@ class GameState:
         * enemy_time (int): Your opponents current remaining time
 
     """
+    path_cache = PathCache()
 
     def __init__(self, config, serialized_string):
         """ Setup a turns variables using arguments passed
 
         Args:
             * config (JSON): A json object containing information about the game
-            * serialized_string (string): A string containing information about the game state at the start of this turn
+            * serialized_string (string): A string containing information about the game state at the start of this turn.
+              A GameMessage or an already decoded dict is used without parsing it again.
 
         """
         self.serialized_string = serialized_string
         self.config = config
+        self.rules = get_rules(config)
         self.enable_warnings = True
-
-        global WALL, SUPPORT, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE, STRUCTURE_TYPES, ALL_UNITS, UNIT_TYPE_TO_INDEX
-        UNIT_TYPE_TO_INDEX = {}
-        WALL = config["unitInformation"][0]["shorthand"]
-        UNIT_TYPE_TO_INDEX[WALL] = 0
-        SUPPORT = config["unitInformation"][1]["shorthand"]
-        UNIT_TYPE_TO_INDEX[SUPPORT] = 1
-        TURRET = config["unitInformation"][2]["shorthand"]
-        UNIT_TYPE_TO_INDEX[TURRET] = 2
-        SCOUT = config["unitInformation"][3]["shorthand"]
-        UNIT_TYPE_TO_INDEX[SCOUT] = 3
-        DEMOLISHER = config["unitInformation"][4]["shorthand"]
-        UNIT_TYPE_TO_INDEX[DEMOLISHER] = 4
-        INTERCEPTOR = config["unitInformation"][5]["shorthand"]
-        UNIT_TYPE_TO_INDEX[INTERCEPTOR] = 5
-        REMOVE = config["unitInformation"][6]["shorthand"]
-        UNIT_TYPE_TO_INDEX[REMOVE] = 6
-        UPGRADE = config["unitInformation"][7]["shorthand"]
-        UNIT_TYPE_TO_INDEX[UPGRADE] = 7
-
-        ALL_UNITS = [SCOUT, DEMOLISHER, INTERCEPTOR, WALL, SUPPORT, TURRET]
-        STRUCTURE_TYPES = [WALL, SUPPORT, TURRET]
+        if self.rules is not _bound_rules:
+            _bind_globals(self.rules)
 
         self.ARENA_SIZE = 28
         self.HALF_ARENA = int(self.ARENA_SIZE / 2)
-        self.MP = 1
-        self.SP = 0
-        global MP, SP
-        MP = self.MP
-        SP = self.SP
+        self.MP = MP
+        self.SP = SP
 
         self.game_map = GameMap(self.config)
-        self._shortest_path_finder = ShortestPathFinder()
+        self._shortest_path_finder = ArrayPathFinder()
         self._build_stack = []
         self._deploy_stack = []
         self._player_resources = [
@@ -101,9 +101,9 @@ class GameState:
     def __parse_state(self, state_line):
         """
         Fills in map based on the serialized game state so that self.game_map[x,y] is a list of GameUnits at that location.
-        state_line is the game state as a json string.
+        state_line is the game state as a json string, GameMessage or decoded dict.
         """
-        state = json.loads(state_line)
+        state = parse_message(state_line)
 
         turn_info = state["turnInfo"]
         self.turn_number = int(turn_info[1])
@@ -131,6 +131,7 @@ class GameState:
         Helper function for __parse_state to add units to the map.
         """
         typedef = self.config.get("unitInformation")
+        REMOVE, UPGRADE = self.rules.REMOVE, self.rules.UPGRADE
         for i, unit_types in enumerate(units):
             for uinfo in unit_types:
                 unit_type = typedef[i].get("shorthand")
@@ -141,16 +142,36 @@ class GameState:
                 if unit_type == REMOVE:
                     # Quick fix will deploy engine fix soon
                     if self.contains_stationary_unit([x,y]):
-                        self.game_map[x,y][0].pending_removal = True
+                        self.game_map.mark_removal([x,y])
                 elif unit_type == UPGRADE:
                     if self.contains_stationary_unit([x,y]):
-                        self.game_map[x,y][0].upgrade()
+                        self.game_map.upgrade_unit([x,y])
                 else:
-                    unit = GameUnit(unit_type, self.config, player_number, hp, x, y)
-                    self.game_map[x,y].append(unit)
+                    unit = GameUnit(unit_type, self.config, player_number, hp, x, y, uinfo[3] if len(uinfo) > 3 else None)
+                    self.game_map.place_unit(unit)
+
+    def fork(self):
+        """Creates a copy of this GameState for simulating hypothetical moves.
+
+        Much cheaper than copy.deepcopy: the config and all unchanged map cells are shared
+        with the original, see GameMap.fork. Resources and the build and deploy stacks are copied,
+        so spawning, removing or hurting units on the copy never affects the original.
+
+        Returns:
+            A new GameState representing the same turn
+
+        """
+        forked = GameState.__new__(GameState)
+        forked.__dict__.update(self.__dict__)
+        forked.game_map = self.game_map.fork()
+        forked._shortest_path_finder = ArrayPathFinder()
+        forked._build_stack = list(self._build_stack)
+        forked._deploy_stack = list(self._deploy_stack)
+        forked._player_resources = [dict(resources) for resources in self._player_resources]
+        return forked
 
     def __resource_required(self, unit_type):
-        return self.SP if is_stationary(unit_type) else self.MP
+        return self.SP if unit_type in self.rules.structure_types else self.MP
 
     def __set_resource(self, resource_type, amount, player_index=0):
         """
@@ -234,7 +255,7 @@ class GameState:
             The number of units affordable of the given unit_type.
 
         """
-        if unit_type not in ALL_UNITS:
+        if unit_type not in self.rules.ALL_UNITS:
             self._invalid_unit(unit_type)
             return
 
@@ -270,13 +291,14 @@ class GameState:
         if type(current_MP) == int and current_MP < 0:
             self.warn("Invalid current MP ({}). Current MP cannot be negative.".format(current_MP))
 
+        rules = self.rules
         MP = self.get_resource(self.MP, player_index) if not current_MP else current_MP
         for increment in range(1, turns_in_future + 1):
             current_turn = self.turn_number + increment
-            MP *= (1 - self.config["resources"]["bitDecayPerRound"])
-            MP_per_round = self.config["resources"]["bitsPerRound"]
-            MP_ramp_ups = current_turn // self.config["resources"]["turnIntervalForBitSchedule"]
-            MP_per_round_growth = self.config["resources"]["bitGrowthRate"]
+            MP *= (1 - rules.bit_decay_per_round)
+            MP_per_round = rules.bits_per_round
+            MP_ramp_ups = current_turn // rules.bit_schedule_interval
+            MP_per_round_growth = rules.bit_growth_rate
             MP_gained = MP_per_round + (MP_per_round_growth * MP_ramp_ups)
             MP += MP_gained
             MP = round(MP, 1)
@@ -292,16 +314,16 @@ class GameState:
             The units costs as a list [SP, MP]
 
         """
-        if unit_type == REMOVE:
+        if unit_type == self.rules.REMOVE:
             self._invalid_unit(unit_type)
             return
-        
-        unit_def = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[unit_type]]
-        cost_base = [unit_def.get('cost1', 0), unit_def.get('cost2', 0)]
-        if upgrade:
-            return [unit_def.get('upgrade', {}).get('cost1', cost_base[SP]), unit_def.get('upgrade', {}).get('cost2', cost_base[MP])]
+        if unit_type not in self.rules.costs:
+            self._invalid_unit(unit_type)
+            return [0, 0]
 
-        return cost_base
+        if upgrade:
+            return list(self.rules.upgrade_costs[unit_type])
+        return list(self.rules.costs[unit_type])
 
 
     def can_spawn(self, unit_type, location, num=1):
@@ -320,7 +342,7 @@ class GameState:
             True if we can spawn the unit(s)
 
         """
-        if unit_type not in ALL_UNITS:
+        if unit_type not in self.rules.ALL_UNITS:
             self._invalid_unit(unit_type)
             return
         
@@ -330,10 +352,10 @@ class GameState:
             return False
 
         affordable = self.number_affordable(unit_type) >= num
-        stationary = is_stationary(unit_type)
+        stationary = self.rules.is_stationary(unit_type)
         blocked = self.contains_stationary_unit(location) or (stationary and len(self.game_map[location[0],location[1]]) > 0)
         correct_territory = location[1] < self.HALF_ARENA
-        on_edge = location in (self.game_map.get_edge_locations(self.game_map.BOTTOM_LEFT) + self.game_map.get_edge_locations(self.game_map.BOTTOM_RIGHT))
+        on_edge = self.game_map.get_edge_of(location) in (self.game_map.BOTTOM_LEFT, self.game_map.BOTTOM_RIGHT)
 
         if self.enable_warnings:
             fail_reason = ""
@@ -367,7 +389,7 @@ class GameState:
         if not locations:
             return 0
         
-        if unit_type not in ALL_UNITS:
+        if unit_type not in self.rules.ALL_UNITS:
             self._invalid_unit(unit_type)
             return
         if num < 1:
@@ -385,7 +407,7 @@ class GameState:
                     self.__set_resource(SP, 0 - costs[SP])
                     self.__set_resource(MP, 0 - costs[MP])
                     self.game_map.add_unit(unit_type, location, 0)
-                    if is_stationary(unit_type):
+                    if self.rules.is_stationary(unit_type):
                         self._build_stack.append((unit_type, x, y))
                     else:
                         self._deploy_stack.append((unit_type, x, y))
@@ -441,13 +463,13 @@ class GameState:
                     if unit.stationary:
                         existing_unit = unit
 
-                if not existing_unit.upgraded and self.config["unitInformation"][UNIT_TYPE_TO_INDEX[existing_unit.unit_type]].get("upgrade", None) is not None:
+                if not existing_unit.upgraded and existing_unit.unit_type in self.rules.upgradable:
                     costs = self.type_cost(existing_unit.unit_type, True)
                     resources = self.get_resources()
                     if resources[SP] >= costs[SP] and resources[MP] >= costs[MP]:
                         self.__set_resource(SP, 0 - costs[SP])
                         self.__set_resource(MP, 0 - costs[MP])
-                        existing_unit.upgrade()
+                        self.game_map.upgrade_unit([x, y])
                         self._build_stack.append((UPGRADE, x, y))
                         spawned_units += 1
             else:
@@ -497,8 +519,7 @@ class GameState:
         if target_edge is None:
             target_edge = self.get_target_edge(start_location)
 
-        end_points = self.game_map.get_edge_locations(target_edge)
-        return self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
+        return self.__cached_path(start_location, target_edge, 0)
     
     def my_find_path_to_edge(self, start_location, prev_dir, target_edge=None):
         """Gets the path a unit at a given location would take. 
@@ -520,8 +541,50 @@ class GameState:
         if target_edge is None:
             target_edge = self.get_target_edge(start_location)
 
+        return self.__cached_path(start_location, target_edge, prev_dir)
+
+    def path_field(self, target_edge):
+        """Measures the distance of every cell to an edge with a single search, to find the paths of many units at once
+
+        Args:
+            target_edge: The edge the units want to reach. game_map.TOP_LEFT, game_map.BOTTOM_RIGHT, etc.
+
+        Returns:
+            A PathField whose path_from(start_location, prev_dir=0) gives the same path as my_find_path_to_edge(start_location, prev_dir, target_edge).
+            It is only valid until a structure is added to or removed from the map.
+
+        """
+        return self._shortest_path_finder.path_field(self.game_map.get_edge_locations(target_edge), self)
+
+    def find_paths_to_edge(self, start_locations, target_edge):
+        """Gets the paths units at many locations would take to the same edge, for the cost of about one find_path_to_edge
+
+        Args:
+            start_locations: The locations of hypothetical units
+            target_edge: The edge the units want to reach. game_map.TOP_LEFT, game_map.BOTTOM_RIGHT, etc.
+
+        Returns:
+            A list with the path of every start location, see find_path_to_edge, or None for blocked start locations
+
+        """
+        field = self.path_field(target_edge)
+        return [field.path_from(location) for location in start_locations]
+
+    def __cached_path(self, start_location, target_edge, prev_dir):
+        """Finds a path through the path cache, moving in no particular direction first is the same as prev_dir 0
+        """
+        # tuple locations never match an end point in the path finder, so only lists share cached paths
+        cache = self.path_cache if type(start_location) is list else None
+        if cache is not None:
+            key = (self.game_map.get_layout_key(), start_location[0], start_location[1], target_edge, prev_dir)
+            path = cache.get(key)
+            if path is not None:
+                return path
         end_points = self.game_map.get_edge_locations(target_edge)
-        return self._shortest_path_finder.my_navigate_multiple_endpoints(start_location, end_points, self, prev_dir)
+        path = self._shortest_path_finder.my_navigate_multiple_endpoints(start_location, end_points, self, prev_dir)
+        if cache is not None and path is not None:
+            cache.put(key, path)
+        return path
 
     def contains_stationary_unit(self, location):
         """Check if a location is blocked, return structures unit if it is
@@ -536,11 +599,62 @@ class GameState:
         if not self.game_map.in_arena_bounds(location):
             self.warn('Checked for stationary unit outside of arena bounds')
             return False
-        x, y = map(int, location)
-        for unit in self.game_map[x,y]:
-            if unit.stationary:
-                return unit
-        return False
+        return self.game_map.get_structure(location) or False
+
+    def structures(self, player_index=0, unit_type=None):
+        """Gets the structures a player controls, in time proportional to the number returned
+
+        Args:
+            player_index: The index corresponding to the player whos structures you are querying, 0 for you 1 for the enemy
+            unit_type: Only return structures of this type (WALL, SUPPORT or TURRET) if given
+
+        Returns:
+            A list of structure GameUnits
+
+        """
+        if not player_index == 1 and not player_index == 0:
+            self._invalid_player_index(player_index)
+            return []
+        return self.game_map.get_structures(player_index, unit_type)
+
+    def damaged_structures(self, player_index=0, threshold=1.0):
+        """Gets the damaged structures a player controls, without scanning the undamaged ones
+
+        Args:
+            player_index: The index corresponding to the player whos structures you are querying, 0 for you 1 for the enemy
+            threshold: Only return structures whose health is below this fraction of their max health, 1.0 returns every damaged structure
+
+        Returns:
+            A list of structure GameUnits
+
+        """
+        if not player_index == 1 and not player_index == 0:
+            self._invalid_player_index(player_index)
+            return []
+        return self.game_map.get_damaged_structures(player_index, threshold)
+
+    def diff(self, previous):
+        """Finds what changed on the board since an earlier GameState, such as last turn's
+
+        Only the structure indexes of the two maps are compared, and structures they share are skipped,
+        so diffing a state against the state it was forked or tracked from is cheap.
+
+        Args:
+            previous: The earlier GameState
+
+        Returns:
+            A dict with the following keys:
+            * 'added', 'removed', 'upgraded', 'damaged', 'marked': For each player index, a list of structure GameUnits.
+              removed holds the units of previous, the others the units of this state. See GameMap.get_structure_changes
+            * 'layout_changed': True if a cell was blocked or unblocked, False means every path is unchanged
+            * 'changed': True if any structure changed at all
+
+        """
+        changes = [self.game_map.get_structure_changes(previous.game_map, player_index) for player_index in (0, 1)]
+        delta = {key: [changes[0][index], changes[1][index]] for index, key in enumerate(('added', 'removed', 'upgraded', 'damaged', 'marked'))}
+        delta['layout_changed'] = not self.game_map.same_layout(previous.game_map)
+        delta['changed'] = any(units for player_changes in changes for units in player_changes)
+        return delta
 
     def warn(self, message):
         """ Used internally by game_state to print warnings
@@ -568,76 +682,68 @@ class GameState:
             Infantry > Nearest Unit > Lowest Health > Lowest Y position > Closest to edge (Highest distance of X from the boards center, 13.5)
 
         Args:
-            attacking_unit: A GameUnit
+            attacking_unit: A GameUnit, or a UnitStack since every unit in a stack picks the same target
 
         Returns:
             The GameUnit this unit would choose to attack.
 
         """
 
-        if not isinstance(attacking_unit, GameUnit):
+        if not isinstance(attacking_unit, (GameUnit, UnitStack)):
             self.warn("Passed a {} to get_target as attacking_unit. Expected a GameUnit.".format(type(attacking_unit)))
             return
 
-        attacker_location = [attacking_unit.x, attacking_unit.y]
-        possible_locations = self.game_map.get_locations_in_range(attacker_location, attacking_unit.attackRange)
-        target = None
-        target_stationary = True
-        target_distance = sys.maxsize
-        target_health = sys.maxsize
-        target_y = self.ARENA_SIZE
-        target_x_distance = 0
-
-        for location in possible_locations:
-            for unit in self.game_map[location]:
-                if unit.player_index == attacking_unit.player_index or (attacking_unit.damage_f == 0 and is_stationary(unit.unit_type)) or (attacking_unit.damage_i == 0 and not(is_stationary(unit.unit_type))):
-                    continue
-
-                new_target = False
-                unit_stationary = unit.stationary
-                unit_distance = self.game_map.distance_between_locations(location, [attacking_unit.x, attacking_unit.y])
-                unit_health = unit.health
-                unit_y = unit.y
-                unit_x_distance = abs(self.HALF_ARENA - 0.5 - unit.x)
-
-                if target_stationary and not unit_stationary:
-                    new_target = True
-                elif not target_stationary and unit_stationary:
-                    continue
-                
-                if target_distance > unit_distance:
-                    new_target = True
-                elif target_distance < unit_distance and not new_target:
+        game_map = self.game_map
+        player_index = attacking_unit.player_index
+        damage_f = attacking_unit.damage_f
+        damage_i = attacking_unit.damage_i
+        x, y = attacking_unit.x, attacking_unit.y
+        if not game_map.in_arena_bounds([x, y]):
+            game_map._invalid_coordinates([x, y])
+        # the locations come in priority order but for health, so the target is the unit with the lowest health
+        # among the first equally distant locations holding one, and mobile units are only beaten by closer mobile units
+        targets = game_map.geometry.targets_in_range(x, y, attacking_unit.attackRange, self.rules.hit_radius, 0 if player_index == 0 else 1)
+        if player_index in (0, 1):
+            enemy_mobile_units = game_map.has_mobile_units(1 - player_index)
+        else:
+            enemy_mobile_units = game_map.has_mobile_units(0) or game_map.has_mobile_units(1)
+        if damage_i == 0 or not enemy_mobile_units:
+            # only structures can be targeted, and the bitboards tell if any are in range at all
+            enemy_structures = game_map.get_bitboard(1 - player_index) if player_index in (0, 1) else game_map.get_bitboard()
+            if damage_f == 0 or not enemy_structures & game_map.geometry.bits_in_range(x, y, attacking_unit.attackRange, self.rules.hit_radius):
+                return None
+            target = None
+            target_distance = None
+            for target_x, target_y, distance in targets:
+                if target is not None and distance != target_distance:
+                    break
+                unit = game_map.get_structure((target_x, target_y))
+                if unit is None or unit.player_index == player_index:
                     continue
+                if target is None or unit.health < target.health:
+                    target = unit
+                    target_distance = distance
+            return target
 
-                if target_health > unit_health:
-                    new_target = True
-                elif target_health < unit_health and not new_target:
+        target = None
+        target_distance = None
+        structure = None
+        structure_distance = None
+        for target_x, target_y, distance in targets:
+            if target is not None and distance != target_distance:
+                break
+            for unit in game_map[target_x, target_y]:
+                if unit.player_index == player_index:
                     continue
-
-                # Compare height heuristic relative to attacking unit's player index
-                if attacking_unit.player_index == 0:
-                    if target_y > unit_y:
-                        new_target = True
-                    elif target_y < unit_y and not new_target:
+                if unit.stationary:
+                    if damage_f == 0 or target is not None or (structure is not None and (distance != structure_distance or unit.health >= structure.health)):
                         continue
-                else:
-                    if target_y < unit_y:
-                        new_target = True
-                    elif target_y > unit_y and not new_target:
-                        continue
-
-                if target_x_distance < unit_x_distance:
-                    new_target = True
-                
-                if new_target:
+                    structure = unit
+                    structure_distance = distance
+                elif target is None or unit.health < target.health:
                     target = unit
-                    target_stationary = unit_stationary
-                    target_distance = unit_distance
-                    target_health = unit_health
-                    target_y = unit_y
-                    target_x_distance = unit_x_distance
-        return target
+                    target_distance = distance
+        return target if target is not None else structure
 
     def get_attackers(self, location, player_index):
         """Gets the stationary units threatening a given location
@@ -660,17 +766,47 @@ class GameState:
         """
         Get locations in the range of TURRET units
         """
-        max_range = 0
-        for unit in self.config["unitInformation"]:
-            if unit.get('attackRange', 0) >= max_range:
-                max_range = unit.get('attackRange', 0)
-        possible_locations= self.game_map.get_locations_in_range(location, max_range)
+        possible_locations= self.game_map._locations_in_range(location, self.rules.max_attack_range)
         for location_unit in possible_locations:
             for unit in self.game_map[location_unit]:
                 if unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and self.game_map.distance_between_locations(location, location_unit) <= unit.attackRange:
                     attackers.append(unit)
         return attackers
 
+    def threat_map(self, player_index=0):
+        """Gets the damage per frame enemy turrets deal to a mobile unit of a player at every location
+
+        Args:
+            player_index: The index corresponding to the player whose units are attacked, 0 for you 1 for the enemy
+
+        Returns:
+            A numpy array indexed with [x, y], see BoardArrays.threat. It is kept up to date as structures are added,
+            removed and upgraded, do not modify it. Requires numpy.
+
+        """
+        if not player_index == 0 and not player_index == 1:
+            self._invalid_player_index(player_index)
+        return self.game_map.arrays.threat[1 - player_index]
+
+    def path_damage(self, path, player_index=0):
+        """Gets the damage per frame enemy turrets deal to a mobile unit of a player along a path, summed over its locations
+
+        A unit spends 1 / speed frames on every location, so the damage it takes walking the path
+        is this sum divided by its speed. Requires numpy.
+
+        Args:
+            path: A list of locations, such as one returned by find_path_to_edge
+            player_index: The index corresponding to the player whose units are attacked, 0 for you 1 for the enemy
+
+        Returns:
+            The summed damage per frame
+
+        """
+        if not path:
+            return 0.
+        threat = self.threat_map(player_index)
+        return float(threat[[location[0] for location in path], [location[1] for location in path]].sum())
+
     def get_band(self, path, radius):
         band = []
         for attacker_location in path:
@@ -680,19 +816,106 @@ class GameState:
         return res
 
 
+    def evaluate_attacks(self, candidates, cancelled=None):
+        """Scores a batch of attacks on the current board, each as if it were the only one, see attack_score
+
+        The whole batch shares this GameState: its threat map, its path cache, one path field per target edge
+        and the supports in reach of every cell are measured once, before the first attack, and the changes
+        each attack makes to the board are rolled back before the next one. Repeated candidates are scored once.
+
+        Args:
+            candidates: A list of (deploy_location, deploy_number, unit_type)
+            cancelled: A threading.Event, scoring stops before the next candidate once it is set
+
+        Returns:
+            A list with the attack_score result of every candidate, in the same order, or None if cancelled
+
+        """
+        supports = self.__support_coverage()
+        fields = {}
+        table = {}
+        results = []
+        for deploy_location, deploy_number, unit_type in candidates:
+            key = (tuple(deploy_location), deploy_number, unit_type)
+            if key not in table:
+                if cancelled is not None and cancelled.is_set():
+                    return None
+                self.game_map.start_transaction()
+                try:
+                    table[key] = self.__attack_score(deploy_location, deploy_number, unit_type, False, supports, fields)
+                finally:
+                    self.game_map.rollback()
+            results.append(table[key])
+        return results
+
+    def __support_coverage(self):
+        """Gets the supports attack_score counts, the structures of type SUPPORT on the bottom half of the board
+
+        Returns:
+            Their cells as the bits of an int, and a dict from cell index to the shields each one gives
+
+        """
+        game_map = self.game_map
+        cells = game_map.geometry.cells
+        bits = (game_map.get_bitboard(0, SUPPORT) | game_map.get_bitboard(1, SUPPORT)) & game_map.geometry.half_bits[0]
+        shields = {}
+        remaining = bits
+        while remaining:
+            low = remaining & -remaining
+            remaining ^= low
+            index = low.bit_length() - 1
+            x, y = cells[index]
+            support = game_map.get_structure([x, y])
+            shields[index] = (support.shieldPerUnit, y * .7) if support.upgraded else (support.shieldPerUnit,)
+        return bits, shields
+
+    def __path_shields(self, path, supports):
+        """Gets the shields of the supports within 7 of a path, in the order get_band(path, 7) lists them
+        """
+        bits, shields = supports
+        game_map = self.game_map
+        geometry = game_map.geometry
+        hit_radius = self.rules.hit_radius
+        amounts = []
+        for x, y in path:
+            if not bits:
+                break
+            reached = bits & geometry.bits_in_range(x, y, 7, hit_radius)
+            if not reached:
+                continue
+            bits ^= reached
+            # a band lists the cells around each path cell by x and then by y
+            found = []
+            while reached:
+                low = reached & -reached
+                reached ^= low
+                index = low.bit_length() - 1
+                found.append((geometry.cells[index], index))
+            for _, index in sorted(found):
+                amounts.extend(shields[index])
+        return amounts
+
     def attack_score(self, deploy_location, deploy_number, unit_type, debug = False):
+        return self.__attack_score(deploy_location, deploy_number, unit_type, debug, self.__support_coverage(), None)
+
+    def __attack_score(self, deploy_location, deploy_number, unit_type, debug, supports, fields):
         #kill_bonus = {'FF' : {False : 20, True : 60}, 'DF' : {False : 20, True : 60}, 'EF' : {False : 20, True : 60}}
 
         target_edge = None
-        if deploy_location in self.game_map.get_edge_locations(self.game_map.BOTTOM_LEFT):
+        if self.game_map.get_edge_of(deploy_location) == self.game_map.BOTTOM_LEFT:
             target_edge = self.game_map.TOP_RIGHT
         else:
             target_edge = self.game_map.TOP_LEFT
         path = self.find_path_to_edge(deploy_location, target_edge)
+        # distances to the target edge, measured at the first kill and repaired around every later one.
+        # A batch measures them once on the untouched board, and each attack repairs its own copy
+        field = None
+        if fields is not None and target_edge not in fields:
+            fields[target_edge] = self.path_field(target_edge)
         score, dam_score, kill_score, edge_score = 0,0,0,0
-        unit_health = GameUnit(unit_type, self.config).max_health
-        #total_health = GameUnit(DEMOLISHER, self.config).max_health
-        number_left = deploy_number
+        # every deployed unit is identical, so the whole group is simulated as one stack
+        stack = UnitStack(unit_type, self.config, deploy_number, 0, deploy_location[0], deploy_location[1])
+        stay_time = int(1./stack.speed + 0.5)
         '''
         band = self.get_band(path, 3.5)
         for location in band:
@@ -700,18 +923,14 @@ class GameState:
                     if unit.player_index == 0 and unit.unit_type == SUPPORT:
                         unit_health += unit.shieldPerUnit
         '''
-        support_band = self.get_band(path, 7)
-        for loc in support_band:
-            if loc[1] <= 13 and self.contains_stationary_unit(loc) and self.game_map[loc][0].unit_type == SUPPORT:
-                sup = self.game_map[loc][0]
-                unit_health += sup.shieldPerUnit
-                if sup.upgraded:
-                    unit_health += loc[1] * .7
-        #debug_write('Unit health: ' + str(unit_health))
+        for amount in self.__path_shields(path, supports):
+            stack.add_shield(amount)
+        #debug_write('Unit health: ' + str(stack.max_health))
         #debug_write('Number deployed: ' + str(deploy_number))
-        last_health = unit_health
         attacker_location = deploy_location
         total_path = []
+        # enemy turrets are the only attackers on a turn's board, get_attackers is only searched where they reach
+        threat = self.threat_map(0) if np is not None else None
     #    if deploy_location == [13,0] and unit_type == DEMOLISHER:
     #        debug_write('Unit_health %d, deploy_number %d ' % (unit_health, number_left))
         while len(path) > 0:
@@ -719,51 +938,64 @@ class GameState:
             #debug_write(str(path))
             for attacker_location in path:
                 if debug:
-                    debug_write('Stats: ', attacker_location, number_left)
+                    debug_write('Stats: ', attacker_location, stack.count)
                 total_path.append(attacker_location)
-                attacking_unit = GameUnit(unit_type, self.config, 0, None, attacker_location[0], attacker_location[1])
-                stay_time = int(1./attacking_unit.speed + 0.5)
+                stack.x, stack.y = attacker_location
                 # points from attacking:
 
                 killed = False
                 for i in range(stay_time):
-                    for unit in self.get_attackers(attacker_location, 0):
+                    for unit in (self.get_attackers(attacker_location, 0) if threat is None or threat[stack.x, stack.y] > 0 else ()):
                         if debug:
                             debug_write('Attacker: ', attacker_location, unit)
                             debug_write('Damage: ', unit.damage_i)
-                            debug_write('Last health: ', last_health)
+                            debug_write('Last health: ', stack.health)
                         #debug_write('Attacking unit location: ' + str([unit.x, unit.y]))
-                        if unit.damage_i >= last_health:
-                            last_health = unit_health
-                            number_left -= 1
+                        stack.take_hit(unit.damage_i)
+
+                    # a target keeps being the best choice until it dies, so each target is found once
+                    # and hit by as many units of the stack as it takes to kill it. As when every unit shot
+                    # on its own, the killing shot's overkill is lost and the next shots go to the next target
+                    shots = stack.count
+                    while shots > 0:
+                        best_unit = self.get_target(stack)
+                        if not best_unit:
+                            break
+                        #debug_write('Found a target with health: ' + str(best_unit.health))
+                        best_loc = [best_unit.x, best_unit.y]
+                        cost = best_unit.cost[0]
+                        max_health = best_unit.max_health
+                        health = best_unit.health
+                        dealt = 0
+                        dead = False
+                        while shots > 0 and not dead:
+                            shots -= 1
+                            damage = min(health, stack.damage_f)
+                            score += 20 * cost * damage / max_health
+                            dam_score += 20 * cost * damage / max_health
+                            dead = health == damage
+                            health -= damage
+                            dealt += damage
+                        #targets[tuple(best_loc)] -= damage
+                        if dead:
+                            self.game_map.remove_unit(best_loc)
+                            if field is None and fields is not None:
+                                field = fields[target_edge].copy()
+                            if field is not None:
+                                field.unblock(best_loc)
+                            killed = True
+                        #    if debug:
+                        #        debug_write('Just killed: ', attacker_location, best_loc)
+                            score += cost * 10
+                            kill_score += cost * 10
                         else:
-                            last_health -= unit.damage_i
-
-                    for j in range(number_left):
-                        best_unit = self.get_target(attacking_unit)
-                        if best_unit:
-                            #debug_write('Found a target with health: ' + str(best_unit.health))
-                            best_loc = [best_unit.x, best_unit.y]
-                            damage = min(best_unit.health, attacking_unit.damage_f)
-                            score += 20 * best_unit.cost[0] * damage / best_unit.max_health
-                            dam_score += 20 * best_unit.cost[0] * damage / best_unit.max_health
-                            #targets[tuple(best_loc)] -= damage
-                            if best_unit.health == damage:
-                                self.game_map.remove_unit(best_loc)
-                                killed = True
-                            #    if debug:
-                            #        debug_write('Just killed: ', attacker_location, best_loc)
-                                score += best_unit.cost[0] * 10
-                                kill_score += best_unit.cost[0] * 10
-                            else:
-                                self.game_map.hurt_unit(best_loc, damage)
+                            self.game_map.hurt_unit(best_loc, dealt)
                 
-                opp_edge = self.game_map.get_edge_locations(target_edge)
-                if attacker_location in opp_edge:
-                    score += 1000 * number_left
-                    edge_score += 1000 * number_left
+                if self.game_map.get_edge_of(attacker_location) == target_edge:
+                    score += 1000 * stack.count
+                    edge_score += 1000 * stack.count
 
-                if number_left < 1:
+                if stack.count < 1:
                     break
 
                 if killed:
@@ -771,14 +1003,16 @@ class GameState:
                         prev_dir = 2
                     else:
                         prev_dir = 1
-                    new_path = self.my_find_path_to_edge(attacker_location, prev_dir, target_edge)
+                    if field is None:
+                        field = self.path_field(target_edge)
+                    new_path = field.path_from(attacker_location, prev_dir)
              #       if debug:
              #           debug_write('New path: ', new_path)
                     break
                 
-            if number_left < 1 or len(new_path) < 1:
+            if stack.count < 1 or len(new_path) < 1:
                 break
             path = new_path[1:].copy()
 
 
-        return {'score' : score, 'dam_score' : dam_score, 'kill_score' : kill_score, 'edge_score' : edge_score, 'total_path' : total_path, 'number_left' : number_left} 
+        return {'score' : score, 'dam_score' : dam_score, 'kill_score' : kill_score, 'edge_score' : edge_score, 'total_path' : total_path, 'number_left' : stack.count} 
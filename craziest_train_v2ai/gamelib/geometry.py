@@ -0,0 +1,244 @@
+"""
+Static tables describing the shape of the board.
+They only depend on the size of the arena, so they are built once and shared by every GameMap and ShortestPathFinder.
+"""
+
+import math
+import hashlib
+
+TOP_RIGHT = 0
+TOP_LEFT = 1
+BOTTOM_LEFT = 2
+BOTTOM_RIGHT = 3
+
+
+class BoardGeometry:
+    """Holds the precomputed geometry of a diamond shaped board. Do not modify its attributes.
+
+    Attributes :
+        * ARENA_SIZE (int): The size of the arena
+        * HALF_ARENA (int): Half the size of the arena
+        * in_bounds (tuple): in_bounds[x][y] is True if [x, y] is on the board, for 0 <= x, y < ARENA_SIZE
+        * cells (tuple): The (x, y) location of every cell on the board, ordered by index
+        * cell_set (frozenset): The same locations as a set, for fast bounds checks
+        * cell_index (tuple): cell_index[x][y] is the index of [x, y] in cells, or -1 if it is off the board
+        * edges (tuple): The four edges as tuples of (x, y) locations, indexed by TOP_RIGHT, TOP_LEFT, BOTTOM_LEFT and BOTTOM_RIGHT
+        * edge_sets (tuple): The four edges as frozensets of (x, y) locations
+        * edge_of (dict): Maps the (x, y) location of every edge cell to the edge it belongs to
+        * half_bits (tuple): The cells of the bottom and of the top half of the board as the bits of an int, see GameMap.get_bitboard
+        * neighbors (tuple): neighbors[index] holds the indices of the cells above, below, right and left of cells[index],
+          in that order, with len(cells) standing in for locations off the board
+
+    Circular areas are described by stencils, the offsets within a radius of a cell. 
+    The area around each cell is clipped against the board the first time it is requested and cached from then on.
+
+    """
+    def __init__(self, arena_size):
+        """Builds the tables for a board of the given size
+
+        Args:
+            arena_size (int): The size of the arena
+
+        """
+        self.ARENA_SIZE = arena_size
+        self.HALF_ARENA = arena_size // 2
+
+        in_bounds = [[self.__compute_in_bounds(x, y) for y in range(arena_size)] for x in range(arena_size)]
+        self.in_bounds = tuple(tuple(column) for column in in_bounds)
+
+        cells = []
+        cell_index = [[-1] * arena_size for _ in range(arena_size)]
+        for y in range(arena_size):
+            for x in range(arena_size):
+                if in_bounds[x][y]:
+                    cell_index[x][y] = len(cells)
+                    cells.append((x, y))
+        self.cells = tuple(cells)
+        self.cell_set = frozenset(cells)
+        self.cell_index = tuple(tuple(column) for column in cell_index)
+        bottom = sum(1 << index for index, (x, y) in enumerate(cells) if y < self.HALF_ARENA)
+        self.half_bits = (bottom, ((1 << len(cells)) - 1) ^ bottom)
+        off_board = len(cells)
+        self.neighbors = tuple(
+            tuple(cell_index[i][j] if 0 <= i < arena_size and 0 <= j < arena_size and in_bounds[i][j] else off_board
+                for i, j in ((x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)))
+            for x, y in cells)
+
+        half = self.HALF_ARENA
+        top_right = tuple((half + num, arena_size - 1 - num) for num in range(half))
+        top_left = tuple((half - 1 - num, arena_size - 1 - num) for num in range(half))
+        bottom_left = tuple((half - 1 - num, num) for num in range(half))
+        bottom_right = tuple((half + num, num) for num in range(half))
+        self.edges = (top_right, top_left, bottom_left, bottom_right)
+        self.edge_sets = tuple(frozenset(edge) for edge in self.edges)
+        self.edge_of = {}
+        for edge, locations in enumerate(self.edges):
+            for location in locations:
+                self.edge_of[location] = edge
+        self.__stencils = {}
+        self.__ranges = {}
+        self.__index_ranges = {}
+        self.__target_orders = {}
+        self.__range_bits = {}
+
+    def stencil(self, radius, hit_radius=0):
+        """Gets the offsets of every location within a radius of a cell
+
+        Args:
+            radius: The radius of the area
+            hit_radius: Extra distance added to the radius, locations whose centers are closer than radius + hit_radius are included
+
+        Returns:
+            A tuple of (dx, dy) offsets, ordered by dx and then by dy
+
+        """
+        key = (radius, hit_radius)
+        stencil = self.__stencils.get(key)
+        if stencil is None:
+            search_radius = int(math.ceil(radius))
+            stencil = tuple((dx, dy)
+                for dx in range(-search_radius, search_radius + 1)
+                for dy in range(-search_radius, search_radius + 1)
+                if math.sqrt(dx ** 2 + dy ** 2) < radius + hit_radius)
+            self.__stencils[key] = stencil
+        return stencil
+
+    def locations_in_range(self, x, y, radius, hit_radius=0):
+        """Gets the board locations within a radius of a location
+
+        Args:
+            x, y: The center of the area
+            radius: The radius of the area
+            hit_radius: Extra distance added to the radius, see stencil
+
+        Returns:
+            A shared tuple of (x, y) locations on the board, ordered by x and then by y
+
+        """
+        key = (radius, hit_radius)
+        index = self.cell_index[x][y] if 0 <= x < self.ARENA_SIZE and 0 <= y < self.ARENA_SIZE else -1
+        if index < 0:
+            return self.__clip(x, y, self.stencil(radius, hit_radius))
+        ranges = self.__ranges.get(key)
+        if ranges is None:
+            ranges = self.__ranges[key] = [None] * len(self.cells)
+        locations = ranges[index]
+        if locations is None:
+            locations = ranges[index] = self.__clip(x, y, self.stencil(radius, hit_radius))
+        return locations
+
+    def indices_in_range(self, x, y, radius, hit_radius=0):
+        """Same as locations_in_range, but gets the cell indices of the locations
+
+        Returns:
+            A shared tuple of indices into cells
+
+        """
+        key = (x, y, radius, hit_radius)
+        indices = self.__index_ranges.get(key)
+        if indices is None:
+            cell_index = self.cell_index
+            indices = self.__index_ranges[key] = tuple(cell_index[i][j] for i, j in self.locations_in_range(x, y, radius, hit_radius))
+        return indices
+
+    def bits_in_range(self, x, y, radius, hit_radius=0):
+        """Same as indices_in_range, but as an int with the bit of every index set, to intersect with GameMap.get_bitboard
+
+        Returns:
+            An int
+
+        """
+        key = (x, y, radius, hit_radius)
+        bits = self.__range_bits.get(key)
+        if bits is None:
+            bits = 0
+            for index in self.indices_in_range(x, y, radius, hit_radius):
+                bits |= 1 << index
+            self.__range_bits[key] = bits
+        return bits
+
+    def targets_in_range(self, x, y, radius, hit_radius=0, player_index=0):
+        """Same as locations_in_range, but in the order a unit at x, y prefers to target units at those locations
+
+        Locations are ordered by the parts of the targeting priority that do not depend on the units on them:
+        nearest first, then lowest y for player 0 and highest y for player 1, then furthest x from the center of the board.
+        The priority only weighs health between distance and y, so the target is the unit with the lowest
+        health among the first locations with the same distance that hold one.
+
+        Args:
+            x, y: The location of the attacking unit
+            radius: The attack range of the unit
+            hit_radius: Extra distance added to the radius, see stencil
+            player_index: The player controlling the attacking unit, 0 for you 1 for the enemy
+
+        Returns:
+            A shared tuple of (x, y, squared distance) tuples
+
+        """
+        key = (x, y, radius, hit_radius, player_index == 0)
+        targets = self.__target_orders.get(key)
+        if targets is None:
+            center = self.HALF_ARENA - 0.5
+            direction = 1 if player_index == 0 else -1
+            targets = tuple(sorted(((i, j, (i - x) ** 2 + (j - y) ** 2) for i, j in self.locations_in_range(x, y, radius, hit_radius)),
+                key=lambda target: (target[2], direction * target[1], -abs(center - target[0]))))
+            self.__target_orders[key] = targets
+        return targets
+
+    def __clip(self, x, y, stencil):
+        cell_set = self.cell_set
+        return tuple((x + dx, y + dy) for dx, dy in stencil if (x + dx, y + dy) in cell_set)
+
+    def __compute_in_bounds(self, x, y):
+        half_board = self.HALF_ARENA
+
+        row_size = y + 1
+        startx = half_board - row_size
+        endx = startx + (2 * row_size) - 1
+        top_half_check = (y < half_board and x >= startx and x <= endx)
+
+        row_size = (self.ARENA_SIZE - 1 - y) + 1
+        startx = half_board - row_size
+        endx = startx + (2 * row_size) - 1
+        bottom_half_check = (y >= half_board and x >= startx and x <= endx)
+
+        return bottom_half_check or top_half_check
+
+
+_geometries = {}
+
+def get_geometry(arena_size=28):
+    """Gets the shared BoardGeometry for an arena size, building it the first time it is requested
+
+    Args:
+        arena_size (int): The size of the arena
+
+    Returns:
+        The BoardGeometry for that arena size
+
+    """
+    geometry = _geometries.get(arena_size)
+    if geometry is None:
+        geometry = _geometries[arena_size] = BoardGeometry(arena_size)
+    return geometry
+
+
+_zobrist_keys = {}
+
+def zobrist_key(*parts):
+    """Gets the random 64 bit number standing for a piece of board state, for Zobrist hashing
+
+    The numbers are derived from the parts themselves, so they are the same in every process and
+    no matter in which order they are first requested.
+
+    Args:
+        parts: Hashable values describing the state, such as a location and the structure on it
+
+    Returns:
+        A 64 bit int
+
+    """
+    key = _zobrist_keys.get(parts)
+    if key is None:
+        key = _zobrist_keys[parts] = int.from_bytes(hashlib.blake2b(repr(parts).encode(), digest_size=8).digest(), "little")
+    return key
@@ -2,7 +2,10 @@ import heapq
 import math
 import sys
 import queue
+import threading
+from collections import OrderedDict
 from .util import debug_write
+from .geometry import get_geometry
 
 class Node:
     """A pathfinding node
@@ -34,12 +37,14 @@ class ShortestPathFinder:
 
         * game_state (:obj: GameState): The current gamestate
         * game_map (:obj: GameMap): The current gamemap
+        * geometry (:obj: BoardGeometry): Precomputed bounds and edge tables shared with GameMap
 
     """
     def __init__(self):
         self.HORIZONTAL = 1
         self.VERTICAL = 2
         self.initialized = False
+        self.geometry = get_geometry()
 
     def initialize_map(self, game_state):
         """Initializes the map
@@ -50,6 +55,7 @@ class ShortestPathFinder:
         #Initialize map 
         self.initialized = True
         self.game_state = game_state
+        self.geometry = game_state.game_map.geometry
         self.game_map = [[Node() for x in range(self.game_state.ARENA_SIZE)] for y in range(self.game_state.ARENA_SIZE)]
 
     def navigate_multiple_endpoints(self, start_point, end_points, game_state):
@@ -71,7 +77,7 @@ class ShortestPathFinder:
         #Initialize map 
         self.initialize_map(game_state)
         #Fill in walls
-        for location in self.game_state.game_map:
+        for location in self.geometry.cells:
             if self.game_state.contains_stationary_unit(location):
                 self.game_map[location[0]][location[1]].blocked = True
         #Do pathfinding
@@ -98,7 +104,7 @@ class ShortestPathFinder:
         #Initialize map 
         self.initialize_map(game_state)
         #Fill in walls
-        for location in self.game_state.game_map:
+        for location in self.geometry.cells:
             if self.game_state.contains_stationary_unit(location):
                 self.game_map[location[0]][location[1]].blocked = True
         #Do pathfinding
@@ -365,3 +371,447 @@ class ShortestPathFinder:
             sys.stderr.write(" ")
         sys.stderr.write(str(number))
         sys.stderr.write(" ")
+
+
+class ArrayPathFinder(ShortestPathFinder):
+    """Handles pathfinding with flat arrays indexed like geometry.cells instead of a grid of Nodes
+
+    Gives exactly the same paths as ShortestPathFinder, including its tie breaking, but never allocates
+    a Node per cell: the blocked cells are read from the map's structure index, both searches are breadth
+    first over a plain list, and the buffers are kept between calls. The idealness of every cell
+    is computed once per set of end points and shared by every finder.
+
+    Attributes :
+        * pathlength (list): After a search, pathlength[index] is the distance of cells[index] to the target, -1 if unreached
+
+    """
+    _end_point_tables = {}
+
+    def __init__(self):
+        super().__init__()
+        self.pathlength = None
+        self.__walls = None
+
+    def navigate_multiple_endpoints(self, start_point, end_points, game_state):
+        """Finds the path a unit would take to reach a set of endpoints, see ShortestPathFinder.navigate_multiple_endpoints
+        """
+        if game_state.contains_stationary_unit(start_point):
+            return
+        path = self.__navigate(start_point, end_points, game_state, 0)
+        if path is None:
+            return super().navigate_multiple_endpoints(start_point, end_points, game_state)
+        return path
+
+    def my_navigate_multiple_endpoints(self, start_point, end_points, game_state, prev_dir):
+        """Finds the path a unit would take to reach a set of endpoints after moving in prev_dir, see ShortestPathFinder.my_navigate_multiple_endpoints
+        """
+        if game_state.contains_stationary_unit(start_point):
+            return
+        path = self.__navigate(start_point, end_points, game_state, prev_dir)
+        if path is None:
+            return super().my_navigate_multiple_endpoints(start_point, end_points, game_state, prev_dir)
+        return path
+
+    def path_field(self, end_points, game_state):
+        """Measures the distance of every cell to a set of end points once, to find the paths of many start locations
+
+        Args:
+            * end_points: The end points of the units, should be a list of edge locations
+            * game_state: The current game state
+
+        Returns:
+            A PathField, valid until a structure is added to or removed from the map
+
+        """
+        tables = self.__tables(end_points, game_state)
+        if tables is None:
+            return PathField(self, game_state, end_points, None, None, None)
+        end_indices, _, _, direction = tables
+        self.__load_walls(game_state)
+        self.__validate(list(end_indices))
+        return PathField(self, game_state, end_points, bytearray(self.__walls), list(self.pathlength), direction)
+
+    def __tables(self, end_points, game_state):
+        """Gets the end point tables, or None if the end points can not be handled with arrays
+        """
+        # ShortestPathFinder compares locations as lists, tuples never match an end point there
+        if type(end_points[0]) is not list:
+            return None
+        return self.__end_point_table(game_state.game_map.geometry, end_points)
+
+    def __navigate(self, start_point, end_points, game_state, prev_dir):
+        """Runs both searches and walks the path, or returns None if a location is off the board or not a list
+        """
+        start = _cell_of(start_point, game_state.game_map.geometry)
+        tables = self.__tables(end_points, game_state)
+        if start < 0 or tables is None:
+            return None
+        end_indices, end_set, idealness, direction = tables
+        self.__load_walls(game_state)
+        neighbors = self.geometry.neighbors
+
+        # Idealness search: the first cell in breadth first order with the highest idealness.
+        # A cell seen before can not beat the best so far, so only new cells are compared.
+        seen = bytearray(self.__walls)
+        seen[start] = 1
+        best = idealness[start]
+        most_ideal = start
+        frontier = [start]
+        for cell in frontier:
+            for neighbor in neighbors[cell]:
+                if seen[neighbor]:
+                    continue
+                seen[neighbor] = 1
+                frontier.append(neighbor)
+                if idealness[neighbor] > best:
+                    best = idealness[neighbor]
+                    most_ideal = neighbor
+
+        self.__validate(list(end_indices) if most_ideal in end_set else [most_ideal])
+        return self._walk(start_point, start, prev_dir, direction, self.pathlength, self.__walls)
+
+    def __load_walls(self, game_state):
+        """Marks the blocked cells of the map, and the off board stand in, in the walls buffer so one lookup rejects both
+        """
+        self.initialized = True
+        self.game_state = game_state
+        self.geometry = geometry = game_state.game_map.geometry
+        cell_index = geometry.cell_index
+        off_board = len(geometry.cells)
+        if self.__walls is None or len(self.__walls) != off_board + 1:
+            self.__walls = bytearray(off_board + 1)
+            self.__clear = bytes(off_board + 1)
+            self.pathlength = [-1] * (off_board + 1)
+            self.__unreached = [-1] * (off_board + 1)
+        walls = self.__walls
+        walls[:] = self.__clear
+        walls[off_board] = 1
+        for x, y in game_state.game_map.get_structure_locations():
+            walls[cell_index[x][y]] = 1
+
+    def __validate(self, frontier):
+        """Fills pathlength with the distances from the target cells in frontier, blocked targets are never expanded
+        """
+        neighbors = self.geometry.neighbors
+        walls = self.__walls
+        pathlength = self.pathlength
+        pathlength[:] = self.__unreached
+        pathlength[len(self.geometry.cells)] = 0
+        for cell in frontier:
+            pathlength[cell] = 0
+        for cell in frontier:
+            if walls[cell]:
+                continue
+            length = pathlength[cell] + 1
+            for neighbor in neighbors[cell]:
+                if pathlength[neighbor] == -1 and not walls[neighbor]:
+                    pathlength[neighbor] = length
+                    frontier.append(neighbor)
+
+    def _walk(self, start_point, current, move_direction, direction, pathlength, walls):
+        """Follows the distances from the start to a target, see ShortestPathFinder._get_path
+        """
+        cells = self.geometry.cells
+        neighbors = self.geometry.neighbors
+        path = [start_point]
+        while pathlength[current] != 0:
+            ideal = current
+            best_pathlength = pathlength[current]
+            for neighbor in neighbors[current]:
+                if walls[neighbor]:
+                    continue
+                length = pathlength[neighbor]
+                if length > best_pathlength:
+                    continue
+                if length == best_pathlength and not self.__better(cells[current], cells[neighbor], cells[ideal], move_direction, direction):
+                    continue
+                ideal = neighbor
+                best_pathlength = length
+            move_direction = self.VERTICAL if cells[current][0] == cells[ideal][0] else self.HORIZONTAL
+            path.append(list(cells[ideal]))
+            current = ideal
+        return path
+
+    def __better(self, prev_tile, new_tile, prev_best, previous_move_direction, direction):
+        """Same as ShortestPathFinder._better_direction, with the direction of the end points already known
+        """
+        if previous_move_direction == self.HORIZONTAL and not new_tile[0] == prev_best[0]:
+            return prev_tile[1] != new_tile[1]
+        if previous_move_direction == self.VERTICAL and not new_tile[1] == prev_best[1]:
+            return prev_tile[0] != new_tile[0]
+        if previous_move_direction == 0:
+            return prev_tile[1] != new_tile[1]
+        if new_tile[1] == prev_best[1]:
+            return (direction[0] == 1 and new_tile[0] > prev_best[0]) or (direction[0] == -1 and new_tile[0] < prev_best[0])
+        if new_tile[0] == prev_best[0]:
+            return (direction[1] == 1 and new_tile[1] > prev_best[1]) or (direction[1] == -1 and new_tile[1] < prev_best[1])
+        return True
+
+    def __end_point_table(self, geometry, end_points):
+        """Gets the cell indices, idealness of every cell and direction for a set of end points, or None if one is off the board
+        """
+        key = (geometry.ARENA_SIZE, tuple((x, y) for x, y in end_points))
+        table = ArrayPathFinder._end_point_tables.get(key)
+        if table is not None:
+            return table
+        size = geometry.ARENA_SIZE
+        for x, y in end_points:
+            if not (0 <= x < size and 0 <= y < size) or geometry.cell_index[x][y] < 0:
+                return None
+        end_indices = tuple(geometry.cell_index[x][y] for x, y in end_points)
+        end_set = frozenset(end_indices)
+        x, y = end_points[0]
+        direction = (-1 if x < geometry.HALF_ARENA else 1, -1 if y < geometry.HALF_ARENA else 1)
+        idealness = []
+        for index, (x, y) in enumerate(geometry.cells):
+            if index in end_set:
+                idealness.append(sys.maxsize)
+            else:
+                idealness.append((28 * y if direction[1] == 1 else 28 * (27 - y)) + (x if direction[0] == 1 else 27 - x))
+        idealness.append(-1)
+        table = ArrayPathFinder._end_point_tables[key] = (end_indices, end_set, idealness, direction)
+        return table
+
+    def print_map(self):
+        """Prints an ASCII version of the distances found by the last search for debug purposes
+
+        """
+        if not self.initialized:
+            debug_write("Attempted to print_map before pathfinding. Find a path first")
+            return
+
+        cell_index = self.geometry.cell_index
+        for y in range(28):
+            for x in range(28):
+                index = cell_index[x][28 - y - 1]
+                if index >= 0 and not self.__walls[index] and not self.pathlength[index] == -1:
+                    self._print_justified(self.pathlength[index])
+                else:
+                    sys.stderr.write("   ")
+            debug_write("")
+
+
+def _cell_of(location, geometry):
+    """Gets the cell index of a location, or -1 if it is off the board or not a list
+    """
+    if type(location) is not list:
+        return -1
+    x, y = location
+    if not (0 <= x < geometry.ARENA_SIZE and 0 <= y < geometry.ARENA_SIZE):
+        return -1
+    return geometry.cell_index[x][y]
+
+
+class PathField:
+    """The distance of every cell to a set of end points on one board, see ArrayPathFinder.path_field
+
+    Finding a path from it only walks the distances, so the paths of any number of start locations
+    cost one search. Start locations that can not reach an end point, which path to the best
+    self destruct location of their own pocket instead, are handed to a full search.
+    When a structure is added to or removed from the map, block or unblock repairs the distances
+    around it instead of searching the whole board again.
+
+    Attributes :
+        * end_points (list): The end points the distances lead to
+        * pathlength (list): pathlength[index] is the distance of geometry.cells[index] to the nearest end point, -1 if it can not reach one
+
+    """
+    def __init__(self, finder, game_state, end_points, walls, pathlength, direction):
+        self.end_points = end_points
+        self.pathlength = pathlength
+        self.__finder = finder
+        self.__game_state = game_state
+        self.__walls = walls
+        self.__direction = direction
+
+    def path_from(self, start_location, prev_dir=0):
+        """Gets the path a unit at a location would take, the same one my_navigate_multiple_endpoints finds
+
+        Args:
+            * start_location: The starting location of the unit
+            * prev_dir: The direction the unit last moved in, HORIZONTAL, VERTICAL or 0 if it has not moved yet
+
+        Returns:
+            The path, or None if start_location is blocked
+
+        """
+        finder = self.__finder
+        start = -1 if self.pathlength is None else _cell_of(start_location, self.__game_state.game_map.geometry)
+        if start < 0 or self.pathlength[start] < 0:
+            return finder.my_navigate_multiple_endpoints(start_location, self.end_points, self.__game_state, prev_dir)
+        if self.__walls[start]:
+            return None
+        finder.geometry = self.__game_state.game_map.geometry
+        return finder._walk(start_location, start, prev_dir, self.__direction, self.pathlength, self.__walls)
+
+    def copy(self):
+        """Copies the field, so the copy can be repaired with block and unblock while this one stays as it is
+
+        Returns:
+            A PathField with the same distances
+        """
+        return PathField(self.__finder, self.__game_state, self.end_points,
+            None if self.__walls is None else bytearray(self.__walls),
+            None if self.pathlength is None else list(self.pathlength), self.__direction)
+
+    def unblock(self, location):
+        """Updates the distances after the structure at a location was removed
+
+        Distances can only shrink, so only the cells that got closer to the end points are visited.
+
+        Args:
+            location: The location that is no longer blocked
+
+        """
+        if self.pathlength is None:
+            return
+        index = _cell_of(list(location), self.__game_state.game_map.geometry)
+        walls = self.__walls
+        if index < 0 or not walls[index]:
+            return
+        walls[index] = 0
+        neighbors = self.__game_state.game_map.geometry.neighbors
+        pathlength = self.pathlength
+        # end points keep their distance of 0 while blocked, anything else is reached through its neighbors
+        if pathlength[index] != 0:
+            reached = [pathlength[neighbor] for neighbor in neighbors[index] if not walls[neighbor] and pathlength[neighbor] >= 0]
+            if not reached:
+                return
+            pathlength[index] = min(reached) + 1
+        frontier = [index]
+        for cell in frontier:
+            length = pathlength[cell] + 1
+            for neighbor in neighbors[cell]:
+                if not walls[neighbor] and (pathlength[neighbor] == -1 or pathlength[neighbor] > length):
+                    pathlength[neighbor] = length
+                    frontier.append(neighbor)
+
+    def block(self, location):
+        """Updates the distances after a structure was added at a location
+
+        Only the cells whose every shortest route went through the location are measured again.
+
+        Args:
+            location: The location that is now blocked
+
+        """
+        if self.pathlength is None:
+            return
+        index = _cell_of(list(location), self.__game_state.game_map.geometry)
+        walls = self.__walls
+        if index < 0 or walls[index]:
+            return
+        walls[index] = 1
+        neighbors = self.__game_state.game_map.geometry.neighbors
+        pathlength = self.pathlength
+        length = pathlength[index]
+        if length < 0:
+            return
+        # end points keep their distance of 0 while blocked, but are no longer expanded
+        if length > 0:
+            pathlength[index] = -1
+
+        # Find the cells that lost every neighbor one step closer, level by level, so the neighbors
+        # a cell could still be reached through are settled before it is checked
+        lost = set()
+        frontier = [neighbor for neighbor in neighbors[index] if not walls[neighbor] and pathlength[neighbor] == length + 1]
+        for cell in frontier:
+            if cell in lost:
+                continue
+            closer = pathlength[cell] - 1
+            if any(not walls[neighbor] and pathlength[neighbor] == closer and neighbor not in lost for neighbor in neighbors[cell]):
+                continue
+            lost.add(cell)
+            frontier.extend(neighbor for neighbor in neighbors[cell] if not walls[neighbor] and pathlength[neighbor] == closer + 2)
+        if not lost:
+            return
+
+        # Measure the lost cells again from the cells around them that kept their distance
+        for cell in lost:
+            pathlength[cell] = -1
+        queue = []
+        for cell in lost:
+            for neighbor in neighbors[cell]:
+                if not walls[neighbor] and pathlength[neighbor] >= 0:
+                    queue.append((pathlength[neighbor], neighbor))
+        heapq.heapify(queue)
+        while queue:
+            length, cell = heapq.heappop(queue)
+            if pathlength[cell] != length:
+                continue
+            for neighbor in neighbors[cell]:
+                if neighbor in lost and (pathlength[neighbor] == -1 or pathlength[neighbor] > length + 1):
+                    pathlength[neighbor] = length + 1
+                    heapq.heappush(queue, (length + 1, neighbor))
+
+
+class PathCache:
+    """A least recently used cache of paths, shared by every GameState
+
+    Paths are keyed by the blocked cell layout of the map, see GameMap.get_layout_key, the start cell,
+    the target edge and the direction the unit last moved in, which together decide the path.
+    Safe to use from several threads.
+
+    Attributes :
+        * capacity (int): The number of paths kept before the least recently used one is dropped
+        * hits (int): The number of lookups that found a path
+        * misses (int): The number of lookups that did not
+
+    """
+    def __init__(self, capacity=1024):
+        """Creates an empty cache
+
+        Args:
+            capacity (int): The number of paths to keep
+
+        """
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.__paths = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        """Looks up a path
+
+        Args:
+            key: A (layout key, x, y, target edge, previous direction) tuple
+
+        Returns:
+            A new copy of the cached path, or None if it is not cached
+
+        """
+        with self.__lock:
+            path = self.__paths.get(key)
+            if path is None:
+                self.misses += 1
+                return None
+            self.__paths.move_to_end(key)
+            self.hits += 1
+        return [list(location) for location in path]
+
+    def put(self, key, path):
+        """Stores a path, dropping the least recently used one if the cache is full
+
+        Args:
+            key: A (layout key, x, y, target edge, previous direction) tuple
+            path: The path to store, it is copied
+
+        """
+        stored = tuple(tuple(location) for location in path)
+        with self.__lock:
+            self.__paths[key] = stored
+            self.__paths.move_to_end(key)
+            while len(self.__paths) > self.capacity:
+                self.__paths.popitem(last=False)
+
+    def clear(self):
+        """Drops every cached path and resets the counters
+        """
+        with self.__lock:
+            self.__paths.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.__paths)
@@ -0,0 +1,110 @@
+"""
+The game rules read from the config, compiled once per config and shared by every GameState and GameMap.
+"""
+
+from .unit import get_unit_specs
+
+
+class Rules:
+    """Holds everything GameState needs to know about the config in ready to use form. Do not modify its attributes.
+
+    Attributes :
+        * config (JSON): The config these rules were compiled from
+        * WALL, SUPPORT, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE (str): The unit type shorthands
+        * UNIT_TYPE_TO_INDEX (dict): Maps a unit type to its index in config["unitInformation"]
+        * unit_types (list): The unit type at every index of config["unitInformation"], the inverse of UNIT_TYPE_TO_INDEX
+        * STRUCTURE_TYPES (list): The structure unit types
+        * ALL_UNITS (list): Every unit type that can be spawned
+        * structure_types (frozenset): The structure unit types, for fast membership checks
+        * specs (dict): The UnitSpec of every unit type, see unit.get_unit_specs
+        * costs (dict): The [SP, MP] cost of every unit type
+        * upgrade_costs (dict): The [SP, MP] cost of upgrading every unit type
+        * upgradable (frozenset): The unit types that have an upgrade
+        * attack_ranges (dict): The attack range of every unit type
+        * max_attack_range (float): The largest attack range of any unit, upgraded or not
+        * refund_percentage (dict): The fraction of its cost a structure refunds when removed
+        * turns_to_remove (dict): The number of turns a structure takes to be removed
+        * hit_radius (float): The extra radius added when looking for locations in range
+        * bits_per_round, bit_growth_rate, bit_schedule_interval, bit_decay_per_round (float): The MP income parameters
+        * cores_per_round (float): The SP given to each player every round
+
+    """
+    def __init__(self, config):
+        """Compiles the rules of a config
+
+        Args:
+            config (JSON): Contains information about the game
+
+        """
+        self.config = config
+        unit_information = config["unitInformation"]
+        self.WALL, self.SUPPORT, self.TURRET, self.SCOUT, self.DEMOLISHER, self.INTERCEPTOR, self.REMOVE, self.UPGRADE = \
+            [unit_information[index]["shorthand"] for index in range(8)]
+        self.UNIT_TYPE_TO_INDEX = {unit_information[index]["shorthand"]: index for index in range(8)}
+        self.unit_types = [unit_information[index]["shorthand"] for index in range(8)]
+        self.ALL_UNITS = [self.SCOUT, self.DEMOLISHER, self.INTERCEPTOR, self.WALL, self.SUPPORT, self.TURRET]
+        self.STRUCTURE_TYPES = [self.WALL, self.SUPPORT, self.TURRET]
+        self.structure_types = frozenset(self.STRUCTURE_TYPES)
+        self.specs = get_unit_specs(config)
+
+        self.costs = {}
+        self.upgrade_costs = {}
+        self.upgradable = set()
+        self.attack_ranges = {}
+        self.max_attack_range = 0
+        self.refund_percentage = {}
+        self.turns_to_remove = {}
+        # every type has a cost, including REMOVE and UPGRADE
+        for unit_type in self.unit_types:
+            unit_def = unit_information[self.UNIT_TYPE_TO_INDEX[unit_type]]
+            upgrade = unit_def.get("upgrade")
+            cost = (unit_def.get("cost1", 0), unit_def.get("cost2", 0))
+            self.costs[unit_type] = cost
+            self.upgrade_costs[unit_type] = cost if upgrade is None else (upgrade.get("cost1", cost[0]), upgrade.get("cost2", cost[1]))
+        for unit_type in self.ALL_UNITS:
+            unit_def = unit_information[self.UNIT_TYPE_TO_INDEX[unit_type]]
+            upgrade = unit_def.get("upgrade")
+            if upgrade is not None:
+                self.upgradable.add(unit_type)
+            self.attack_ranges[unit_type] = unit_def.get("attackRange", 0)
+            self.max_attack_range = max(self.max_attack_range, self.attack_ranges[unit_type], (upgrade or {}).get("attackRange", 0))
+            self.refund_percentage[unit_type] = unit_def.get("refundPercentage", 0)
+            self.turns_to_remove[unit_type] = unit_def.get("turnsRequiredToRemove", 0)
+        self.upgradable = frozenset(self.upgradable)
+        self.hit_radius = unit_information[0].get("getHitRadius", 0)
+
+        resources = config.get("resources", {})
+        self.bits_per_round = resources.get("bitsPerRound", 0)
+        self.bit_growth_rate = resources.get("bitGrowthRate", 0)
+        self.bit_schedule_interval = resources.get("turnIntervalForBitSchedule", 1)
+        self.bit_decay_per_round = resources.get("bitDecayPerRound", 0)
+        self.cores_per_round = resources.get("coresPerRound", 0)
+
+    def is_stationary(self, unit_type):
+        """
+            Args:
+                unit_type: A unit type
+
+            Returns:
+                Boolean, True if the unit is stationary, False otherwise.
+        """
+        return unit_type in self.structure_types
+
+
+_rules = {}
+
+def get_rules(config):
+    """Gets the Rules of a config, compiling them the first time the config is seen
+
+    Args:
+        config (JSON): Contains information about the game
+
+    Returns:
+        The shared Rules for that config
+
+    """
+    cached = _rules.get(id(config))
+    if cached is not None and cached.config is config:
+        return cached
+    rules = _rules[id(config)] = Rules(config)
+    return rules
@@ -0,0 +1,289 @@
+"""
+Plays out an action phase frame by frame with the engine's rules, to predict what the units deployed in a turn will do.
+"""
+
+from collections import namedtuple
+
+# Every field holds one entry per player, index 0 for you and 1 for your opponent.
+#   breaches: The damage the player's units dealt to the opponent's health by reaching their edge
+#   damage_dealt: The damage the player's units dealt to the opponent's structures, not counting damage past a structure's health
+#   destroyed: The opponent's structures the player destroyed, as GameUnits with the health they had before the action phase
+# frames is the number of frames the action phase lasted and game_map the map after it, see simulate.
+SimulationResult = namedtuple("SimulationResult", ["breaches", "damage_dealt", "destroyed", "frames", "game_map"])
+
+
+class _Structure:
+    """A structure taking part in a simulation, its order is the position of its id among the engine's unit ids
+    """
+    __slots__ = ("unit", "spec", "player_index", "x", "y", "health", "order", "coverage")
+
+    def __init__(self, unit, order):
+        self.unit = unit
+        self.spec = unit.spec
+        self.player_index = unit.player_index
+        self.x = unit.x
+        self.y = unit.y
+        self.health = unit.health
+        self.order = order
+        self.coverage = None
+
+
+class _Mobile:
+    """A mobile unit taking part in a simulation, along with where it is headed and the supports that already shielded it
+    """
+    __slots__ = ("spec", "player_index", "x", "y", "health", "edge", "interval", "prev_dir", "steps", "path", "step", "shielded")
+
+    def __init__(self, spec, player_index, x, y, edge):
+        self.spec = spec
+        self.player_index = player_index
+        self.x = x
+        self.y = y
+        self.health = spec.max_health
+        self.edge = edge
+        self.interval = max(1, int(1. / spec.speed + 0.5)) if spec.speed > 0 else 0
+        self.prev_dir = 0
+        self.steps = 0
+        self.path = None
+        self.step = 0
+        self.shielded = set()
+
+
+def simulate(game_state, deploys=None, max_frames=1000):
+    """Plays out the action phase that follows a turn, frame by frame, with the engine's rules
+
+    Every frame follows the engine's order. Mobile units due to move take a step along their path, breach if
+    they are already on their target edge, or self destruct if they can go no further. Supports shield friendly
+    units that came into range, once per support and unit. Every unit attacks once, in the order the engine
+    created them, choosing targets like GameState.get_target among the units still alive. Units left without
+    health are removed at the end of the frame, and the paths of the others follow the new layout.
+
+    Args:
+        game_state: The GameState the action phase starts from. Structures come from its map, mobile units on the map are ignored.
+        deploys: A list with the mobile units each player deploys, each a list of (unit_type, x, y) in the order they were deployed
+            like GameState._deploy_stack. Defaults to the units deployed on game_state and none for the opponent.
+        max_frames: The number of frames after which the simulation stops even if units are left
+
+    Returns:
+        A SimulationResult. Its game_map is a fork of game_state's map with the damage and destruction of the action phase,
+        game_state itself is not modified.
+
+    """
+    if deploys is None:
+        deploys = [game_state._deploy_stack, []]
+    return _Simulation(game_state, deploys).run(max_frames)
+
+
+class _Simulation:
+    """The state of one simulate call
+    """
+    def __init__(self, game_state, deploys):
+        self.state = state = game_state.fork()
+        state.suppress_warnings(True)
+        self.game_map = game_map = state.game_map
+        self.rules = rules = state.rules
+        self.hit_radius = rules.hit_radius
+        self.last_row = game_map.ARENA_SIZE - 1
+        self.center = game_state.HALF_ARENA - 0.5
+
+        structures = [unit for player_index in (0, 1) for unit in game_map.get_structures(player_index)]
+        orders = [int(unit.unit_id) if unit.unit_id is not None and str(unit.unit_id).isdigit() else None for unit in structures]
+        # structures built this turn have no id yet, the engine numbers them after every existing unit
+        next_order = max([order for order in orders if order is not None], default=0) + 1
+        self.structures = {}
+        for unit, order in zip(structures, orders):
+            if order is None:
+                order = next_order
+                next_order += 1
+            self.structures[unit.x, unit.y] = _Structure(unit, order)
+        self.__sort_structures()
+
+        # mobile units are created after every structure, in deploy order, so the list is already in the engine's order
+        self.mobiles = []
+        self.edges = {}
+        specs = rules.specs
+        for player_index, units in enumerate(deploys):
+            for unit_type, x, y in units:
+                spec = specs.get(unit_type)
+                if spec is None or spec.stationary or (x, y) in self.structures or not game_map.in_arena_bounds([x, y]):
+                    continue
+                edge = state.get_target_edge([x, y])
+                if edge not in self.edges:
+                    self.edges[edge] = frozenset(map(tuple, game_map.get_edge_locations(edge)))
+                self.mobiles.append(_Mobile(spec, player_index, x, y, edge))
+
+        self.fields = {}
+        self.in_range = {}
+        self.breaches = [0, 0]
+        self.damage_dealt = [0, 0]
+        self.destroyed = [[], []]
+        self.dying = []
+
+    def __sort_structures(self):
+        ordered = sorted(self.structures.values(), key=lambda structure: structure.order)
+        self.turrets = [structure for structure in ordered if structure.spec.damage_i > 0]
+        self.supports = [structure for structure in ordered if structure.spec.shieldPerUnit > 0]
+
+    def run(self, max_frames):
+        frame = 0
+        while self.mobiles and frame < max_frames:
+            self.__move(frame)
+            self.__shield()
+            self.__attack()
+            self.__remove_dead()
+            frame += 1
+
+        game_map = self.game_map
+        for (x, y), structure in self.structures.items():
+            if structure.health != structure.unit.health:
+                game_map.hurt_unit([x, y], structure.unit.health - structure.health)
+        return SimulationResult(self.breaches, self.damage_dealt, self.destroyed, frame, game_map)
+
+    def __move(self, frame):
+        finder = self.state._shortest_path_finder
+        moved = []
+        for unit in self.mobiles:
+            if not unit.interval or (frame + 1) % unit.interval:
+                moved.append(unit)
+                continue
+            location = (unit.x, unit.y)
+            if location in self.edges[unit.edge]:
+                self.breaches[unit.player_index] += unit.spec.breach_damage
+                continue
+            path = unit.path
+            if path is None:
+                field = self.fields.get(unit.edge)
+                if field is None:
+                    field = self.fields[unit.edge] = self.state.path_field(unit.edge)
+                path = unit.path = field.path_from([unit.x, unit.y], unit.prev_dir)
+                unit.step = 0
+            if path is None or unit.step + 1 >= len(path):
+                self.__self_destruct(unit)
+                continue
+            unit.step += 1
+            x, y = path[unit.step]
+            unit.prev_dir = finder.VERTICAL if x == unit.x else finder.HORIZONTAL
+            unit.x, unit.y = x, y
+            unit.steps += 1
+            moved.append(unit)
+        self.mobiles = moved
+
+    def __self_destruct(self, unit):
+        spec = unit.spec
+        if unit.steps < spec.selfDestructStepsRequired:
+            return
+        enemy = 1 - unit.player_index
+        radius = (spec.selfDestructRange + self.hit_radius) ** 2
+        if spec.self_destruct_i > 0:
+            for target in self.mobiles:
+                if target.player_index == enemy and target.health > 0 and (target.x - unit.x) ** 2 + (target.y - unit.y) ** 2 < radius:
+                    target.health -= spec.self_destruct_i
+        if spec.self_destruct_f > 0:
+            for location in self.game_map._locations_in_range([unit.x, unit.y], spec.selfDestructRange):
+                target = self.structures.get(location)
+                if target is not None and target.player_index == enemy and target.health > 0:
+                    self.__hurt_structure(target, spec.self_destruct_f, unit.player_index)
+
+    def __shield(self):
+        hit_radius = self.hit_radius
+        for support in self.supports:
+            spec = support.spec
+            radius = (spec.shieldRange + hit_radius) ** 2
+            amount = None
+            for unit in self.mobiles:
+                if unit.player_index != support.player_index or support in unit.shielded:
+                    continue
+                if (unit.x - support.x) ** 2 + (unit.y - support.y) ** 2 < radius:
+                    if amount is None:
+                        row = support.y if support.player_index == 0 else self.last_row - support.y
+                        amount = spec.shieldPerUnit + spec.shieldBonusPerY * row
+                    unit.health += amount
+                    unit.shielded.add(support)
+
+    def __attack(self):
+        occupied = (set(), set())
+        for unit in self.mobiles:
+            occupied[unit.player_index].add((unit.x, unit.y))
+        geometry = self.game_map.geometry
+        hit_radius = self.hit_radius
+
+        for turret in self.turrets:
+            if turret.coverage is None:
+                turret.coverage = frozenset(geometry.locations_in_range(turret.x, turret.y, turret.spec.attackRange, hit_radius))
+            if turret.coverage.isdisjoint(occupied[1 - turret.player_index]):
+                continue
+            target = self.__mobile_target(turret)
+            if target is not None:
+                target.health -= turret.spec.damage_i
+
+        # units killed earlier in the frame still attack, they are only removed at its end
+        for unit in list(self.mobiles):
+            spec = unit.spec
+            if spec.damage_i > 0 and occupied[1 - unit.player_index]:
+                target = self.__mobile_target(unit)
+                if target is not None:
+                    target.health -= spec.damage_i
+                    continue
+            if spec.damage_f > 0:
+                target = self.__structure_target(unit)
+                if target is not None:
+                    self.__hurt_structure(target, spec.damage_f, unit.player_index)
+
+    def __target_key(self, attacker, target):
+        """The engine's targeting priority once mobile units are preferred, the smallest key is attacked
+        """
+        return ((target.x - attacker.x) ** 2 + (target.y - attacker.y) ** 2, target.health,
+            target.y if attacker.player_index == 0 else -target.y, -abs(self.center - target.x))
+
+    def __mobile_target(self, attacker):
+        enemy = 1 - attacker.player_index
+        radius = (attacker.spec.attackRange + self.hit_radius) ** 2
+        best, best_key = None, None
+        for unit in self.mobiles:
+            if unit.player_index != enemy or unit.health <= 0 or (unit.x - attacker.x) ** 2 + (unit.y - attacker.y) ** 2 >= radius:
+                continue
+            key = self.__target_key(attacker, unit)
+            if best is None or key < best_key:
+                best, best_key = unit, key
+        return best
+
+    def __structure_target(self, attacker):
+        key = (attacker.x, attacker.y, attacker.spec.attackRange, attacker.player_index)
+        candidates = self.in_range.get(key)
+        if candidates is None:
+            enemy = 1 - attacker.player_index
+            candidates = []
+            for location in self.game_map._locations_in_range([attacker.x, attacker.y], attacker.spec.attackRange):
+                structure = self.structures.get(location)
+                if structure is not None and structure.player_index == enemy:
+                    candidates.append(structure)
+            self.in_range[key] = candidates
+        best, best_key = None, None
+        for structure in candidates:
+            if structure.health <= 0:
+                continue
+            key = self.__target_key(attacker, structure)
+            if best is None or key < best_key:
+                best, best_key = structure, key
+        return best
+
+    def __hurt_structure(self, structure, damage, player_index):
+        self.damage_dealt[player_index] += min(damage, structure.health)
+        structure.health -= damage
+        if structure.health <= 0:
+            self.destroyed[player_index].append(structure.unit)
+            self.dying.append((structure.x, structure.y))
+
+    def __remove_dead(self):
+        self.mobiles = [unit for unit in self.mobiles if unit.health > 0]
+        if not self.dying:
+            return
+        for location in self.dying:
+            del self.structures[location]
+            self.game_map.remove_unit(location)
+            for field in self.fields.values():
+                field.unblock(location)
+        self.dying = []
+        self.__sort_structures()
+        self.in_range = {}
+        for unit in self.mobiles:
+            unit.path = None
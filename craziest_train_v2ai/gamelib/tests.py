@@ -1,7 +1,20 @@
 import unittest
 import json
 from .game_state import GameState
-from .unit import GameUnit
+from .unit import GameUnit, UnitStack
+from .board_arrays import np
+from .util import GameMessage, parse_message
+from .action_frame import ActionFrame
+from .algocore import AlgoCore
+from .tracker import BoardTracker
+from .navigation import ShortestPathFinder, ArrayPathFinder, PathCache
+from .simulator import simulate
+from .workers import WorkerPool, snapshot, restore
+import random
+import time
+import threading
+import multiprocessing
+from unittest import mock
 
 class BasicTests(unittest.TestCase):
 
@@ -275,3 +288,640 @@ class BasicTests(unittest.TestCase):
         actual = game.project_future_MP(turns)
         self.assertAlmostEqual(actual, expected, 0, "Expected {} MP {} turns from now, got {}".format(expected, turns, actual))
 
+    def test_fork(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13,10], 0)
+        game.game_map.add_unit("FF", [14,14], 1)
+        fork = game.fork()
+
+        fork.game_map.hurt_unit([13,10], 10)
+        fork.game_map.remove_unit([14,14])
+        fork.game_map.upgrade_unit([13,10])
+        fork.attempt_spawn("FF", [[12,10]])
+        self.assertEqual(90, game.game_map[13,10][0].health, "Hurting a unit on a fork changed the original")
+        self.assertFalse(game.game_map[13,10][0].upgraded, "Upgrading a unit on a fork changed the original")
+        self.assertEqual(1, len(game.game_map[14,14]), "Removing a unit on a fork changed the original")
+        self.assertEqual(0, len(game.game_map[12,10]), "Spawning on a fork changed the original")
+        self.assertEqual(25, game.get_resource(game.SP), "Spawning on a fork spent the original's resources")
+        self.assertEqual([], game._build_stack, "Spawning on a fork changed the original's build stack")
+        self.assertEqual(80, fork.game_map[13,10][0].health, "Fork did not keep its own damage")
+
+        game.game_map.hurt_unit([14,14], 5)
+        self.assertEqual(0, len(fork.game_map[14,14]), "Changing the original changed the fork")
+        second = game.fork()
+        self.assertEqual(70, second.game_map[14,14][0].health, "Fork of a fork lost changes")
+
+    def test_transaction_rollback(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13,10], 0)
+        game.game_map.add_unit("FF", [14,14], 1)
+
+        game.game_map.start_transaction()
+        game.game_map.hurt_unit([13,10], 10)
+        game.game_map.remove_unit([14,14])
+        game.game_map.add_unit("SI", [13,0], 0)
+        game.game_map.start_transaction()
+        game.game_map.hurt_unit([13,10], 20)
+        game.game_map.upgrade_unit([13,10])
+        game.game_map.rollback()
+        self.assertEqual(80, game.game_map[13,10][0].health, "Inner rollback undid too much or too little")
+        self.assertFalse(game.game_map[13,10][0].upgraded, "Inner rollback did not undo an upgrade")
+        game.game_map.rollback()
+
+        self.assertEqual(90, game.game_map[13,10][0].health, "Rollback did not restore health")
+        self.assertEqual(1, len(game.game_map[14,14]), "Rollback did not restore a removed unit")
+        self.assertEqual(0, len(game.game_map[13,0]), "Rollback did not remove an added unit")
+
+    def test_transaction_commit_and_fork(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("FF", [14,14], 1)
+        fork = game.fork()
+
+        fork.game_map.start_transaction()
+        fork.game_map.start_transaction()
+        fork.game_map.hurt_unit([14,14], 5)
+        fork.game_map.commit()
+        self.assertEqual(70, fork.game_map[14,14][0].health, "Commit did not keep the change")
+        fork.game_map.rollback()
+        self.assertEqual(75, fork.game_map[14,14][0].health, "Outer rollback did not undo a committed inner transaction")
+
+        fork.game_map.hurt_unit([14,14], 1)
+        self.assertEqual(75, game.game_map[14,14][0].health, "Rollback left a cell shared with the original map")
+
+    def test_geometry(self):
+        game = self.make_turn_0_map()
+        geometry = game.game_map.geometry
+        self.assertEqual(420, len(geometry.cells), "The board should have 420 cells")
+        self.assertIs(geometry, game.fork().game_map.geometry, "Geometry should be shared between maps")
+        for x in range(28):
+            for y in range(28):
+                expected = abs(x - 13.5) + abs(y - 13.5) <= 14
+                self.assertEqual(expected, game.game_map.in_arena_bounds([x, y]), "Wrong bounds at {}".format([x, y]))
+                if expected:
+                    self.assertEqual((x, y), geometry.cells[geometry.cell_index[x][y]], "Cell index is inconsistent")
+        self.assertEqual([[14, 27], [15, 26]], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT)[:2], "Wrong top right edge")
+        self.assertEqual(game.game_map.BOTTOM_LEFT, game.game_map.get_edge_of([13, 0]), "[13, 0] is on the bottom left edge")
+        self.assertEqual(game.game_map.TOP_LEFT, game.game_map.get_edge_of([0, 14]), "[0, 14] is on the top left edge")
+        self.assertIsNone(game.game_map.get_edge_of([13, 13]), "[13, 13] is not on an edge")
+
+    def test_locations_in_range_cache(self):
+        game = self.make_turn_0_map()
+        for location in [[13, 0], [0, 13], [13, 13], [20, 20], [27, 14]]:
+            for radius in [0, 1.5, 3.5, 4.5, 7]:
+                expected = []
+                for i in range(location[0] - 8, location[0] + 9):
+                    for j in range(location[1] - 8, location[1] + 9):
+                        if game.game_map.in_arena_bounds([i, j]) and game.game_map.distance_between_locations(location, [i, j]) < radius + 0.01:
+                            expected.append([i, j])
+                got = game.game_map.get_locations_in_range(location, radius)
+                self.assertEqual(expected, got, "Wrong locations in range {} of {}".format(radius, location))
+                got.append([0, 0])
+                self.assertEqual(expected, game.game_map.get_locations_in_range(location, radius), "Changing a result changed the cache")
+                shared = game.game_map._locations_in_range(location, radius)
+                self.assertIs(shared, game.game_map._locations_in_range(location, radius), "Locations in range should be cached")
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_board_arrays(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13,10], 0)
+        arrays = game.game_map.arrays
+        self.assertEqual(2, arrays.unit_type[13,10], "Arrays did not pick up an existing turret")
+        game.game_map.add_unit("FF", [14,14], 1)
+        game.game_map.add_unit("SI", [13,0], 0)
+        game.game_map.hurt_unit([13,10], 30)
+        game.game_map.upgrade_unit([14,14])
+        self.assertEqual([[13,10], [14,14]], arrays.locations(arrays.mask()), "Arrays should only hold the two structures")
+        self.assertEqual([[14,14]], arrays.locations(arrays.mask(1, "FF")), "Wrong enemy walls")
+        self.assertEqual(60, arrays.health[13,10], "Damage was not synced")
+        self.assertTrue(arrays.upgraded[14,14], "Upgrade was not synced")
+
+        game.game_map.start_transaction()
+        game.game_map.remove_unit([13,10])
+        fork = game.fork()
+        self.assertEqual(-1, arrays.player_index[13,10], "Removal was not synced")
+        game.game_map.rollback()
+        self.assertEqual(0, arrays.player_index[13,10], "Rollback was not synced")
+        self.assertEqual(-1, fork.game_map.arrays.player_index[13,10], "Fork's arrays should not follow the original")
+
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_threat_map(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13,17], 1)
+        arrays = game.game_map.arrays
+        game.game_map.add_unit("DF", [15,17], 1)
+        game.game_map.add_unit("FF", [14,17], 1)
+        game.game_map.add_unit("DF", [13,10], 0)
+        game.game_map.upgrade_unit([15,17])
+        for x, y in game.game_map.geometry.cells:
+            self.assertEqual(sum(unit.damage_i for unit in game.get_attackers([x, y], 0)), game.threat_map(0)[x, y],
+                "Threat at {} does not match get_attackers".format([x, y]))
+        self.assertTrue((arrays.measure_threat() == arrays.threat).all(), "Kept up threat differs from a fresh measure")
+
+        path = game.find_path_to_edge([13,0])
+        self.assertEqual(sum(game.threat_map(0)[x, y] for x, y in path), game.path_damage(path))
+        game.game_map.start_transaction()
+        game.game_map.remove_unit([13,17])
+        game.game_map.remove_unit([15,17])
+        self.assertEqual(0, game.path_damage(path), "Removed turrets deal no damage")
+        self.assertEqual(game.contains_stationary_unit([13,10]).damage_i, game.threat_map(1)[13,12], "The enemy is threatened by our turret")
+        game.game_map.rollback()
+        self.assertTrue((arrays.measure_threat() == arrays.threat).all(), "Rollback was not synced")
+
+    def test_structure_index(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13,10], 0)
+        game.game_map.add_unit("FF", [12,10], 0)
+        game.game_map.add_unit("DF", [14,14], 1)
+        game.game_map.add_unit("SI", [13,0], 0)
+        self.assertEqual("DF", game.contains_stationary_unit([13,10]).unit_type, "Did not find the turret")
+        self.assertFalse(game.contains_stationary_unit([13,0]), "Mobile units are not structures")
+        self.assertEqual([[13,10]], [[u.x, u.y] for u in game.structures(0, "DF")], "Wrong turrets")
+        self.assertEqual(2, len(game.structures(0)), "Wrong structure count")
+        self.assertEqual([], game.damaged_structures(0), "Nothing is damaged yet")
+
+        game.game_map.hurt_unit([13,10], 30)
+        self.assertEqual([[13,10]], [[u.x, u.y] for u in game.damaged_structures(0)], "Damage was not indexed")
+        self.assertEqual([], game.damaged_structures(0, .5), "Turret is above half health")
+        game.game_map.upgrade_unit([12,10])
+        self.assertEqual(2, len(game.damaged_structures(0)), "Upgrading raises max health")
+
+        game.game_map.start_transaction()
+        game.game_map.remove_unit([13,10])
+        fork = game.fork()
+        self.assertEqual([], game.structures(0, "DF"), "Removal was not indexed")
+        game.game_map.rollback()
+        self.assertEqual(1, len(game.structures(0, "DF")), "Rollback was not indexed")
+        self.assertEqual([], fork.structures(0, "DF"), "Fork's index should not follow the original")
+
+    def test_unit_specs(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13,10], 0)
+        game.game_map.add_unit("DF", [14,10], 0)
+        first, second = game.game_map[13,10][0], game.game_map[14,10][0]
+        self.assertIs(first.spec, second.spec, "Units of the same type should share a spec")
+
+        health = first.health
+        game.game_map.upgrade_unit([13,10])
+        self.assertTrue(first.upgraded, "Unit was not upgraded")
+        self.assertFalse(second.upgraded, "Upgrading one unit changed another")
+        self.assertEqual(health, first.health, "Upgrading should not change current health")
+        self.assertGreater(first.attackRange, second.attackRange, "Upgrade did not raise range")
+        self.assertEqual(first.cost, [second.cost[0] + 4, 0], "Upgrade cost was not added")
+
+        game.game_map.add_unit("DF", [15,10], 0)
+        third = game.game_map[15,10][0]
+        third.damage_i = 50
+        third.cost = [7, 0]
+        third.note = "custom"
+        self.assertEqual((50, [7, 0]), (third.damage_i, third.cost), "Stats set on a unit were not kept")
+        self.assertNotEqual(50, second.damage_i, "Setting a stat on one unit changed the other units of its type")
+        forked = game.fork()
+        forked.game_map.hurt_unit([15,10], 1)
+        self.assertEqual((50, "custom"), (forked.game_map[15,10][0].damage_i, forked.game_map[15,10][0].note), "Copying the unit lost what was set on it")
+
+        second.cost[0] = 3
+        self.assertEqual([3, 0], second.cost, "Editing a unit's cost in place was lost")
+        self.assertEqual([2.0, 0], GameUnit("DF", game.config).cost, "Editing one unit's cost changed another")
+        custom = GameUnit("DF", game.config)
+        custom.damage_i = 50
+        custom.max_health = 120
+        custom.cost[0] = 3
+        custom.upgrade()
+        self.assertEqual((15.0, 120, 3.5, [7.0, 0], True), (custom.damage_i, custom.max_health, custom.attackRange, custom.cost, custom.upgraded),
+            "Upgrading should replace only the stats the upgrade changes and add its cost")
+
+    def test_unit_stack(self):
+        game = self.make_turn_0_map()
+        stack = UnitStack("PI", game.config, 3)
+        self.assertFalse(stack.take_hit(10), "Front unit should survive")
+        self.assertEqual(5, stack.health, "Front unit was not damaged")
+        self.assertTrue(stack.take_hit(20), "Front unit should die")
+        self.assertEqual((2, 15), (stack.count, stack.health), "Next unit should be at full health")
+        stack.add_shield(3)
+        self.assertEqual((18, 18), (stack.health, stack.max_health), "Shield was not added")
+
+        game.game_map.add_unit("FF", [15,5], 1)
+        result = game.attack_score([13,0], 40, "PI")
+        self.assertEqual(10, result['kill_score'], "Forty scouts should kill the wall with one volley")
+        self.assertAlmostEqual(20, result['dam_score'], msg="Damage past the wall's health should not score")
+        self.assertFalse(game.contains_stationary_unit([15,5]), "Killed wall was not removed")
+
+        # the scores of the per unit loop stacks replaced, one volley kills a wall and spills onto the next target
+        for deploy_number, expected in [(40, (40.0, 80.0, 40)), (13, (30.0, 67.466666667, 12))]:
+            game = self.make_turn_0_map()
+            for unit_type, location in [("FF", [15,5]), ("FF", [14,5]), ("DF", [16,6])]:
+                game.game_map.add_unit(unit_type, location, 1)
+            result = game.attack_score([13,0], deploy_number, "PI")
+            self.assertEqual(expected, (result['kill_score'], round(result['dam_score'], 9), result['number_left']),
+                "A volley scored differently than its units one at a time")
+
+    def test_rules(self):
+        game = self.make_turn_0_map()
+        other = self.make_turn_0_map()
+        self.assertIsNot(game.rules, other.rules, "Different configs should compile different rules")
+        self.assertIs(game.rules, GameState(game.config, game.serialized_string).rules, "Rules should be compiled once per config")
+        self.assertIs(game.rules, game.game_map.rules, "GameMap should share the GameState's rules")
+        self.assertEqual(4.5, game.rules.max_attack_range, "Wrong max attack range")
+        self.assertEqual([2.0, 0], game.type_cost("DF"), "Wrong turret cost")
+        self.assertEqual([4.0, 0], game.type_cost("DF", upgrade=True), "Wrong turret upgrade cost")
+        game.suppress_warnings(True)
+        self.assertEqual([0, 0], game.type_cost(game.rules.UPGRADE), "Upgrades should cost what the config says")
+        self.assertEqual([0, 0], game.type_cost("XX"), "Unknown types should cost nothing")
+        with mock.patch.object(game, "_invalid_unit") as invalid:
+            self.assertIsNone(game.number_affordable(game.rules.REMOVE), "Removals can not be afforded")
+            self.assertIsNone(game.number_affordable(game.rules.UPGRADE), "Upgrades can not be afforded")
+            self.assertIsNone(game.number_affordable("XX"), "Unknown types can not be afforded")
+        self.assertEqual(3, invalid.call_count, "Each invalid type should warn")
+        self.assertIn("FF", game.rules.upgradable, "Walls can be upgraded")
+        self.assertNotIn("PI", game.rules.upgradable, "Scouts cannot be upgraded")
+
+    def test_game_message(self):
+        game = self.make_turn_0_map()
+        message = GameMessage(game.serialized_string)
+        self.assertEqual(game.serialized_string, message, "A GameMessage should still be the raw string")
+        self.assertIs(message.data, message.data, "The message should only be parsed once")
+        self.assertIs(message.data, parse_message(message), "parse_message should reuse the parsed message")
+        parsed = GameState(game.config, message)
+        self.assertEqual(game.turn_number, parsed.turn_number, "GameState did not read the GameMessage")
+        self.assertEqual(len(game.structures(0)), len(parsed.structures(0)), "GameState did not read the GameMessage")
+        from_dict = GameState(game.config, message.data)
+        self.assertEqual(game.my_health, from_dict.my_health, "GameState did not read the decoded dict")
+
+    def test_action_frame(self):
+        frame = ActionFrame('{"p2Units":[[],[],[],[],[],[],[[20,14,1,"11"]],[]],"turnInfo":[1,7,21],'
+            '"p1Units":[[],[],[],[[24,11,15.0,"20"]],[],[],[],[]],"p1Stats":[40.0,0.0,0.0,110],"p2Stats":[39.0,1.0,1.8,165],'
+            '"events":{"selfDestruct":[],"breach":[[[3,10],1,3,"21",2]],"damage":[],"shield":[],'
+            '"move":[[[23,11],[24,11],[0,0],3,"20",1]],"spawn":[],"death":[[[5,11],2,"1",1,false]],"attack":[],"melee":[]}}')
+        self.assertEqual((7, 21), (frame.turn_number, frame.frame_number), "Wrong turn info")
+        self.assertFalse(hasattr(frame, "_data"), "Reading turn info should not decode the whole frame")
+        self.assertEqual([24, 11], frame.moves[0].end, "Wrong move destination")
+        self.assertEqual((3, 1), (frame.moves[0].unit_type, frame.moves[0].player), "Wrong move fields")
+        self.assertEqual(([3, 10], 2), (frame.breaches[0].location, frame.breaches[0].player), "Wrong breach fields")
+        self.assertEqual((2, 1, False), frame.deaths[0][1:2] + frame.deaths[0][3:], "Wrong death fields")
+        self.assertEqual([], frame.spawns, "There are no spawns")
+        self.assertEqual([[20, 14, 1, "11"]], frame.units(1)[6], "Wrong removal list")
+        self.assertEqual(frame.data["events"]["move"], frame.event("move"), "Lazy decode disagrees with a full parse")
+
+    def test_subscribe(self):
+        core = AlgoCore()
+        seen = []
+        core.subscribe("breach", lambda event, frame: seen.append(("breach", event.player)), player_index=1)
+        core.subscribe("move", lambda event, frame: seen.append(("move", event.player)))
+        core.subscribe("spawn", lambda event, frame: seen.append(("spawn", event.player)))
+        frame = ActionFrame('{"turnInfo":[1,7,21],"events":{"breach":[[[3,10],1,3,"21",2],[[24,10],1,3,"22",1]],'
+            '"move":[[[23,11],[24,11],[0,0],3,"20",1]],"spawn":[]}}')
+        core._dispatch_events(frame)
+        self.assertEqual([("breach", 2), ("move", 1)], seen, "Wrong events dispatched")
+
+        quiet = ActionFrame('{"turnInfo":[1,7,22],"events":{"breach":[],"move":[],"spawn":[]}}')
+        core._dispatch_events(quiet)
+        self.assertFalse(hasattr(quiet, "_sections"), "A frame without subscribed events should not be decoded")
+
+    def test_speculation(self):
+        game = self.make_turn_0_map()
+        class Speculator(AlgoCore):
+            def prepare_speculation(self, predicted_state):
+                return predicted_state.turn_number * 10
+
+            def speculate(self, predicted_state, cancelled, inputs):
+                return predicted_state.turn_number + inputs
+        core = Speculator()
+        core.config = game.config
+        units = '"p1Units":[[[13,10,60.0,"1"]],[],[],[{}],[],[],[]],"p2Units":[[[14,14,75.0,"2"]],[],[],[],[],[],[{}]]'
+        busy = ActionFrame('{"turnInfo":[1,0,4],' + units.format('[13,11,15.0,"3"]', '') + ',"p1Stats":[30.0,25.0,5.0,0],"p2Stats":[30.0,25.0,5.0,0]}')
+        core._start_speculation(busy)
+        self.assertIsNone(core._speculation, "Mobile units are still moving, the board can change")
+
+        done = ActionFrame('{"turnInfo":[1,0,5],' + units.format('', '[14,14,1,"2"]') + ',"p1Stats":[30.0,25.0,5.0,0],"p2Stats":[30.0,25.0,5.0,0]}')
+        core._start_speculation(done)
+        core._speculation[0].join()
+        core._finish_speculation()
+        turn_1 = '{"turnInfo":[0,1,-1],"p1Units":[[[13,10,60.0,"1"]],[],[],[],[],[],[]],"p2Units":[%s,[],[],[],[],[],[]],"p1Stats":[30.0,29.0,6.0,0],"p2Stats":[30.0,29.0,6.0,0]}'
+        self.assertEqual(11, core.take_speculation(GameState(game.config, turn_1 % '[]')), "The removed wall should be gone next turn")
+        self.assertIsNone(core.take_speculation(GameState(game.config, turn_1 % '[]')), "A speculation can only be taken once")
+
+        core._speculated_turn = None
+        core._start_speculation(done)
+        core._speculation[0].join()
+        core._finish_speculation()
+        self.assertIsNone(core.take_speculation(GameState(game.config, turn_1 % '[[14,14,75.0,"2"]]')), "The wrong board was predicted")
+
+    def test_board_tracker(self):
+        game = self.make_turn_0_map()
+        tracker = BoardTracker(game.config)
+        turn = '{"turnInfo":[0,%d,-1],"p1Units":[[[13,10,%s]],[],[],[],[],[],[],[%s]],"p2Units":[[[14,14,%s,"2"]],[],[],[],[],[],[],[]],' \
+            '"p1Stats":[30.0,29.0,6.0,0],"p2Stats":[30.0,29.0,6.0,0]}'
+        state = tracker.next_state(turn % (0, '75.0,"1"', '', '75.0'))
+        self.assertEqual(75.0, state.contains_stationary_unit([13, 10]).health, "The first turn should be parsed")
+
+        tracker.update(ActionFrame('{"turnInfo":[1,0,0],"events":{"spawn":[[[13,10],7,"5",1],[[13,0],3,"3",1]],'
+            '"move":[[[13,0],[13,1],[0,0],3,"3",1]],"shield":[],"damage":[[[14,14],10.0,0,"2",2]],"death":[]}}'))
+        self.assertEqual(1, len(tracker.state.game_map[13, 1]), "The scout should have moved")
+        self.assertEqual(150.0, tracker.state.game_map[13, 10][0].health, "Upgrading raises health")
+        tracker.update(ActionFrame('{"turnInfo":[1,0,1],"events":{"spawn":[],"move":[],"shield":[],"damage":[],'
+            '"death":[[[13,1],3,"3",1,false]]}}'))
+        self.assertEqual(75.0, state.contains_stationary_unit([14, 14]).health, "The returned state should not follow the action phase")
+        tracker.state.suppress_warnings(True)
+
+        state = tracker.next_state(turn % (1, '150.0,"5"', '[13,10,0.0,"5"]', '65.0'))
+        parsed = GameState(game.config, turn % (1, '150.0,"5"', '[13,10,0.0,"5"]', '65.0'))
+        self.assertEqual(0, tracker.corrections, "The tracked board should match the turn message")
+        self.assertEqual(parsed.game_map.get_structure_signature(), state.game_map.get_structure_signature(), "Tracked state differs from a full parse")
+        self.assertEqual((parsed.enable_warnings, parsed.game_map.enable_warnings), (state.enable_warnings, state.game_map.enable_warnings),
+            "Tracked state warns differently than a full parse")
+        self.assertEqual((1, 29.0), (state.turn_number, state.get_resource(state.SP)), "Wrong turn info")
+
+        state = tracker.next_state(turn % (2, '150.0,"5"', '[13,10,0.0,"5"]', '40.0'))
+        self.assertEqual(1, tracker.corrections, "Only the enemy wall should need correcting")
+        self.assertEqual(40.0, state.contains_stationary_unit([14, 14]).health, "The turn message wins")
+
+    def test_diff(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("FF", [13, 10], 0)
+        game.game_map.add_unit("DF", [14, 14], 1)
+        game.game_map.add_unit("FF", [15, 15], 1)
+        later = game.fork()
+        delta = later.diff(game)
+        self.assertFalse(delta['changed'] or delta['layout_changed'], "A fork has not changed")
+
+        later.game_map.upgrade_unit([13, 10])
+        later.game_map.hurt_unit([14, 14], 10)
+        later.game_map.remove_unit([15, 15])
+        later.game_map.add_unit("FF", [13, 15], 1)
+        delta = later.diff(game)
+        self.assertEqual(([], [[13, 15]]), tuple([[u.x, u.y] for u in units] for units in delta['added']), "Wrong added structures")
+        self.assertEqual([[15, 15]], [[u.x, u.y] for u in delta['removed'][1]], "Wrong removed structures")
+        self.assertEqual([[13, 10]], [[u.x, u.y] for u in delta['upgraded'][0]], "Wrong upgraded structures")
+        self.assertEqual([[14, 14]], [[u.x, u.y] for u in delta['damaged'][1]], "Wrong damaged structures")
+        self.assertTrue(delta['layout_changed'], "Cells were blocked and unblocked")
+
+        rebuilt = later.fork()
+        rebuilt.game_map.remove_unit([14, 14])
+        rebuilt.game_map.add_unit("DF", [14, 14], 1)
+        delta = rebuilt.diff(later)
+        self.assertEqual((1, 1, False), (len(delta['added'][1]), len(delta['removed'][1]), delta['layout_changed']),
+            "A rebuilt structure is removed and added without changing the layout")
+
+        marked = later.fork()
+        marked.game_map.mark_removal([13, 10])
+        delta = marked.diff(later)
+        self.assertTrue(delta['changed'], "Marking a structure for removal is a change")
+        self.assertEqual([[13, 10]], [[u.x, u.y] for u in delta['marked'][0]], "Wrong marked structures")
+        self.assertEqual([[13, 10]], [[u.x, u.y] for u in later.diff(marked)['marked'][0]], "Clearing a mark is a change too")
+
+    def test_array_path_finder(self):
+        rng = random.Random(3)
+        finder = ArrayPathFinder()
+        for trial in range(40):
+            game = self.make_turn_0_map()
+            cells = list(game.game_map.geometry.cells)
+            for x, y in rng.sample(cells, rng.choice([10, 60, 150])):
+                game.game_map.add_unit("FF", [x, y], 0 if y < 14 else 1)
+            for _ in range(5):
+                start = list(rng.choice(cells))
+                if game.contains_stationary_unit(start):
+                    continue
+                end_points = game.game_map.get_edge_locations(rng.randrange(4))
+                prev_dir = rng.choice([0, 1, 2])
+                self.assertEqual(ShortestPathFinder().my_navigate_multiple_endpoints(start, end_points, game, prev_dir),
+                    finder.my_navigate_multiple_endpoints(start, end_points, game, prev_dir), "Paths differ from ShortestPathFinder")
+                self.assertEqual(ShortestPathFinder().navigate_multiple_endpoints(start, end_points, game),
+                    finder.navigate_multiple_endpoints(start, end_points, game), "Paths differ from ShortestPathFinder")
+
+    def test_path_cache(self):
+        game = self.make_turn_0_map()
+        game.path_cache = PathCache(capacity=2)
+        path = game.find_path_to_edge([13, 0], game.game_map.TOP_RIGHT)
+        self.assertEqual((0, 1), (game.path_cache.hits, game.path_cache.misses), "The first lookup misses")
+        self.assertEqual(path, game.fork().find_path_to_edge([13, 0], game.game_map.TOP_RIGHT), "Forks share cached paths")
+        self.assertEqual(1, game.path_cache.hits, "The fork has the same layout")
+
+        path[1][0] = -1
+        self.assertNotEqual(-1, game.find_path_to_edge([13, 0], game.game_map.TOP_RIGHT)[1][0], "Cached paths are copied")
+        self.assertEqual(path[0], game.my_find_path_to_edge([13, 0], 0, game.game_map.TOP_RIGHT)[0], "No direction is prev_dir 0")
+
+        key = game.game_map.get_layout_key()
+        game.game_map.add_unit("FF", [13, 5], 0)
+        self.assertNotEqual(key, game.game_map.get_layout_key(), "Blocking a cell changes the layout")
+        key = game.game_map.get_layout_key()
+        game.game_map.hurt_unit([13, 5], 10)
+        self.assertEqual(key, game.game_map.get_layout_key(), "Only blocking or unblocking a cell changes the layout")
+        self.assertEqual(ShortestPathFinder().navigate_multiple_endpoints([13, 0], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT), game),
+            game.find_path_to_edge([13, 0], game.game_map.TOP_RIGHT), "A new wall changes the path")
+        game.my_find_path_to_edge([14, 0], 1, game.game_map.TOP_LEFT)
+        self.assertEqual(2, len(game.path_cache), "The least recently used path is dropped")
+
+    def test_board_hash(self):
+        first = self.make_turn_0_map().game_map
+        second = self.make_turn_0_map().game_map
+        first.add_unit("FF", [13, 5], 0)
+        first.add_unit("DF", [14, 20], 1)
+        second.add_unit("DF", [14, 20], 1)
+        second.add_unit("FF", [13, 5], 0)
+        self.assertEqual(first.get_board_hash(), second.get_board_hash(), "The order of placement does not matter")
+        self.assertEqual(first.get_layout_key(), second.get_layout_key(), "The order of placement does not matter")
+        index = first.geometry.cell_index
+        self.assertEqual(1 << index[13][5], first.get_bitboard(0))
+        self.assertEqual(1 << index[14][20], first.get_bitboard(1, "DF"))
+        self.assertEqual(0, first.get_bitboard(1, "FF"))
+        self.assertEqual(first.get_bitboard(0) | first.get_bitboard(1), first.get_bitboard())
+
+        key = second.get_board_hash()
+        second.hurt_unit([13, 5], 0.1)
+        self.assertNotEqual(key, second.get_board_hash(), "Full health is a level of its own")
+        key = second.get_board_hash()
+        second.hurt_unit([13, 5], 0.1)
+        self.assertEqual(key, second.get_board_hash(), "Damage within a health level keeps the hash")
+        second.hurt_unit([13, 5], second[13, 5][0].max_health / 2)
+        self.assertNotEqual(key, second.get_board_hash(), "Dropping a health level changes the hash")
+        self.assertEqual(first.get_layout_key(), second.get_layout_key(), "Damage keeps the layout")
+
+        key = first.get_board_hash()
+        forked = first.fork()
+        forked.start_transaction()
+        forked.upgrade_unit([13, 5])
+        self.assertNotEqual(key, forked.get_board_hash(), "Upgrading changes the hash")
+        forked.remove_unit([14, 20])
+        self.assertEqual(1 << index[13][5], forked.get_bitboard())
+        forked.rollback()
+        self.assertEqual(key, forked.get_board_hash(), "Rolling back restores the hash")
+        self.assertEqual(first.get_bitboard(), forked.get_bitboard(), "Rolling back restores the bitboard")
+        self.assertEqual(key, first.get_board_hash(), "Forks do not share hashes")
+
+        config = self.make_turn_0_map().config
+        state = '{"turnInfo":[0,1,-1],"p1Units":[[[13,10,60.0,"1"]],[],[],[],[],[],%s],"p2Units":[[],[],[],[],[],[],[]],"p1Stats":[30.0,29.0,6.0,0],"p2Stats":[30.0,29.0,6.0,0]}'
+        kept, removed = GameState(config, state % '[]').game_map, GameState(config, state % '[[13,10,1,"2"]]').game_map
+        self.assertTrue(removed[13, 10][0].pending_removal, "The removal was not parsed")
+        self.assertNotEqual(kept.get_board_hash(), removed.get_board_hash(), "A parsed removal should change the hash")
+        kept.mark_removal([13, 10])
+        self.assertEqual(kept.get_board_hash(), removed.get_board_hash(), "A parsed removal should hash like mark_removal")
+        if np is not None:
+            self.assertTrue(removed.arrays.pending_removal[13, 10], "A parsed removal is missing from the arrays")
+
+    def test_simulate(self):
+        game = self.make_turn_0_map()
+        game.attempt_spawn("PI", [13, 0])
+        path = game.find_path_to_edge([13, 0])
+        result = simulate(game)
+        self.assertEqual([1, 0], result.breaches, "An unopposed scout breaches")
+        self.assertEqual(len(path), result.frames, "The scout breaches on the frame after it reaches the edge")
+
+        game.game_map.add_unit("DF", path[len(path) // 2 + 2], 1)
+        turret = game.game_map.get_structure(path[len(path) // 2 + 2])
+        result = simulate(game, [[("PI", 13, 0)], []])
+        self.assertEqual([0, 0], result.breaches, "A turret in its way kills a lone scout")
+        self.assertTrue(result.damage_dealt[0] > 0, "The scout shoots the turret before dying")
+        self.assertEqual(turret.max_health, turret.health, "The simulation does not change the game state")
+        self.assertEqual(turret.max_health - result.damage_dealt[0], result.game_map.get_structure([turret.x, turret.y]).health)
+
+        result = simulate(game, [[("PI", 13, 0)] * 20, []])
+        self.assertEqual([turret], result.destroyed[0], "Enough scouts destroy the turret")
+        self.assertTrue(result.breaches[0] > 0)
+        self.assertIsNone(result.game_map.get_structure([turret.x, turret.y]))
+
+    def test_get_target(self):
+        rng = random.Random(5)
+        for trial in range(10):
+            game = self.make_turn_0_map()
+            game_map = game.game_map
+            cells = list(game_map.geometry.cells)
+            for x, y in rng.sample(cells, 120):
+                game_map.add_unit(rng.choice(["FF", "DF", "EF"]), [x, y], rng.randrange(2))
+                if rng.random() < .3:
+                    game_map.hurt_unit([x, y], rng.choice([1, 5]))
+            if trial % 2:
+                for x, y in rng.sample(cells, 20):
+                    if not game.contains_stationary_unit([x, y]):
+                        game_map.add_unit(rng.choice(["PI", "SI"]), [x, y], rng.randrange(2))
+            for x, y in rng.sample(cells, 40):
+                attacker = GameUnit(rng.choice(["PI", "EI", "SI", "DF"]), game.config, rng.randrange(2), None, x, y)
+                # the documented priority, the first unit found wins a full tie
+                expected, expected_key = None, None
+                for location in game_map.get_locations_in_range([x, y], attacker.attackRange):
+                    for unit in game_map[location]:
+                        if unit.player_index == attacker.player_index or (attacker.damage_f == 0 and unit.stationary) or \
+                                (attacker.damage_i == 0 and not unit.stationary):
+                            continue
+                        key = (unit.stationary, game_map.distance_between_locations(location, [x, y]), unit.health,
+                            unit.y if attacker.player_index == 0 else -unit.y, -abs(13.5 - unit.x))
+                        if expected is None or key < expected_key:
+                            expected, expected_key = unit, key
+                self.assertIs(expected, game.get_target(attacker), "Wrong target for {}".format(attacker))
+
+    def test_path_field(self):
+        rng = random.Random(7)
+        for trial in range(20):
+            game = self.make_turn_0_map()
+            cells = list(game.game_map.geometry.cells)
+            for x, y in rng.sample(cells, rng.choice([20, 80, 160])):
+                game.game_map.add_unit("FF", [x, y], 0 if y < 14 else 1)
+            edge = rng.randrange(4)
+            starts = [list(cell) for cell in rng.sample(cells, 30)]
+            field = game.path_field(edge)
+            for start in starts:
+                prev_dir = rng.choice([0, 1, 2])
+                self.assertEqual(ShortestPathFinder().my_navigate_multiple_endpoints(start, game.game_map.get_edge_locations(edge), game, prev_dir),
+                    field.path_from(start, prev_dir), "Field paths differ from ShortestPathFinder")
+            self.assertEqual([game.find_path_to_edge(start, edge) if not game.contains_stationary_unit(start) else None for start in starts],
+                game.find_paths_to_edge(starts, edge), "Batched paths differ from single paths")
+
+    def test_path_field_repair(self):
+        rng = random.Random(13)
+        for trial in range(10):
+            game = self.make_turn_0_map()
+            cells = list(game.game_map.geometry.cells)
+            for x, y in rng.sample(cells, 100):
+                game.game_map.add_unit("FF", [x, y], 0)
+            edge = rng.randrange(4)
+            field = game.path_field(edge)
+            for step in range(30):
+                location = list(rng.choice(cells))
+                if game.contains_stationary_unit(location):
+                    game.game_map.remove_unit(location)
+                    field.unblock(location)
+                else:
+                    game.game_map.add_unit("FF", location, 0)
+                    field.block(location)
+                self.assertEqual(game.path_field(edge).pathlength, field.pathlength, "Repaired distances differ from a new search")
+
+    def test_evaluate_attacks(self):
+        game = self.make_turn_0_map()
+        for x, y in [[24,14], [25,14], [25,15], [2,14], [3,14], [2,15], [13,16]]:
+            game.game_map.add_unit("FF", [x, y], 1)
+        game.game_map.add_unit("EF", [13,3], 0)
+        game.game_map.upgrade_unit([13,3])
+        game.game_map.add_unit("EF", [20,6], 0)
+        board = game.game_map.get_board_hash()
+        candidates = [([13,0], 40, "PI"), ([14,0], 5, "EI"), ([13,0], 40, "PI"), ([14,0], 40, "PI"), ([13,0], 3, "EI")]
+        results = game.evaluate_attacks(candidates)
+        self.assertEqual(board, game.game_map.get_board_hash(), "Attacks of a batch should not change the board")
+        self.assertEqual(len(candidates), len(results), "Every candidate should be scored")
+        for (deploy_location, deploy_number, unit_type), result in zip(candidates, results):
+            game.game_map.start_transaction()
+            self.assertEqual(game.attack_score(deploy_location, deploy_number, unit_type), result, "Batch score differs from attack_score")
+            game.game_map.rollback()
+        cancelled = threading.Event()
+        cancelled.set()
+        self.assertIsNone(game.evaluate_attacks(candidates, cancelled), "A cancelled batch should not be scored")
+        self.assertEqual(board, game.game_map.get_board_hash(), "A cancelled batch should not change the board")
+
+    def test_worker_pool(self):
+        game = self.make_turn_0_map()
+        for x, y in [[24,14], [25,14], [25,15], [2,14], [3,14], [2,15], [13,16]]:
+            game.game_map.add_unit("FF", [x, y], 1)
+        game.game_map.add_unit("EF", [13,3], 0)
+        game.game_map.upgrade_unit([13,3])
+        game.game_map.hurt_unit([25,14], 30)
+        game.game_map.mark_removal([3,14])
+        restored = restore(game.config, snapshot(game))
+        self.assertEqual(game.game_map.get_board_hash(), restored.game_map.get_board_hash(), "Restored board differs from the snapshot's")
+
+        other = game.fork()
+        other.game_map.add_unit("DF", [20,15], 1)
+        candidates = [([13,0], 40, "PI"), ([14,0], 5, "EI"), ([14,0], 40, "PI"), ([13,0], 3, "EI")]
+        batches = [(game, candidates), (other, candidates[1:])]
+        expected = [state.evaluate_attacks(batch) for state, batch in batches]
+        pool = WorkerPool(game.config, 2)
+        try:
+            self.assertEqual(2, pool.processes, "Workers were not started")
+            self.assertEqual(expected, pool.evaluate_attacks(batches), "Workers scored differently than in process")
+            self.assertEqual(2, pool.processes, "A worker failed")
+            cancelled = threading.Event()
+            cancelled.set()
+            self.assertIsNone(pool.evaluate_attacks(batches, cancelled), "A cancelled pool should not return scores")
+            self.assertEqual(expected, pool.evaluate_attacks(batches), "The replies of a cancelled call were left unread")
+        finally:
+            pool.close()
+        self.assertEqual(expected, pool.evaluate_attacks(batches), "A closed pool should score in process")
+        self.assertIsNone(pool.evaluate_attacks(batches, cancelled), "A cancelled pool should not score in process")
+
+        started = []
+        fork = multiprocessing.get_context("fork")
+        class FailingContext:
+            Pipe = staticmethod(fork.Pipe)
+            def Process(self, **kwargs):
+                if started:
+                    raise OSError("no more processes")
+                worker = fork.Process(**kwargs)
+                started.append(worker)
+                return worker
+        with mock.patch("gamelib.workers.multiprocessing.get_context", return_value=FailingContext()):
+            pool = WorkerPool(game.config, 2)
+        self.assertEqual(0, pool.processes, "A pool that could not start every worker should score in process")
+        started[0].join(5)
+        self.assertFalse(started[0].is_alive(), "The worker that did start was left running")
+        self.assertEqual(expected, pool.evaluate_attacks(batches), "A pool without workers should score in process")
+
+        def stall(connection, config):
+            connection.recv()
+            time.sleep(60)
+        with mock.patch("gamelib.workers._serve", stall):
+            pool = WorkerPool(game.config, 1, timeout=0.5)
+        try:
+            self.assertEqual(1, pool.processes, "The stalling worker was not started")
+            self.assertEqual(expected, pool.evaluate_attacks(batches), "A stalled worker's share should be scored in process")
+            self.assertEqual(0, pool.processes, "The stalled worker was kept")
+            self.assertFalse(multiprocessing.active_children(), "The stalled worker was left running")
+        finally:
+            pool.close()
@@ -0,0 +1,193 @@
+"""
+Keeps a board up to date through the action phase from frame events, so the next turn's GameState is a small delta.
+"""
+
+from .game_state import GameState
+from .unit import GameUnit
+from .util import GameMessage, parse_message
+
+
+class BoardTracker:
+    """Follows the board through the action phase using only the events of each frame.
+
+    Every frame carries the full unit lists, but applying its spawn, move, shield, damage and death
+    events to a live board is much cheaper than parsing them. Only those event lists are decoded,
+    and only when they are not empty. At the start of the next turn the tracked
+    board already matches the engine's, so next_state only has to compare it with the turn message
+    and rebuild the few cells that differ instead of parsing the whole state again.
+
+    Usage: call next_state with every turn message in place of GameState(config, message),
+    and update with every action frame.
+
+    Attributes :
+        * config (JSON): Contains information about the game
+        * state (GameState): The live board, None until the first turn. Do not modify it, fork it instead.
+        * corrections (int): The number of cells the last turn message had to correct
+
+    """
+    def __init__(self, config):
+        """Creates a tracker with no board yet
+
+        Args:
+            config (JSON): Contains information about the game
+
+        """
+        self.config = config
+        self.state = None
+        self.corrections = 0
+        self.__mobile = {}
+        self.__removals = {}
+
+    def update(self, frame):
+        """Applies the events of an action frame to the live board
+
+        Args:
+            frame: The ActionFrame, in the order they were received
+
+        """
+        if self.state is None:
+            return
+        game_map = self.state.game_map
+        rules = self.state.rules
+        unit_types = rules.unit_types
+        for location, unit_type, unit_id, player in (frame.spawns if frame.has_events("spawn") else ()):
+            unit_type = unit_types[unit_type]
+            if unit_type == rules.UPGRADE:
+                structure = game_map.get_structure(location)
+                if structure is not None and not structure.upgraded:
+                    # the upgraded structure takes the id of the upgrade, and gains health along with max health
+                    structure = game_map.take_unit(location, structure.unit_id)
+                    health = structure.health - structure.max_health
+                    structure.upgrade()
+                    structure.health = health + structure.max_health
+                    structure.unit_id = unit_id
+                    game_map.place_unit(structure)
+            elif unit_type == rules.REMOVE:
+                structure = game_map.get_structure(location)
+                if structure is not None:
+                    game_map.mark_removal(location)
+                    self.__removals[tuple(location)] = rules.turns_to_remove[structure.unit_type]
+            else:
+                x, y = location
+                unit = GameUnit(unit_type, self.config, player - 1, None, x, y, unit_id)
+                if unit.stationary:
+                    game_map.remove_unit(location)
+                else:
+                    self.__mobile[unit_id] = unit
+                game_map.place_unit(unit)
+        for start, end, _, unit_id, _ in (frame.moves if frame.has_events("move") else ()):
+            unit = game_map.take_unit(start, unit_id)
+            if unit is not None:
+                unit.x, unit.y = end
+                game_map.place_unit(unit)
+        for _, target, amount, _, _, receiver_id, _ in (frame.shields if frame.has_events("shield") else ()):
+            self.__change_health(target, receiver_id, amount)
+        for location, damage, _, unit_id, _ in (frame.damages if frame.has_events("damage") else ()):
+            self.__change_health(location, unit_id, -damage)
+        for location, _, unit_id, _, _ in (frame.deaths if frame.has_events("death") else ()):
+            game_map.take_unit(location, unit_id)
+            self.__mobile.pop(unit_id, None)
+
+    def __change_health(self, location, unit_id, amount):
+        game_map = self.state.game_map
+        unit = game_map.take_unit(location, unit_id)
+        if unit is not None:
+            unit.health += amount
+            game_map.place_unit(unit)
+
+    def next_state(self, message):
+        """Builds the GameState of a new turn from the tracked board
+
+        Args:
+            message: The turn message, as a json string, GameMessage or decoded dict
+
+        Returns:
+            A GameState equal to GameState(config, message), except that the structures of unchanged cells
+            are listed in the order they were tracked rather than the order the message lists them
+
+        """
+        if not isinstance(message, GameMessage):
+            message = parse_message(message)
+        section = message.section if isinstance(message, GameMessage) else message.__getitem__
+        if self.state is None:
+            state = GameState(self.config, message)
+            self.corrections = len(state.game_map.get_structures(0)) + len(state.game_map.get_structures(1))
+        else:
+            state = self.state
+            for location, turns_left in self.__removals.items():
+                if turns_left <= 1:
+                    state.game_map.remove_unit(location)
+            for unit in self.__mobile.values():
+                state.game_map.take_unit([unit.x, unit.y], unit.unit_id)
+            self.corrections = self.__apply_units(state, section("p1Units"), 0) + self.__apply_units(state, section("p2Units"), 1)
+            state.serialized_string = message
+            state.turn_number = int(section("turnInfo")[1])
+            state.my_health, p1_SP, p1_MP, state.my_time = map(float, section("p1Stats")[:4])
+            state.enemy_health, p2_SP, p2_MP, state.enemy_time = map(float, section("p2Stats")[:4])
+            state._player_resources = [
+                {'SP': p1_SP, 'MP': p1_MP},
+                {'SP': p2_SP, 'MP': p2_MP}]
+            state._build_stack = []
+            state._deploy_stack = []
+            state.suppress_warnings(False)
+
+        remove_index = state.rules.UNIT_TYPE_TO_INDEX[state.rules.REMOVE]
+        self.__mobile = {}
+        self.__removals = {}
+        for units in (section("p1Units"), section("p2Units")):
+            # the third field of a removal is the number of turns until the structure is removed
+            for x, y, turns_left, _ in units[remove_index]:
+                self.__removals[x, y] = turns_left
+        self.state = state.fork()
+        return state
+
+    def __apply_units(self, state, units, player_index):
+        """Makes the tracked units of a player match a message's unit lists, rebuilding the cells that differ.
+
+        Returns:
+            The number of cells rebuilt
+        """
+        game_map = state.game_map
+        rules = state.rules
+        unit_types = rules.unit_types
+        remove_index = rules.UNIT_TYPE_TO_INDEX[rules.REMOVE]
+        upgrade_index = rules.UNIT_TYPE_TO_INDEX[rules.UPGRADE]
+        removals = {(x, y) for x, y, _, _ in units[remove_index]}
+        upgrades = {(x, y) for x, y, _, _ in units[upgrade_index]}
+
+        expected = {}
+        mobile = []
+        for index, entries in enumerate(units):
+            if index == remove_index or index == upgrade_index:
+                continue
+            unit_type = unit_types[index]
+            if not rules.is_stationary(unit_type):
+                mobile.extend((unit_type, entry) for entry in entries)
+                continue
+            for entry in entries:
+                expected[entry[0], entry[1]] = (unit_type, entry)
+
+        changed = []
+        for unit in game_map.get_structures(player_index):
+            key = (unit.x, unit.y)
+            wanted = expected.pop(key, None)
+            if wanted is None:
+                game_map.remove_unit(key)
+                changed.append(key)
+                continue
+            unit_type, entry = wanted
+            if (unit.unit_type != unit_type or unit.health != float(entry[2]) or unit.unit_id != entry[3]
+                    or unit.upgraded != (key in upgrades) or unit.pending_removal != (key in removals)):
+                expected[key] = wanted
+        for key, (unit_type, entry) in expected.items():
+            game_map.remove_unit(key)
+            game_map.place_unit(GameUnit(unit_type, self.config, player_index, float(entry[2]), key[0], key[1], entry[3]))
+            if key in upgrades:
+                game_map.upgrade_unit(key)
+            if key in removals:
+                game_map.mark_removal(key)
+            changed.append(key)
+        for unit_type, entry in mobile:
+            x, y = int(entry[0]), int(entry[1])
+            game_map.place_unit(GameUnit(unit_type, self.config, player_index, float(entry[2]), x, y, entry[3]))
+        return len(changed)
@@ -1,3 +1,7 @@
+import copy
+from operator import attrgetter
+
+
 def is_stationary(unit_type, structure_types):
     """
         Args:
@@ -9,9 +13,115 @@ def is_stationary(unit_type, structure_types):
     return unit_type in structure_types
 
 
+class UnitSpec:
+    """The stats shared by every unit of one type and upgrade level. Do not modify.
+
+    Specs are compiled once per config by get_unit_specs, and every GameUnit points to one instead of copying its stats.
+    Setting a stat on a GameUnit gives that unit a copy of its spec with the new value, see GameUnit.
+
+    Attributes :
+        * unit_type (string): The type of unit
+        * config (JSON): Contains information about the game
+        * upgraded (bool): If these are the stats of an upgraded unit
+        * stationary (bool): Whether or not this unit is a structure
+        * speed, damage_f, damage_i, attackRange, shieldRange, max_health, shieldPerUnit: See GameUnit
+        * cost (tuple): The resource costs of this unit, first is SP second is MP
+        * shieldBonusPerY (float): The extra shield given per row of the board between this unit and its owner's edge
+        * breach_damage (float): The damage this mobile unit deals to the enemy's health when it reaches their edge
+        * self_destruct_f, self_destruct_i (float): The damage this mobile unit deals to enemy structures and mobile units when it self destructs
+        * selfDestructRange (float): The range of the self destruct damage
+        * selfDestructStepsRequired (int): The number of steps this unit has to take before self destructing deals any damage
+        * upgrade_spec (UnitSpec): The spec a unit of this type gets when upgraded, itself if already upgraded
+
+    """
+    __slots__ = ("unit_type", "config", "upgraded", "stationary", "speed", "damage_f", "damage_i", "attackRange",
+        "shieldRange", "max_health", "shieldPerUnit", "cost", "shieldBonusPerY", "breach_damage", "self_destruct_f",
+        "self_destruct_i", "selfDestructRange", "selfDestructStepsRequired", "upgrade_spec")
+
+    def __init__(self, unit_type, config, type_config, base=None):
+        """Reads the stats of a unit type from its entry in config["unitInformation"]
+
+        Args:
+            unit_type: The type of unit
+            config: Contains information about the game
+            type_config: The config entry for this unit type, or its "upgrade" entry if base is given
+            base: The UnitSpec of the non upgraded unit, if this is an upgraded spec
+
+        """
+        self.unit_type = unit_type
+        self.config = config
+        self.upgraded = base is not None
+        self.upgrade_spec = self
+        if base is None:
+            self.stationary = type_config["unitCategory"] == 0
+            self.speed = type_config.get("speed", 0)
+            self.damage_f = type_config.get("attackDamageTower", 0)
+            self.damage_i = type_config.get("attackDamageWalker", 0)
+            self.attackRange = type_config.get("attackRange", 0)
+            self.shieldRange = type_config.get("shieldRange", 0)
+            self.max_health = type_config.get("startHealth", 0)
+            self.shieldPerUnit = type_config.get("shieldPerUnit", 0)
+            self.cost = (type_config.get("cost1", 0), type_config.get("cost2", 0))
+            self.shieldBonusPerY = type_config.get("shieldBonusPerY", 0)
+            self.breach_damage = type_config.get("playerBreachDamage", 0)
+            self.self_destruct_f = type_config.get("selfDestructDamageTower", 0)
+            self.self_destruct_i = type_config.get("selfDestructDamageWalker", 0)
+            self.selfDestructRange = type_config.get("selfDestructRange", 0)
+            self.selfDestructStepsRequired = type_config.get("selfDestructStepsRequired", 0)
+        else:
+            self.stationary = base.stationary
+            self.speed = type_config.get("speed", base.speed)
+            self.damage_f = type_config.get("attackDamageTower", base.damage_f)
+            self.damage_i = type_config.get("attackDamageWalker", base.damage_i)
+            self.attackRange = type_config.get("attackRange", base.attackRange)
+            self.shieldRange = type_config.get("shieldRange", base.shieldRange)
+            self.max_health = type_config.get("startHealth", base.max_health)
+            self.shieldPerUnit = type_config.get("shieldPerUnit", base.shieldPerUnit)
+            self.cost = (type_config.get("cost1", 0) + base.cost[0], type_config.get("cost2", 0) + base.cost[1])
+            self.shieldBonusPerY = type_config.get("shieldBonusPerY", base.shieldBonusPerY)
+            self.breach_damage = type_config.get("playerBreachDamage", base.breach_damage)
+            self.self_destruct_f = type_config.get("selfDestructDamageTower", base.self_destruct_f)
+            self.self_destruct_i = type_config.get("selfDestructDamageWalker", base.self_destruct_i)
+            self.selfDestructRange = type_config.get("selfDestructRange", base.selfDestructRange)
+            self.selfDestructStepsRequired = type_config.get("selfDestructStepsRequired", base.selfDestructStepsRequired)
+
+
+_unit_specs = {}
+
+def get_unit_specs(config):
+    """Gets the UnitSpecs of a config, compiling them the first time the config is seen
+
+    Args:
+        config: Contains information about the game
+
+    Returns:
+        A dict mapping unit type shorthands to the non upgraded UnitSpec of that type
+
+    """
+    cached = _unit_specs.get(id(config))
+    if cached is not None and cached[0] is config:
+        return cached[1]
+    specs = {}
+    for type_config in config["unitInformation"]:
+        if "unitCategory" not in type_config:
+            continue
+        unit_type = type_config["shorthand"]
+        spec = UnitSpec(unit_type, config, type_config)
+        spec.upgrade_spec = UnitSpec(unit_type, config, type_config.get("upgrade", {}), spec)
+        specs[unit_type] = spec
+    _unit_specs[id(config)] = (config, specs)
+    return specs
+
+
 class GameUnit:
     """Holds information about a Unit. 
 
+    The stats of the unit come from its UnitSpec, only the state of this particular unit is stored on it.
+    Stats can still be set on a unit: the unit then gets its own copy of the spec, and the other units of its type keep theirs.
+    Upgrading the unit replaces the stats the upgrade changes, the ones set on the unit are kept otherwise, and adds
+    the upgrade cost to its cost. The cost is the unit's own list, made the first time it is read, so it can be edited in place.
+    Other attributes can be added to a unit as usual.
+
     Attributes :
         * unit_type (string): This unit's type
         * config (JSON): Contains information about the game
@@ -30,49 +140,87 @@ class GameUnit:
         * shieldPerUnit (float): how much shield is given per unit
         * pending_removal (boolean): If this unit is marked for removal by its owner
         * upgraded (boolean): If this unit is upgraded
+        * spec (UnitSpec): The shared stats of this unit
+        * unit_id (str): The id the engine gave this unit, None for units that were not parsed from the game state
 
     """
-    def __init__(self, unit_type, config, player_index=None, health=None, x=-1, y=-1):
+    __slots__ = ("spec", "player_index", "health", "x", "y", "pending_removal", "unit_id", "__overrides", "__cost", "__dict__")
+
+    def __init__(self, unit_type, config, player_index=None, health=None, x=-1, y=-1, unit_id=None):
         """ Initialize unit variables using args passed
 
         """
-        self.unit_type = unit_type
-        self.config = config
+        self.spec = get_unit_specs(config)[unit_type]
         self.player_index = player_index
         self.pending_removal = False
-        self.upgraded = False
         self.x = x
         self.y = y
-        self.__serialize_type()
-        self.health = self.max_health if not health else health
-
-    def __serialize_type(self):
-        from .game_state import STRUCTURE_TYPES, UNIT_TYPE_TO_INDEX, SUPPORT
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]]
-        self.stationary = type_config["unitCategory"] == 0
-        self.speed = type_config.get("speed", 0)
-        self.damage_f = type_config.get("attackDamageTower", 0)
-        self.damage_i = type_config.get("attackDamageWalker", 0)
-        self.attackRange = type_config.get("attackRange", 0)
-        self.shieldRange = type_config.get("shieldRange", 0)
-        self.max_health = type_config.get("startHealth", 0)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", 0)
-        self.cost = [type_config.get("cost1", 0), type_config.get("cost2", 0)]
+        self.health = self.spec.max_health if not health else health
+        self.unit_id = unit_id
+        self.__overrides = None
+        self.__cost = None
 
+    def __copy__(self):
+        copied = GameUnit.__new__(GameUnit)
+        copied.spec = self.spec
+        copied.player_index = self.player_index
+        copied.health = self.health
+        copied.x = self.x
+        copied.y = self.y
+        copied.pending_removal = self.pending_removal
+        copied.unit_id = self.unit_id
+        copied.__overrides = self.__overrides
+        copied.__cost = None if self.__cost is None else list(self.__cost)
+        if self.__dict__:
+            copied.__dict__.update(self.__dict__)
+        return copied
 
     def upgrade(self):
-        from .game_state import UNIT_TYPE_TO_INDEX
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]].get("upgrade", {})
-        self.speed = type_config.get("speed", self.speed)
-        self.damage_f = type_config.get("attackDamageTower", self.damage_f)
-        self.damage_i = type_config.get("attackDamageWalker", self.damage_i)
-        self.attackRange = type_config.get("attackRange", self.attackRange)
-        self.shieldRange = type_config.get("shieldRange", self.shieldRange)
-        self.max_health = type_config.get("startHealth", self.max_health)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", self.shieldPerUnit)
-        self.cost = [type_config.get("cost1", 0) + self.cost[0], type_config.get("cost2", 0) + self.cost[1]]
-        self.upgraded = True
+        if self.spec.upgraded:
+            return
+        upgraded = self.spec.upgrade_spec
+        base = get_unit_specs(upgraded.config)[upgraded.unit_type]
+        if self.__cost is not None:
+            self.__cost = [cost + upgraded.cost[index] - base.cost[index] for index, cost in enumerate(self.__cost)]
+        if self.__overrides:
+            # as with the config's upgrade entry, only the stats the upgrade changes replace the ones set on the unit
+            self.__overrides = {name: value for name, value in self.__overrides.items() if getattr(upgraded, name) == getattr(base, name)}
+            upgraded = copy.copy(upgraded)
+            for name, value in self.__overrides.items():
+                setattr(upgraded, name, value)
+        self.spec = upgraded
+
+    def __set_stat(name):
+        def set_stat(self, value):
+            # overrides are replaced, never changed, so copies of the unit can share them
+            self.__overrides = dict(self.__overrides or {}, **{name: value})
+            spec = copy.copy(self.spec)
+            setattr(spec, name, value)
+            self.spec = spec
+        return property(attrgetter("spec." + name), set_stat)
+
+    unit_type = __set_stat("unit_type")
+    config = __set_stat("config")
+    upgraded = __set_stat("upgraded")
+    stationary = __set_stat("stationary")
+    speed = __set_stat("speed")
+    damage_f = __set_stat("damage_f")
+    damage_i = __set_stat("damage_i")
+    attackRange = __set_stat("attackRange")
+    shieldRange = __set_stat("shieldRange")
+    max_health = __set_stat("max_health")
+    shieldPerUnit = __set_stat("shieldPerUnit")
+    del __set_stat
+
+    @property
+    def cost(self):
+        if self.__cost is None:
+            self.__cost = list(self.spec.cost)
+        return self.__cost
 
+    @cost.setter
+    def cost(self, value):
+        self.__cost = value
 
     def __toString(self):
         owner = "Friendly" if self.player_index == 0 else "Enemy"
@@ -85,3 +233,86 @@ class GameUnit:
     def __repr__(self):
         return self.__toString()
 
+
+
+class UnitStack:
+    """A group of identical mobile units moving together, stored as one object.
+
+    Units in a stack share a location and a target, so a whole stack can be simulated for the cost of a single unit.
+    Only the front unit is ever damaged, the ones behind it are at full health.
+
+    Attributes :
+        * spec (UnitSpec): The shared stats of the units
+        * count (int): The number of units left in the stack
+        * health (float): The current health of the front unit
+        * max_health (float): The health of a fresh unit in the stack, including its shield
+        * shield (float): The shield each unit received on top of its starting health
+        * player_index (integer): The player that controls the stack. 0 for you, 1 for your opponent.
+        * x (integer): The x coordinate of the stack
+        * y (integer): The y coordinate of the stack
+
+    The stack has the same stat attributes as a GameUnit, so it can be passed to get_target.
+
+    """
+    __slots__ = ("spec", "count", "health", "max_health", "shield", "player_index", "x", "y")
+
+    def __init__(self, unit_type, config, count, player_index=0, x=-1, y=-1):
+        """ Initialize a stack of count fresh units
+
+        """
+        self.spec = get_unit_specs(config)[unit_type]
+        self.count = count
+        self.health = self.spec.max_health
+        self.max_health = self.spec.max_health
+        self.shield = 0
+        self.player_index = player_index
+        self.x = x
+        self.y = y
+
+    def add_shield(self, amount):
+        """Shields every unit in the stack
+
+        Args:
+            amount: The health added to each unit
+
+        """
+        self.shield += amount
+        self.max_health += amount
+        self.health += amount
+
+    def take_hit(self, damage):
+        """Damages the front unit. If it dies, the next unit moves to the front and the overflow damage is lost.
+        Does not check that there are units left, stop calling it once count reaches 0.
+
+        Args:
+            damage: The damage dealt to the front unit
+
+        Returns:
+            True if the front unit died
+
+        """
+        if damage >= self.health:
+            self.health = self.max_health
+            self.count -= 1
+            return True
+        self.health -= damage
+        return False
+
+    unit_type = property(lambda self: self.spec.unit_type)
+    config = property(lambda self: self.spec.config)
+    upgraded = property(lambda self: self.spec.upgraded)
+    stationary = property(lambda self: self.spec.stationary)
+    speed = property(lambda self: self.spec.speed)
+    damage_f = property(lambda self: self.spec.damage_f)
+    damage_i = property(lambda self: self.spec.damage_i)
+    attackRange = property(lambda self: self.spec.attackRange)
+    shieldRange = property(lambda self: self.spec.shieldRange)
+    shieldPerUnit = property(lambda self: self.spec.shieldPerUnit)
+    cost = property(lambda self: list(self.spec.cost))
+
+    def __str__(self):
+        owner = "Friendly" if self.player_index == 0 else "Enemy"
+        return "{} {} x{}, front health: {} location: {}".format(owner, self.unit_type, self.count, self.health, [self.x, self.y])
+
+    def __repr__(self):
+        return self.__str__()
@@ -1,8 +1,80 @@
 import sys
+import json
 
 
 BANNER_TEXT = "---------------- Starting Your Algo --------------------"
 
+_decoder = json.JSONDecoder()
+
+
+class GameMessage(str):
+    """A line received from the game engine.
+
+    It is still the raw string, so strategies that parse it themselves keep working,
+    but the decoded json is available as message.data and is only ever parsed once.
+    message.section(key) decodes a single value instead of the whole message.
+
+    """
+    __slots__ = ("_data", "_sections")
+
+    @property
+    def data(self):
+        """The decoded json object of this message, parsed on first access
+        """
+        try:
+            return self._data
+        except AttributeError:
+            self._data = json.loads(self)
+            return self._data
+
+    def section(self, key, start=0):
+        """Decodes the value of a single key without parsing the rest of the message
+
+        Falls back to the fully parsed message if the key cannot be found in the text.
+        The engine never uses the same key twice in one message, so the first match is the right one.
+
+        Args:
+            key: The json key to look up, at any nesting level
+            start: Where to start looking in the text, to skip over other sections
+
+        Returns:
+            The decoded value, cached for later calls
+
+        """
+        try:
+            sections = self._sections
+        except AttributeError:
+            sections = self._sections = {}
+        if key in sections:
+            return sections[key]
+        index = self.find('"' + key + '":', start)
+        if index < 0:
+            value = self.data[key]
+        else:
+            index += len(key) + 3
+            while self[index] in " \t\n\r":
+                index += 1
+            value = _decoder.raw_decode(self, index)[0]
+        sections[key] = value
+        return value
+
+
+def parse_message(message):
+    """Gets the decoded json of an engine message without parsing it again if it already was
+
+    Args:
+        message: A GameMessage, a raw json string or an already decoded dict
+
+    Returns:
+        The decoded json object
+
+    """
+    if isinstance(message, GameMessage):
+        return message.data
+    if isinstance(message, str):
+        return json.loads(message)
+    return message
+
 
 def get_command():
     """Gets input from stdin
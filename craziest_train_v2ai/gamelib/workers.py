@@ -0,0 +1,262 @@
+"""
+Scores attack candidates on several cores, with worker processes forked once at the start of the game.
+"""
+
+import os
+import time
+import threading
+import multiprocessing
+
+from .game_state import GameState
+from .unit import GameUnit
+from .util import debug_write
+
+
+def snapshot(game_state):
+    """Describes the board of a GameState compactly, to send it to another process
+
+    Args:
+        game_state: The GameState to describe
+
+    Returns:
+        A tuple of plain values, see restore
+
+    """
+    units = []
+    game_map = game_state.game_map
+    for x, y in game_map.geometry.cells:
+        for unit in game_map[x, y]:
+            units.append((unit.unit_type, unit.player_index, unit.health, x, y, unit.unit_id, unit.upgraded, unit.pending_removal))
+    stats = [(health, resources['SP'], resources['MP'], time) for health, resources, time in (
+        (game_state.my_health, game_state._player_resources[0], game_state.my_time),
+        (game_state.enemy_health, game_state._player_resources[1], game_state.enemy_time))]
+    return (game_state.turn_number, stats, tuple(units))
+
+
+def restore(config, board):
+    """Builds a GameState from a snapshot
+
+    Args:
+        config (JSON): Contains information about the game
+        board: A tuple made by snapshot
+
+    Returns:
+        A GameState with the same turn, resources and units as the one the snapshot was made of
+
+    """
+    turn_number, stats, units = board
+    empty = [[] for _ in config["unitInformation"]]
+    state = GameState(config, {"turnInfo": [0, turn_number, 0, 0], "p1Stats": list(stats[0]), "p2Stats": list(stats[1]),
+        "p1Units": empty, "p2Units": empty})
+    game_map = state.game_map
+    for unit_type, player_index, health, x, y, unit_id, upgraded, pending_removal in units:
+        game_map.place_unit(GameUnit(unit_type, config, player_index, health, x, y, unit_id))
+        if upgraded:
+            game_map.upgrade_unit([x, y])
+        if pending_removal:
+            game_map.mark_removal([x, y])
+    return state
+
+
+def _score(states, jobs, cancelled=None):
+    """Scores jobs of (state key, candidate), one evaluate_attacks call for every run of jobs on the same board
+
+    Returns None if cancelled is set before every job is scored.
+    """
+    results = []
+    start = 0
+    while start < len(jobs):
+        key = jobs[start][0]
+        end = start
+        while end < len(jobs) and jobs[end][0] == key:
+            end += 1
+        scored = states[key].evaluate_attacks([candidate for _, candidate in jobs[start:end]], cancelled)
+        if scored is None:
+            return None
+        results += scored
+        start = end
+    return results
+
+
+def _serve(connection, config):
+    """The loop of a worker process, it scores the jobs it receives until it receives None
+    """
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        boards, jobs = message
+        try:
+            states = {key: restore(config, board) for key, board in boards.items()}
+            connection.send(_score(states, jobs))
+        except Exception as error:
+            connection.send(error)
+
+
+class WorkerPool:
+    """Worker processes that score the attack candidates of a turn in parallel, see GameState.evaluate_attacks
+
+    The workers are forked once, when the pool is created, so they already hold the config and every table
+    compiled from it. During a turn each worker receives a snapshot of the boards its share of the candidates
+    is scored on, and the calling process scores a share of its own while it waits.
+    When only one core is available, or processes can not be forked, every candidate is scored in process.
+    A pool used by two threads at once scores the second thread's candidates in process too.
+    A worker that has not replied within timeout seconds is stopped, and its share is scored in process.
+
+    Attributes :
+        * processes (int): The number of worker processes running
+        * timeout (float): How long to wait for the workers' scores, counted from when they are sent
+
+    """
+    def __init__(self, config, processes=None, timeout=2.0):
+        """Forks the worker processes
+
+        Args:
+            config (JSON): Contains information about the game
+            processes: The number of worker processes. Defaults to one for every core but the one of the calling process.
+            timeout: How long to wait for the workers' scores, in seconds
+
+        """
+        self.timeout = timeout
+        self.__connections = []
+        self.__workers = []
+        self.__lock = threading.Lock()
+        if processes is None:
+            cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+            processes = cores - 1
+        if processes > 0:
+            try:
+                context = multiprocessing.get_context("fork")
+            except ValueError:
+                debug_write("Processes can not be forked on this platform, attacks are scored in process")
+                processes = 0
+        try:
+            for _ in range(processes):
+                connection, child_connection = context.Pipe()
+                try:
+                    worker = context.Process(target=_serve, args=(child_connection, config), daemon=True)
+                    worker.start()
+                except BaseException:
+                    connection.close()
+                    raise
+                finally:
+                    child_connection.close()
+                self.__connections.append(connection)
+                self.__workers.append(worker)
+        except Exception as error:
+            debug_write("Could not start the worker processes, attacks are scored in process: {}".format(error))
+            self.close()
+
+    @property
+    def processes(self):
+        return len(self.__connections)
+
+    def evaluate_attacks(self, batches, cancelled=None):
+        """Scores the candidates of many boards, splitting them between the workers and the calling process
+
+        Args:
+            batches: A list of (game_state, candidates), with candidates as in GameState.evaluate_attacks
+            cancelled: A threading.Event, the calling process stops scoring once it is set
+
+        Returns:
+            A list with the results of every batch, each the list GameState.evaluate_attacks would return,
+            or None if cancelled
+
+        """
+        jobs = [(index, candidate) for index, (_, candidates) in enumerate(batches) for candidate in candidates]
+        states = {index: game_state for index, (game_state, _) in enumerate(batches)}
+        if not self.__connections or len(jobs) < 2 or not self.__lock.acquire(blocking=False):
+            results = _score(states, jobs, cancelled)
+        else:
+            try:
+                results = self.__evaluate(states, jobs, cancelled)
+            finally:
+                self.__lock.release()
+        if results is None:
+            return None
+
+        split = []
+        start = 0
+        for _, candidates in batches:
+            split.append(results[start:start + len(candidates)])
+            start += len(candidates)
+        return split
+
+    def __evaluate(self, states, jobs, cancelled):
+        # contiguous shares keep the candidates of one board together, so each worker restores few boards
+        shares = len(self.__connections) + 1
+        size, extra = divmod(len(jobs), shares)
+        parts = []
+        start = 0
+        for share in range(shares):
+            end = start + size + (share < extra)
+            parts.append(jobs[start:end])
+            start = end
+
+        sent = []
+        deadline = time.time() + self.timeout
+        for connection, part in zip(list(self.__connections), parts[1:]):
+            if not part:
+                continue
+            boards = {key: snapshot(states[key]) for key in {key for key, _ in part}}
+            try:
+                connection.send((boards, part))
+                sent.append((connection, part))
+            except (OSError, EOFError):
+                self.__drop(connection)
+                sent.append((None, part))
+
+        results = _score(states, parts[0], cancelled)
+        for connection, part in sent:
+            scored = None
+            if connection is not None:
+                try:
+                    if connection.poll(max(0, deadline - time.time())):
+                        scored = connection.recv()
+                    else:
+                        debug_write("A worker did not score its attacks in time")
+                        self.__drop(connection)
+                except (OSError, EOFError):
+                    self.__drop(connection)
+            if results is None:
+                # still collect every reply, so the next turn does not read this one's
+                continue
+            if not isinstance(scored, list):
+                if scored is not None:
+                    debug_write("A worker failed to score its attacks: {}".format(scored))
+                scored = _score(states, part, cancelled)
+                if scored is None:
+                    results = None
+                    continue
+            results += scored
+        return results
+
+    def __drop(self, connection):
+        debug_write("Lost a worker process, its attacks are scored in process")
+        index = self.__connections.index(connection)
+        worker = self.__workers[index]
+        del self.__connections[index]
+        del self.__workers[index]
+        connection.close()
+        if worker.is_alive():
+            worker.terminate()
+            worker.join(1)
+
+    def close(self):
+        """Stops the worker processes, the pool scores every candidate in process afterwards
+        """
+        for connection in self.__connections:
+            try:
+                connection.send(None)
+            except (OSError, EOFError):
+                pass
+            connection.close()
+        for worker in self.__workers:
+            worker.join(1)
+            if worker.is_alive():
+                worker.terminate()
+        self.__connections = []
+        self.__workers = []